@@ -3,18 +3,23 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager
 from config import Config
+from app.roteamento import SessaoRoteada
 
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///app.db'  # Ajuste conforme seu banco
 app.config.from_object(Config)
 
-db = SQLAlchemy(app)
+db = SQLAlchemy(app, session_options={'class_': SessaoRoteada})
 migrate = Migrate(app, db)
 login = LoginManager(app)
 login.login_view = 'login'
 
 # Importar rotas, modelos e erros somente após a inicialização do db
-from app import routes, models, errors
+from app import banco, instrumentacao, routes, api, models, errors, cli, carrinho
+
+# A limpeza das reservas roda só nos processos que atendem requisições: nos workers do gunicorn
+# ela é iniciada no post_worker_init (gunicorn.conf.py); no servidor de desenvolvimento, aqui
+if cli.servidor_de_desenvolvimento():
+    carrinho.iniciar_limpeza_reservas()
 
 @app.shell_context_processor
 def make_shell_context():
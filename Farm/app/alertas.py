@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta, timezone
+import sqlalchemy as sa
+from app import app, db
+from app.models import Alerta, Estoque, Farmacia, Produto, Validade
+from app.demanda import calcular_demandas
+from app.roteamento import usar_primario
+
+
+def calcular_alertas(farmacia_id):
+    """Calcula os alertas de estoque de toda a farmácia com um número fixo de consultas agrupadas."""
+    now = datetime.now() - timedelta(hours=3)
+    data_limite_validade = now + timedelta(days=7)  # 1 semana para vencer
+
+    # Consulta 1: produtos da farmácia com o saldo mantido em Estoque
+    produtos = db.session().execute(
+        sa.select(Produto.id, Produto.nome, Estoque.quantidade)
+        .join(Estoque, Estoque.produto_id == Produto.id)
+        .where(Estoque.farmacia_id == farmacia_id)
+        .order_by(Estoque.id)
+    ).all()
+
+    # Consulta 2: lotes com saldo e pelo menos um dia de validade restante
+    validades_por_produto = {}
+    for produto_id, data_validade, quantidade in db.session().execute(
+        sa.select(Validade.produto_id, Validade.data_validade, Validade.quantidade)
+        .join(Estoque, Estoque.produto_id == Validade.produto_id)
+        .where(Estoque.farmacia_id == farmacia_id)
+        .where(Validade.quantidade > 0)
+        .where(Validade.data_validade >= now + timedelta(days=1))
+        .order_by(Validade.produto_id, Validade.data_validade)
+    ):
+        validades_por_produto.setdefault(produto_id, []).append((data_validade, quantidade))
+
+    # Consulta 3: demanda da última semana, lida do resumo diário
+    data_inicio = (now - timedelta(days=7)).replace(hour=0, minute=0, second=0, microsecond=0)
+    data_fim = now.replace(hour=23, minute=59, second=59, microsecond=999999)
+    demandas = {demanda['produto_id']: demanda for demanda in calcular_demandas(farmacia_id, data_inicio, data_fim, now)}
+
+    alertas = []
+    for produto_id, nome, total_quantidade in produtos:
+        # Estoque zerado
+        if total_quantidade == 0:
+            alertas.append(Alerta(
+                farmacia_id=farmacia_id, produto_id=produto_id, tipo='estoque_zerado',
+                mensagem=f'O produto {nome} está com estoque zerado. Considere reabastecer.'
+            ))
+
+        # Produtos próximos da validade
+        validades = validades_por_produto.get(produto_id, [])
+        for data_validade, quantidade in validades:
+            if data_validade <= data_limite_validade:
+                dias_restantes = (data_validade - now).days
+                alertas.append(Alerta(
+                    farmacia_id=farmacia_id, produto_id=produto_id, tipo='validade_proxima',
+                    mensagem=f'O produto {nome} tem {quantidade} unidades vencendo em {dias_restantes} dias (em {data_validade.strftime("%d-%m-%Y")}).'
+                ))
+
+        # Estoque excedente (estoque atual > quantidade máxima), com a demanda da última semana
+        demanda = demandas.get(produto_id)
+        if demanda and demanda['estoque_excedente']:
+            estoque_atual = demanda['estoque_atual']
+            quantidade_maxima = demanda['quantidade_maxima']
+            alertas.append(Alerta(
+                farmacia_id=farmacia_id, produto_id=produto_id, tipo='estoque_excedente',
+                mensagem=f'O produto {nome} tem estoque excedente ({estoque_atual} unidades) acima da quantidade máxima ({quantidade_maxima} unidades). Considere reduzir o estoque para evitar perdas por validade.'
+            ))
+    return alertas
+
+
+def atualizar_alertas(farmacia, forcar=False):
+    """Regrava a lista persistida de alertas da farmácia se ela estiver vencida ou invalidada.
+
+    Os alertas são calculados antes de qualquer escrita, para o cálculo não segurar o lock de
+    escrita do SQLite e travar o caixa. Depois, numa transação curta, o UPDATE condicional em
+    alertas_atualizados_em reivindica a troca: se outro worker já trocou a lista, o cálculo é
+    descartado e fica a lista gravada.
+    """
+    agora = datetime.now(timezone.utc)
+    validade = timedelta(seconds=app.config['ALERTAS_VALIDADE_SEGUNDOS'])
+    atualizado_em = farmacia.alertas_atualizados_em
+    if not forcar and atualizado_em is not None and agora.replace(tzinfo=None) - atualizado_em.replace(tzinfo=None) < validade:
+        return
+    alertas = calcular_alertas(farmacia.id)
+    reivindicado = db.session.execute(
+        sa.update(Farmacia)
+        .where(Farmacia.id == farmacia.id)
+        .where(
+            Farmacia.alertas_atualizados_em.is_(None) if atualizado_em is None
+            else Farmacia.alertas_atualizados_em == atualizado_em
+        )
+        .values(alertas_atualizados_em=agora)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not reivindicado:
+        db.session.rollback()
+        return
+    db.session.execute(sa.delete(Alerta).where(Alerta.farmacia_id == farmacia.id))
+    db.session.add_all(alertas)
+    db.session.commit()
+    # A lista recém-gravada é lida do primário, que já a enxerga mesmo com a réplica atrasada
+    usar_primario()
+
+
+def invalidar_alertas(farmacia_id):
+    # Força o recálculo na próxima visita ao painel; entra na mesma transação da escrita
+    db.session.execute(
+        sa.update(Farmacia)
+        .where(Farmacia.id == farmacia_id)
+        .values(alertas_atualizados_em=None)
+    )
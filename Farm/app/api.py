@@ -0,0 +1,64 @@
+from flask import jsonify, request
+from flask_login import current_user, login_required
+from app import app
+from app.busca import resolver_codigos
+from app.importacao_vendas import importar_vendas
+from app.recebimento import receber_nota
+
+
+@app.route('/api/scan/<codigo_barras>')
+@login_required
+def scan(codigo_barras):
+    if not current_user.farmacia:
+        return jsonify(erro='Usuário sem farmácia associada.'), 403
+    produto = resolver_codigos(current_user.farmacia_id, [codigo_barras]).get(codigo_barras)
+    if produto is None:
+        return jsonify(erro='Produto não encontrado.', codigo_barras=codigo_barras), 404
+    return jsonify(produto)
+
+
+@app.route('/api/scan', methods=['POST'])
+@login_required
+def scan_lote():
+    if not current_user.farmacia:
+        return jsonify(erro='Usuário sem farmácia associada.'), 403
+    dados = request.get_json(silent=True) or {}
+    codigos = dados.get('codigos')
+    if not isinstance(codigos, list) or not all(isinstance(codigo, str) for codigo in codigos):
+        return jsonify(erro='Envie {"codigos": [...]} com os códigos de barras.'), 400
+    if len(codigos) > app.config['SCAN_LOTE_MAXIMO']:
+        return jsonify(erro=f'No máximo {app.config["SCAN_LOTE_MAXIMO"]} códigos por requisição.'), 400
+    encontrados = resolver_codigos(current_user.farmacia_id, codigos)
+    return jsonify(
+        produtos=[encontrados[codigo] for codigo in codigos if codigo in encontrados],
+        nao_encontrados=[codigo for codigo in codigos if codigo not in encontrados]
+    )
+
+
+@app.route('/api/vendas/lote', methods=['POST'])
+@login_required
+def vendas_lote():
+    if not current_user.farmacia:
+        return jsonify(erro='Usuário sem farmácia associada.'), 403
+    dados = request.get_json(silent=True) or {}
+    vendas = dados.get('vendas')
+    if not isinstance(vendas, list):
+        return jsonify(erro='Envie {"vendas": [...]} com chave, timestamp e itens de cada venda.'), 400
+    if len(vendas) > app.config['VENDAS_LOTE_MAXIMO']:
+        return jsonify(erro=f'No máximo {app.config["VENDAS_LOTE_MAXIMO"]} vendas por requisição.'), 400
+    return jsonify(resultados=importar_vendas(current_user.farmacia_id, vendas))
+
+
+@app.route('/api/recebimento', methods=['POST'])
+@login_required
+def recebimento_nota():
+    if not current_user.farmacia:
+        return jsonify(erro='Usuário sem farmácia associada.'), 403
+    dados = request.get_json(silent=True) or {}
+    itens = dados.get('itens')
+    if not isinstance(itens, list) or not itens:
+        return jsonify(erro='Envie {"itens": [...]} com produto_id ou codigo_barras, quantidade e data_validade.'), 400
+    if len(itens) > app.config['RECEBIMENTO_ITENS_MAXIMO']:
+        return jsonify(erro=f'No máximo {app.config["RECEBIMENTO_ITENS_MAXIMO"]} itens por nota.'), 400
+    aplicada, resultados = receber_nota(current_user.farmacia_id, itens)
+    return jsonify(aplicada=aplicada, resultados=resultados), 200 if aplicada else 422
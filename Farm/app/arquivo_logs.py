@@ -0,0 +1,382 @@
+import csv
+import gzip
+import hashlib
+import heapq
+import os
+import time
+import uuid
+from collections import Counter, deque
+from datetime import datetime, timezone
+from itertools import islice
+import sqlalchemy as sa
+from dateutil.relativedelta import relativedelta
+from app import app, db
+from app.models import ArquivoLog, ArquivoLogContagem, Produto, ProdutoLog
+from app.busca import filtro_produtos
+
+# Arquivo frio do histórico: logs antigos saem de produto_log para um .csv.gz por farmácia e mês,
+# registrado em ArquivoLog. Cada arquivo é imutável (um novo nome a cada rearquivamento), então o
+# manifesto sempre aponta para um arquivo completo, e as leituras juntam o arquivo e a tabela viva.
+# Os arquivos são lidos em fluxo, linha a linha; as contagens por produto e operação ficam em
+# ArquivoLogContagem.
+
+COLUNAS = ['id', 'timestamp', 'produto_id', 'farmacia_id', 'operacao', 'quantidade']
+
+class LogArquivado:
+    # Mesmos atributos de ProdutoLog usados pelo histórico e pela exportação
+    __slots__ = (*COLUNAS, 'produto')
+
+    def __init__(self, id, timestamp, produto_id, farmacia_id, operacao, quantidade):
+        self.id = id
+        self.timestamp = timestamp
+        self.produto_id = produto_id
+        self.farmacia_id = farmacia_id
+        self.operacao = operacao
+        self.quantidade = quantidade
+        self.produto = None
+
+
+class FiltroLogs:
+    """Filtros do histórico de uma farmácia, aplicados no SQL (tabela viva) e nas linhas arquivadas.
+
+    `de` e `ate` são timestamps UTC: de inclusivo, ate exclusivo.
+    """
+
+    def __init__(self, farmacia_id, operacao=None, produto=None, de=None, ate=None):
+        self.farmacia_id = farmacia_id
+        self.operacao = operacao
+        self.produto = produto
+        self.de = de
+        self.ate = ate
+        self._produto_ids = None
+
+    def _produtos(self):
+        return (
+            sa.select(Produto.id)
+            .where(Produto.farmacia_id == self.farmacia_id)
+            .where(*filtro_produtos(nome=self.produto))
+        )
+
+    def condicoes(self):
+        condicoes = [ProdutoLog.farmacia_id == self.farmacia_id]
+        if self.operacao:
+            condicoes.append(ProdutoLog.operacao == self.operacao)
+        if self.produto:
+            condicoes.append(ProdutoLog.produto_id.in_(self._produtos()))
+        if self.de:
+            condicoes.append(ProdutoLog.timestamp >= self.de)
+        if self.ate:
+            condicoes.append(ProdutoLog.timestamp < self.ate)
+        return condicoes
+
+    def aceita(self, log):
+        if self.operacao and log.operacao != self.operacao:
+            return False
+        if self.de and log.timestamp < self.de:
+            return False
+        if self.ate and log.timestamp >= self.ate:
+            return False
+        if self.produto:
+            if self._produto_ids is None:
+                self._produto_ids = set(db.session().scalars(self._produtos()))
+            return log.produto_id in self._produto_ids
+        return True
+
+
+def _caminho_absoluto(caminho):
+    return os.path.join(app.config['ARQUIVO_LOGS_PASTA'], caminho)
+
+
+def _linhas_arquivo(caminho):
+    # Linhas do mês em ordem (timestamp, id), lidas uma a uma do .csv.gz sem carregar o mês em memória
+    with gzip.open(_caminho_absoluto(caminho), 'rt', encoding='utf-8', newline='') as arquivo:
+        leitor = csv.reader(arquivo)
+        next(leitor)
+        for id, timestamp, produto_id, farmacia_id, operacao, quantidade in leitor:
+            yield LogArquivado(
+                int(id), datetime.fromisoformat(timestamp), int(produto_id),
+                int(farmacia_id) if farmacia_id else None, operacao, int(quantidade)
+            )
+
+
+def _entradas(filtro):
+    consulta = sa.select(ArquivoLog).where(ArquivoLog.farmacia_id == filtro.farmacia_id)
+    if filtro.de:
+        consulta = consulta.where(ArquivoLog.ultimo >= filtro.de)
+    if filtro.ate:
+        consulta = consulta.where(ArquivoLog.primeiro < filtro.ate)
+    return db.session().scalars(consulta.order_by(ArquivoLog.mes)).all()
+
+
+def logs_arquivados(filtro, depois_de=None, decrescente=False, limite=None, fronteira=None):
+    """Logs arquivados que passam no filtro, em ordem (timestamp, id), a partir do cursor `depois_de`.
+
+    `fronteira` é a chave (timestamp, id) em que a página já está completa: os logs a partir
+    dela não são lidos. Em ordem decrescente o arquivo (gzip) só é lido do início: de cada mês
+    ficam em memória no máximo `limite` linhas, as últimas antes do cursor.
+    """
+    entradas = _entradas(filtro)
+    if decrescente:
+        entradas.reverse()
+    cursor = tuple(depois_de) if depois_de is not None else None
+    fronteira = tuple(fronteira) if fronteira is not None else None
+    for entrada in entradas:
+        # Meses inteiros do outro lado do cursor nem são abertos
+        if cursor is not None and (entrada.ultimo < cursor[0] if not decrescente else entrada.primeiro > cursor[0]):
+            continue
+        if fronteira is not None and (entrada.primeiro > fronteira[0] if not decrescente else entrada.ultimo < fronteira[0]):
+            # Este mês e os seguintes ficam depois da fronteira
+            break
+        if not decrescente:
+            for log in _linhas_arquivo(entrada.caminho):
+                if filtro.ate and log.timestamp >= filtro.ate:
+                    break
+                if fronteira is not None and (log.timestamp, log.id) >= fronteira:
+                    break
+                if cursor is not None and (log.timestamp, log.id) <= cursor:
+                    continue
+                if filtro.aceita(log):
+                    yield log
+            continue
+        ultimos = deque(maxlen=limite)
+        for log in _linhas_arquivo(entrada.caminho):
+            if cursor is not None and (log.timestamp, log.id) >= cursor:
+                break
+            if fronteira is not None and (log.timestamp, log.id) <= fronteira:
+                continue
+            if filtro.aceita(log):
+                ultimos.append(log)
+        yield from reversed(ultimos)
+
+
+def carregar_produtos(logs):
+    # Preenche log.produto (None se o produto foi excluído) com uma consulta só
+    ids = {log.produto_id for log in logs}
+    produtos = {produto.id: produto for produto in db.session().scalars(sa.select(Produto).where(Produto.id.in_(ids)))} if ids else {}
+    for log in logs:
+        log.produto = produtos.get(log.produto_id)
+    return logs
+
+
+def complemento_paginacao(filtro):
+    """Fonte extra para paginar_keyset: as linhas arquivadas da página, já com os produtos."""
+    def complemento(cursor, decrescente, limite, fronteira=None):
+        return carregar_produtos(list(islice(logs_arquivados(filtro, cursor, decrescente, limite, fronteira), limite)))
+    return complemento
+
+
+def contar_arquivados(filtro):
+    """Logs arquivados que passam no filtro.
+
+    Meses inteiros dentro do período são somados de ArquivoLogContagem; só os meses cortados
+    pelas datas do filtro (no máximo os dois das pontas) são lidos do arquivo.
+    """
+    inteiras = []
+    total = 0
+    for entrada in _entradas(filtro):
+        if (filtro.de and entrada.primeiro < filtro.de) or (filtro.ate and entrada.ultimo >= filtro.ate):
+            total += sum(1 for log in _linhas_arquivo(entrada.caminho) if filtro.aceita(log))
+        else:
+            inteiras.append(entrada.id)
+    if not inteiras:
+        return total
+    consulta = (
+        sa.select(sa.func.coalesce(sa.func.sum(ArquivoLogContagem.linhas), 0))
+        .where(ArquivoLogContagem.arquivo_log_id.in_(inteiras))
+    )
+    if filtro.operacao:
+        consulta = consulta.where(ArquivoLogContagem.operacao == filtro.operacao)
+    if filtro.produto:
+        consulta = consulta.where(ArquivoLogContagem.produto_id.in_(filtro._produtos()))
+    return total + db.session().scalar(consulta)
+
+
+def _gravar_arquivo(farmacia_id, mes, logs):
+    """Grava os logs (em ordem) num arquivo novo, sem juntar o mês em memória.
+
+    Devolve (caminho, sha256, primeiro, ultimo, contagens por (produto_id, operacao)).
+    """
+    # Nome novo a cada gravação: o arquivo antigo continua válido até o commit do manifesto
+    pasta = str(farmacia_id) if farmacia_id is not None else 'sem_farmacia'
+    caminho = os.path.join(pasta, f'{mes:%Y-%m}.{uuid.uuid4().hex[:8]}.csv.gz')
+    os.makedirs(os.path.dirname(_caminho_absoluto(caminho)), exist_ok=True)
+    contagens = Counter()
+    primeiro = ultimo = None
+    with open(_caminho_absoluto(caminho), 'wb') as bruto:
+        with gzip.open(bruto, 'wt', encoding='utf-8', newline='') as arquivo:
+            escritor = csv.writer(arquivo)
+            escritor.writerow(COLUNAS)
+            for log in logs:
+                escritor.writerow((
+                    log.id, log.timestamp.isoformat(), log.produto_id,
+                    log.farmacia_id if log.farmacia_id is not None else '', log.operacao, log.quantidade
+                ))
+                contagens[log.produto_id, log.operacao] += 1
+                primeiro = primeiro or log.timestamp
+                ultimo = log.timestamp
+        bruto.flush()
+        os.fsync(bruto.fileno())
+    return caminho, _sha256(caminho), primeiro, ultimo, contagens
+
+
+def _sha256(caminho):
+    sha256 = hashlib.sha256()
+    with open(_caminho_absoluto(caminho), 'rb') as arquivo:
+        while bloco := arquivo.read(1 << 20):
+            sha256.update(bloco)
+    return sha256.hexdigest()
+
+
+def _gravar_contagens(entrada, contagens):
+    db.session.execute(sa.delete(ArquivoLogContagem).where(ArquivoLogContagem.arquivo_log_id == entrada.id))
+    if contagens:
+        db.session.execute(sa.insert(ArquivoLogContagem), [
+            {'arquivo_log_id': entrada.id, 'produto_id': produto_id, 'operacao': operacao, 'linhas': linhas}
+            for (produto_id, operacao), linhas in contagens.items()
+        ])
+
+
+def limite_arquivamento(meses=None, hoje=None):
+    """Primeiro dia (UTC) do mês mais antigo que fica na tabela viva."""
+    hoje = hoje or datetime.now(timezone.utc).date()
+    meses = app.config['ARQUIVO_LOGS_MESES'] if meses is None else meses
+    return datetime.combine(hoje.replace(day=1) - relativedelta(months=meses), datetime.min.time())
+
+
+def arquivar_logs(limite):
+    """Move para o arquivo frio os logs anteriores a `limite`, um mês de uma farmácia por transação.
+
+    Devolve as entradas do manifesto gravadas. Logs retroativos de um mês já arquivado são
+    juntados ao arquivo existente.
+    """
+    _contar_sem_contagem()
+    primeiros = db.session.execute(
+        sa.select(ProdutoLog.farmacia_id, sa.func.min(ProdutoLog.timestamp))
+        .where(ProdutoLog.timestamp < limite)
+        .group_by(ProdutoLog.farmacia_id)
+    ).all()
+    gravadas = []
+    for farmacia_id, primeiro in sorted(primeiros, key=lambda linha: (linha[0] is None, linha[0] or 0)):
+        mes = primeiro.date().replace(day=1)
+        while mes < limite.date():
+            entrada = _arquivar_mes(farmacia_id, mes, limite)
+            if entrada is not None:
+                gravadas.append(entrada)
+            mes += relativedelta(months=1)
+    limpar_arquivos()
+    return gravadas
+
+
+def _contar_sem_contagem():
+    # Meses arquivados antes de ArquivoLogContagem existir são contados uma vez, lendo o arquivo
+    entradas = db.session.scalars(
+        sa.select(ArquivoLog).where(~sa.exists().where(ArquivoLogContagem.arquivo_log_id == ArquivoLog.id))
+    ).all()
+    for entrada in entradas:
+        _gravar_contagens(entrada, Counter((log.produto_id, log.operacao) for log in _linhas_arquivo(entrada.caminho)))
+        db.session.commit()
+
+
+def _sem_repetidos(logs):
+    # Na intercalação, um log que já estava no arquivo e na tabela aparece duas vezes seguidas
+    anterior = None
+    for log in logs:
+        if (log.timestamp, log.id) != anterior:
+            yield log
+        anterior = (log.timestamp, log.id)
+
+
+def _arquivar_mes(farmacia_id, mes, limite):
+    inicio = datetime.combine(mes, datetime.min.time())
+    fim = min(inicio + relativedelta(months=1), limite)
+    do_mes = sa.and_(
+        ProdutoLog.farmacia_id.is_(None) if farmacia_id is None else ProdutoLog.farmacia_id == farmacia_id,
+        ProdutoLog.timestamp >= inicio,
+        ProdutoLog.timestamp < fim
+    )
+    if not db.session.scalar(sa.select(sa.exists().where(do_mes))):
+        return None
+    entrada = db.session.scalar(sa.select(ArquivoLog).where(
+        ArquivoLog.farmacia_id.is_(None) if farmacia_id is None else ArquivoLog.farmacia_id == farmacia_id,
+        ArquivoLog.mes == mes
+    ))
+    anterior = entrada.caminho if entrada else None
+    # Os logs do mês vêm do banco em lotes, direto para o arquivo
+    novos = (
+        LogArquivado(*linha) for linha in db.session.execute(
+            sa.select(*(getattr(ProdutoLog, coluna) for coluna in COLUNAS))
+            .where(do_mes)
+            .order_by(ProdutoLog.timestamp, ProdutoLog.id)
+            .execution_options(yield_per=app.config['ARQUIVO_LOGS_LOTE'])
+        )
+    )
+    logs = novos
+    if anterior:
+        # O arquivo existente é lido em fluxo e intercalado com os logs retroativos do mês
+        logs = _sem_repetidos(heapq.merge(_linhas_arquivo(anterior), novos, key=lambda log: (log.timestamp, log.id)))
+    caminho, sha256, primeiro, ultimo, contagens = _gravar_arquivo(farmacia_id, mes, logs)
+    try:
+        if entrada is None:
+            entrada = ArquivoLog(farmacia_id=farmacia_id, mes=mes)
+            db.session.add(entrada)
+        entrada.caminho = caminho
+        entrada.linhas = sum(contagens.values())
+        entrada.primeiro = primeiro
+        entrada.ultimo = ultimo
+        entrada.sha256 = sha256
+        entrada.arquivado_em = datetime.now(timezone.utc)
+        db.session.flush()
+        _gravar_contagens(entrada, contagens)
+        db.session.execute(sa.delete(ProdutoLog).where(do_mes).execution_options(synchronize_session=False))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        os.remove(_caminho_absoluto(caminho))
+        raise
+    if anterior:
+        # Quem já leu o manifesto ainda pode abrir o arquivo antigo: ele só sai no limpar_arquivos,
+        # depois da carência contada a partir de agora
+        os.utime(_caminho_absoluto(anterior))
+    return entrada
+
+
+def limpar_arquivos(carencia=None):
+    """Apaga os arquivos que o manifesto não referencia mais, parados há mais de `carencia` segundos.
+
+    Cobre os arquivos substituídos num rearquivamento e os de um arquivamento interrompido.
+    Devolve os caminhos apagados.
+    """
+    carencia = app.config['ARQUIVO_LOGS_CARENCIA_SEGUNDOS'] if carencia is None else carencia
+    pasta = app.config['ARQUIVO_LOGS_PASTA']
+    if not os.path.isdir(pasta):
+        return []
+    referenciados = set(db.session.scalars(sa.select(ArquivoLog.caminho)))
+    limite = time.time() - carencia
+    apagados = []
+    for raiz, _, nomes in os.walk(pasta):
+        for nome in nomes:
+            absoluto = os.path.join(raiz, nome)
+            caminho = os.path.relpath(absoluto, pasta)
+            if not nome.endswith('.csv.gz') or caminho in referenciados:
+                continue
+            try:
+                if os.path.getmtime(absoluto) < limite:
+                    os.remove(absoluto)
+                    apagados.append(caminho)
+            except FileNotFoundError:
+                pass
+    return apagados
+
+
+def verificar_arquivos():
+    """Entradas do manifesto cujo arquivo sumiu ou não confere com o sha256 gravado."""
+    problemas = []
+    for entrada in db.session.scalars(sa.select(ArquivoLog).order_by(ArquivoLog.farmacia_id, ArquivoLog.mes)):
+        try:
+            sha256 = _sha256(entrada.caminho)
+        except OSError as erro:
+            problemas.append((entrada, str(erro)))
+            continue
+        if sha256 != entrada.sha256:
+            problemas.append((entrada, 'sha256 diferente do manifesto'))
+    return problemas
@@ -0,0 +1,82 @@
+import sqlite3
+import sqlalchemy as sa
+from app import app, db
+
+# Perfil do banco em produção: PRAGMAs do SQLite em cada conexão nova e uma verificação,
+# na subida de cada worker do gunicorn (gunicorn.conf.py), das configurações que o banco
+# realmente aplicou.
+
+
+@sa.event.listens_for(sa.engine.Engine, 'connect')
+def _configurar_sqlite(conexao_dbapi, registro):
+    if not isinstance(conexao_dbapi, sqlite3.Connection):
+        return
+    cursor = conexao_dbapi.cursor()
+    # WAL: leitores não bloqueiam o escritor; busy_timeout espera o lock em vez de falhar na hora
+    cursor.execute(f"PRAGMA busy_timeout = {int(app.config['SQLITE_BUSY_TIMEOUT_MS'])}")
+    try:
+        cursor.execute(f"PRAGMA journal_mode = {app.config['SQLITE_JOURNAL_MODE']}")
+    except sqlite3.OperationalError:
+        # Conexões mode=ro (app.roteamento) não mudam o modo; usam o que o primário gravou no arquivo
+        pass
+    cursor.execute(f"PRAGMA synchronous = {app.config['SQLITE_SYNCHRONOUS']}")
+    # Valor negativo: tamanho em KiB, e não em páginas
+    cursor.execute(f"PRAGMA cache_size = -{int(app.config['SQLITE_CACHE_KB'])}")
+    cursor.execute(f"PRAGMA mmap_size = {int(app.config['SQLITE_MMAP_BYTES'])}")
+    cursor.close()
+
+
+def configuracao_efetiva():
+    """Configurações em vigor no banco e no pool de conexões do engine."""
+    engine = db.engine
+    pool = engine.pool
+    configuracao = {
+        'banco': engine.dialect.name,
+        'url': engine.url.render_as_string(hide_password=True),
+        'pool': type(pool).__name__,
+        'pool_size': pool.size() if hasattr(pool, 'size') else None,
+        'max_overflow': getattr(pool, '_max_overflow', None),
+    }
+    with engine.connect() as conexao:
+        if engine.dialect.name == 'sqlite':
+            sincronizacao = {0: 'OFF', 1: 'NORMAL', 2: 'FULL', 3: 'EXTRA'}
+            configuracao.update(
+                journal_mode=conexao.exec_driver_sql('PRAGMA journal_mode').scalar(),
+                synchronous=sincronizacao.get(conexao.exec_driver_sql('PRAGMA synchronous').scalar()),
+                cache_size=conexao.exec_driver_sql('PRAGMA cache_size').scalar(),
+                mmap_size=conexao.exec_driver_sql('PRAGMA mmap_size').scalar(),
+                busy_timeout=conexao.exec_driver_sql('PRAGMA busy_timeout').scalar(),
+                versao=sqlite3.sqlite_version,
+            )
+        elif engine.dialect.name == 'postgresql':
+            for parametro in ('server_version', 'max_connections', 'synchronous_commit', 'statement_timeout'):
+                configuracao[parametro] = conexao.exec_driver_sql(f'SHOW {parametro}').scalar()
+    return configuracao
+
+
+def verificar_banco():
+    """Registra no log a configuração efetiva e avisa quando ela difere da pedida."""
+    configuracao = configuracao_efetiva()
+    app.logger.info('Banco: %s', ', '.join(f'{chave}={valor}' for chave, valor in configuracao.items()))
+    avisos = []
+    if configuracao['banco'] == 'sqlite' and db.engine.url.database not in (None, '', ':memory:'):
+        # Em alguns sistemas de arquivos (rede, somente leitura) o WAL não é aceito
+        if str(configuracao['journal_mode']).upper() != app.config['SQLITE_JOURNAL_MODE'].upper():
+            avisos.append(f"journal_mode {configuracao['journal_mode']} (pedido: {app.config['SQLITE_JOURNAL_MODE']})")
+        if configuracao['busy_timeout'] != app.config['SQLITE_BUSY_TIMEOUT_MS']:
+            avisos.append(f"busy_timeout {configuracao['busy_timeout']} (pedido: {app.config['SQLITE_BUSY_TIMEOUT_MS']})")
+    if configuracao['banco'] == 'postgresql' and configuracao['pool_size']:
+        # Cada worker tem o próprio pool
+        por_worker = configuracao['pool_size'] + (configuracao['max_overflow'] or 0)
+        if por_worker >= int(configuracao['max_connections']):
+            avisos.append(f"pool_size + max_overflow ({por_worker}) >= max_connections ({configuracao['max_connections']})")
+    for aviso in avisos:
+        app.logger.warning('Configuração do banco diferente da esperada: %s', aviso)
+    return configuracao, avisos
+
+
+def verificar_banco_na_inicializacao():
+    """Verificação da subida do worker: falha se o banco não responde ou difere do perfil pedido."""
+    _, avisos = verificar_banco()
+    if avisos:
+        raise RuntimeError('Configuração do banco diferente da esperada: ' + '; '.join(avisos))
@@ -0,0 +1,287 @@
+import json
+import re
+import time
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import sqlalchemy as sa
+from app import app, db
+from app.models import Estoque, Farmacia, Produto, ProdutoLog, User, Validade
+from app.importacao_catalogo import importar_catalogo
+from app.saldos import sincronizar_saldos
+from app.resumo import FUSO_HORAS, reconstruir_resumo
+from app.demanda import PERIODOS_DIAS
+from app import instrumentacao
+
+# Benchmark da aplicação em escala: um gerador de dados sintéticos (reproduzível pela semente)
+# e um executor que mede, com o cliente de teste do Flask, a latência e o número de comandos
+# SQL das telas principais. Os resultados vão para JSON e podem ser comparados entre execuções.
+
+PRINCIPIOS = [
+    'Paracetamol', 'Dipirona', 'Ibuprofeno', 'Amoxicilina', 'Losartana', 'Omeprazol', 'Metformina', 'Sinvastatina',
+    'Azitromicina', 'Loratadina', 'Captopril', 'Atenolol', 'Clonazepam', 'Prednisona', 'Cetirizina', 'Diclofenaco'
+]
+FORMAS = ['Comprimido', 'Cápsula', 'Xarope', 'Gotas', 'Pomada', 'Injetável']
+GENEROS = ['Analgésico', 'Antibiótico', 'Anti-hipertensivo', 'Antialérgico', 'Anti-inflamatório', 'Antidiabético']
+GRUPOS = ['Referência', 'Genérico', 'Similar', 'Higiene', 'Dermocosmético']
+TIPOS = ['Generico', 'Original', 'Outros']
+SENHA = 'bench'
+LOTE_INSERCAO = 50000
+
+_SERVER_TIMING = re.compile(r'db;dur=([\d.]+);desc="(\d+) comandos"')
+_CSRF = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+
+
+def _catalogo(rng, farmacia, produtos):
+    # Linhas no formato de app.importacao_catalogo; o código de barras identifica farmácia e produto
+    linhas = []
+    for i in range(produtos):
+        principio = PRINCIPIOS[rng.integers(len(PRINCIPIOS))]
+        preco_compra = rng.uniform(2, 80)
+        linhas.append((i + 2, {
+            'nome': f'{principio} {int(rng.choice([50, 100, 250, 500, 750]))}mg {FORMAS[rng.integers(len(FORMAS))]} {i}',
+            'genero': GENEROS[rng.integers(len(GENEROS))],
+            'tipo': TIPOS[rng.integers(len(TIPOS))],
+            'grupo': GRUPOS[rng.integers(len(GRUPOS))],
+            'fabricante_id': str(rng.integers(1, 41)),
+            'quantidade_embalagem': str(int(rng.choice([10, 20, 30, 60]))),
+            'fornecedor_id': str(rng.integers(1, 16)),
+            'preco_compra': f'{preco_compra:.2f}',
+            'preco_venda': f'{preco_compra * rng.uniform(1.2, 2.0):.2f}',
+            'codigo_barras': f'789{farmacia:04d}{i:06d}',
+        }))
+    return linhas
+
+
+def _historico(rng, produto_ids, dias, hoje):
+    """Vendas e reposições de `dias` dias em arrays (produto_id, timestamp UTC, operação, quantidade)."""
+    n = len(produto_ids)
+    # Demanda diária por produto: poucos produtos vendem muito, a maioria vende pouco (intermitente)
+    taxa = np.minimum(rng.lognormal(mean=-1.0, sigma=1.2, size=n), 20)
+    vendas = rng.poisson(taxa[:, None], size=(n, dias))
+    produto, dia = np.nonzero(vendas)
+    repeticoes = vendas[produto, dia]
+    produto, dia = np.repeat(produto, repeticoes), np.repeat(dia, repeticoes)
+    quantidade_venda = 1 + (rng.random(len(produto)) < 0.2)
+
+    # Reposição a cada ciclo de 15 a 45 dias, do tamanho da demanda do ciclo com folga
+    ciclo = rng.integers(15, 46, size=n)
+    repos_produto, repos_dia = np.nonzero(np.arange(dias)[None, :] % ciclo[:, None] == 0)
+    quantidade_repos = np.rint(taxa[repos_produto] * ciclo[repos_produto] * 1.2).astype(int) + 1
+
+    produto = np.concatenate([produto, repos_produto])
+    dia = np.concatenate([dia, repos_dia])
+    removido = np.concatenate([np.ones(len(quantidade_venda), dtype=bool), np.zeros(len(repos_produto), dtype=bool)])
+    quantidade = np.concatenate([quantidade_venda, quantidade_repos])
+    # Horário local entre 8h e 20h, gravado em UTC como ProdutoLog.timestamp
+    segundos = dia * 86400 + rng.integers(8 * 3600, 20 * 3600, size=len(dia)) + FUSO_HORAS * 3600
+    ordem = np.argsort(segundos, kind='stable')
+    inicio = datetime.combine(hoje - timedelta(days=dias), datetime.min.time())
+    return (
+        np.asarray(produto_ids)[produto[ordem]], segundos[ordem], removido[ordem], quantidade[ordem], inicio, taxa
+    )
+
+
+def gerar_dados(farmacias, produtos, anos, semente=42, progresso=None):
+    """Cria `farmacias` farmácias com `produtos` produtos e `anos` anos de histórico cada.
+
+    Cada farmácia ganha o usuário bench<n> (senha 'bench'); o primeiro é administrador.
+    Devolve a contagem de linhas criadas por tabela.
+    """
+    if db.session.scalar(sa.select(Farmacia.id).limit(1)) is not None:
+        raise ValueError('O banco já tem farmácias; gere os dados do benchmark em um banco vazio.')
+    rng = np.random.default_rng(semente)
+    hoje = datetime.now(timezone.utc).date()
+    dias = int(anos * 365)
+    senha = User()
+    senha.set_password(SENHA)
+    contagem = {'farmacias': 0, 'produtos': 0, 'validades': 0, 'logs': 0}
+    for n in range(1, farmacias + 1):
+        farmacia = Farmacia(nome=f'Farmácia Benchmark {n}', endereco=f'Rua do Benchmark, {n}', cep='00000-000', cnpj=f'{n:014d}')
+        db.session.add(farmacia)
+        db.session.flush()
+        db.session.add(User(
+            username=f'bench{n}', email=f'bench{n}@exemplo.com', farmacia_id=farmacia.id,
+            password_hash=senha.password_hash, administrador=n == 1
+        ))
+        db.session.commit()
+        farmacia_id = farmacia.id
+
+        importar_catalogo(farmacia_id, _catalogo(rng, n, produtos))
+        produto_ids = db.session.scalars(
+            sa.select(Produto.id).where(Produto.farmacia_id == farmacia_id).order_by(Produto.codigo_barras)
+        ).all()
+
+        produto, segundos, removido, quantidade, inicio, taxa = _historico(rng, produto_ids, dias, hoje)
+        operacoes = np.where(removido, 'removido', 'adicionado')
+        for inicio_lote in range(0, len(produto), LOTE_INSERCAO):
+            fatia = slice(inicio_lote, inicio_lote + LOTE_INSERCAO)
+            db.session.execute(sa.insert(ProdutoLog.__table__), [
+                {'produto_id': p, 'farmacia_id': farmacia_id, 'timestamp': inicio + timedelta(seconds=s), 'operacao': o, 'quantidade': q}
+                for p, s, o, q in zip(
+                    produto[fatia].tolist(), segundos[fatia].tolist(), operacoes[fatia].tolist(), quantidade[fatia].tolist()
+                )
+            ])
+            db.session.commit()
+
+        # Lotes atuais: de 1 a 3 por produto; cerca de 10% dos produtos zerados e 5% vencendo em breve
+        lotes = []
+        for produto_id, demanda in zip(produto_ids, taxa.tolist()):
+            if rng.random() < 0.1:
+                continue
+            for _ in range(int(rng.integers(1, 4))):
+                dias_validade = int(rng.integers(1, 20)) if rng.random() < 0.05 else int(rng.integers(30, 540))
+                lotes.append({
+                    'produto_id': produto_id,
+                    'data_validade': datetime.combine(hoje + timedelta(days=dias_validade), datetime.min.time()),
+                    'quantidade': int(demanda * rng.uniform(5, 40)) + 1,
+                })
+        db.session.execute(sa.insert(Validade.__table__), lotes)
+        sincronizar_saldos(produto_ids)
+        db.session.commit()
+
+        contagem['farmacias'] += 1
+        contagem['produtos'] += len(produto_ids)
+        contagem['validades'] += len(lotes)
+        contagem['logs'] += len(produto)
+        if progresso:
+            progresso(n, contagem)
+    reconstruir_resumo()
+    db.session.commit()
+    return contagem
+
+
+def percentil(ordenados, p):
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def _estatisticas(medidas):
+    duracoes = sorted(duracao for duracao, _, _, _ in medidas)
+    comandos = [comandos for _, comandos, _, _ in medidas]
+    return {
+        'n': len(medidas),
+        'media_ms': round(sum(duracoes) / len(duracoes) * 1000, 2),
+        **{f'p{p}_ms': round(percentil(duracoes, p) * 1000, 2) for p in (50, 90, 95, 99)},
+        'max_ms': round(duracoes[-1] * 1000, 2),
+        'comandos_medio': round(sum(comandos) / len(comandos), 1),
+        'comandos_max': max(comandos),
+        'banco_medio_ms': round(sum(banco for _, _, banco, _ in medidas) / len(medidas), 2),
+        'erros': sum(1 for *_, erro in medidas if erro),
+    }
+
+
+def _abrir(cliente, metodo, url, dados):
+    if metodo == 'POST' and cliente.csrf_token:
+        dados = dict(dados, csrf_token=cliente.csrf_token)
+    resposta = cliente.open(url, method=metodo, data=dados)
+    resposta.get_data()
+    return resposta
+
+
+def _medir(cliente, requisicoes):
+    # Uma medida pode ter várias requisições (o checkout é adicionar ao carrinho e finalizar)
+    duracao = banco = 0.0
+    comandos = 0
+    erro = False
+    for metodo, url, dados in requisicoes:
+        inicio = time.perf_counter()
+        resposta = _abrir(cliente, metodo, url, dados)
+        duracao += time.perf_counter() - inicio
+        # GET que redireciona (sessão perdida, farmácia ausente) também não mede a tela
+        erro = erro or resposta.status_code >= 400 or (metodo == 'GET' and resposta.status_code != 200)
+        encontrado = _SERVER_TIMING.search(resposta.headers.get('Server-Timing', ''))
+        if encontrado:
+            banco += float(encontrado.group(1))
+            comandos += int(encontrado.group(2))
+    return duracao, comandos, banco, erro
+
+
+def executar_benchmark(repeticoes=20, usuario='bench1', aquecimento=3, semente=42, com_cache=False):
+    """Mede cada cenário `repeticoes` vezes e devolve o resultado (serializável em JSON).
+
+    Os relatórios são calculados na própria requisição (sem tarefas em segundo plano) e,
+    salvo `com_cache`, sem o cache de relatórios: mede-se o pior caso.
+    """
+    rng = np.random.default_rng(semente)
+    originais = {chave: app.config[chave] for chave in ('TAREFAS_WORKERS', 'RELATORIO_CACHE_SEGUNDOS')}
+    app.config['TAREFAS_WORKERS'] = 0
+    if not com_cache:
+        app.config['RELATORIO_CACHE_SEGUNDOS'] = 0
+    instrumentacao.ativar()
+    try:
+        with app.app_context():
+            user = db.session.scalar(sa.select(User).where(User.username == usuario))
+            if user is None or user.farmacia_id is None:
+                raise ValueError(f'Usuário {usuario} não encontrado ou sem farmácia (gere os dados com flask benchmark dados).')
+            farmacia_id = user.farmacia_id
+            com_estoque = db.session.scalars(
+                sa.select(Estoque.produto_id).where(Estoque.farmacia_id == farmacia_id).where(Estoque.quantidade >= 10)
+            ).all()
+            nome = db.session.scalar(sa.select(Produto.nome).where(Produto.farmacia_id == farmacia_id).limit(1))
+            dados = {
+                tabela: db.session.scalar(sa.select(sa.func.count()).select_from(modelo))
+                for tabela, modelo in (('farmacias', Farmacia), ('produtos', Produto), ('validades', Validade), ('logs', ProdutoLog))
+            }
+            banco = db.engine.dialect.name
+        if not com_estoque:
+            raise ValueError('A farmácia do usuário não tem produtos com estoque para o checkout.')
+        busca = nome.split()[0]
+
+        def checkout():
+            produto_id = int(rng.choice(com_estoque))
+            return [
+                ('POST', '/vendas', {'produto_id': produto_id, 'quantidade_carrinho': 1}),
+                ('POST', '/vendas', {'finalizar_compra_action': 1}),
+            ]
+
+        cenarios = {
+            'index': lambda: [('GET', '/index', None)],
+            'stock': lambda: [('GET', '/stock', None)],
+            'stock_busca': lambda: [('GET', f'/stock?nome={busca}', None)],
+            'vendas': lambda: [('GET', '/vendas', None)],
+            'vendas_busca': lambda: [('GET', f'/vendas?nome={busca}', None)],
+            'checkout': checkout,
+            **{
+                f'relatorio_{periodo}': (lambda periodo=periodo: [('GET', f'/relatorio?periodo={periodo}', None)])
+                for periodo in PERIODOS_DIAS
+            },
+        }
+        cliente = app.test_client()
+        # O token CSRF vale para a sessão inteira; vai em todos os POSTs
+        token = _CSRF.search(cliente.get('/login').get_data(as_text=True))
+        cliente.csrf_token = token.group(1) if token else None
+        resposta = _abrir(cliente, 'POST', '/login', {'username': usuario, 'password': SENHA})
+        if resposta.status_code != 302:
+            raise ValueError(f'Falha no login de {usuario}.')
+        resultados = {}
+        for nome_cenario, requisicoes in cenarios.items():
+            for _ in range(aquecimento):
+                _medir(cliente, requisicoes())
+            resultados[nome_cenario] = _estatisticas([_medir(cliente, requisicoes()) for _ in range(repeticoes)])
+    finally:
+        app.config.update(originais)
+    return {
+        'gerado_em': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'banco': banco,
+        'dados': dados,
+        'repeticoes': repeticoes,
+        'com_cache': com_cache,
+        'cenarios': resultados,
+    }
+
+
+def comparar(atual, base, tolerancia=0.2, metricas=('p95_ms', 'comandos_medio')):
+    """Regressões de `atual` em relação a `base`: (cenário, métrica, base, atual) acima da tolerância."""
+    regressoes = []
+    for cenario, medidas in atual['cenarios'].items():
+        anterior = base.get('cenarios', {}).get(cenario)
+        if anterior is None:
+            continue
+        for metrica in metricas:
+            if anterior[metrica] and medidas[metrica] > anterior[metrica] * (1 + tolerancia):
+                regressoes.append((cenario, metrica, anterior[metrica], medidas[metrica]))
+    return regressoes
+
+
+def gravar_resultado(resultado, caminho):
+    with open(caminho, 'w', encoding='utf-8') as arquivo:
+        json.dump(resultado, arquivo, ensure_ascii=False, indent=2)
@@ -0,0 +1,109 @@
+import re
+import sqlalchemy as sa
+from app import db
+from app.models import Produto, Estoque
+
+# Índice de busca textual (SQLite FTS5) sobre os campos pesquisáveis de Produto.
+# O rowid de produto_busca é o id do produto.
+CAMPOS_BUSCA = ('nome', 'genero', 'grupo', 'codigo_barras')
+
+_disponivel = set()
+
+
+def fts_disponivel():
+    # Só existe no SQLite e depois da migração que cria a tabela virtual. Só a resposta positiva
+    # fica guardada: depois do `flask db upgrade` a busca passa a usar o índice sem reiniciar o app
+    engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return False
+    if engine.url not in _disponivel and sa.inspect(engine).has_table('produto_busca'):
+        _disponivel.add(engine.url)
+    return engine.url in _disponivel
+
+
+def _tokens(termo):
+    return re.findall(r'\w+', termo)
+
+
+def filtro_produtos(**termos):
+    """Condições sobre Produto para os termos informados, por campo.
+
+    Com FTS5 cada palavra vira uma busca por prefixo, sem distinção de acentos;
+    sem ele (ou se o termo não tiver palavras) volta ao ILIKE '%termo%'.
+    """
+    condicoes = []
+    expressoes = []
+    for campo, termo in termos.items():
+        if not termo:
+            continue
+        tokens = _tokens(termo) if fts_disponivel() else []
+        if tokens:
+            expressoes.extend(f'{campo} : "{token}"*' for token in tokens)
+        else:
+            condicoes.append(getattr(Produto, campo).ilike(f'%{termo}%'))
+    if expressoes:
+        condicoes.append(Produto.id.in_(
+            sa.select(sa.column('rowid'))
+            .select_from(sa.table('produto_busca'))
+            .where(sa.text('produto_busca MATCH :expressao').bindparams(expressao=' AND '.join(expressoes)))
+        ))
+    return condicoes
+
+
+def indexar_produtos(produtos):
+    # Regrava as entradas do índice na transação corrente
+    produtos = list(produtos)
+    if not produtos or not fts_disponivel():
+        return
+    remover_produtos(produto.id for produto in produtos)
+    db.session.execute(
+        sa.text(
+            'INSERT INTO produto_busca (rowid, nome, genero, grupo, codigo_barras) '
+            'VALUES (:id, :nome, :genero, :grupo, :codigo_barras)'
+        ),
+        [
+            {'id': produto.id, **{campo: getattr(produto, campo) for campo in CAMPOS_BUSCA}}
+            for produto in produtos
+        ]
+    )
+
+
+def remover_produtos(produto_ids):
+    produto_ids = [int(produto_id) for produto_id in produto_ids]
+    if not produto_ids or not fts_disponivel():
+        return
+    db.session.execute(
+        sa.text('DELETE FROM produto_busca WHERE rowid IN :ids').bindparams(sa.bindparam('ids', expanding=True)),
+        {'ids': produto_ids}
+    )
+
+
+def reindexar():
+    if not fts_disponivel():
+        return False
+    db.session.execute(sa.text('DELETE FROM produto_busca'))
+    db.session.execute(sa.text(
+        'INSERT INTO produto_busca (rowid, nome, genero, grupo, codigo_barras) '
+        'SELECT id, nome, genero, grupo, codigo_barras FROM produto'
+    ))
+    return True
+
+
+def resolver_codigos(farmacia_id, codigos):
+    # Uma única consulta IN sobre o índice único (farmacia_id, codigo_barras)
+    linhas = db.session().execute(
+        sa.select(Produto.codigo_barras, Produto.id, Produto.nome, Produto.preco_venda, Estoque.quantidade)
+        .join(Estoque, sa.and_(Estoque.produto_id == Produto.id, Estoque.farmacia_id == Produto.farmacia_id))
+        .where(Produto.farmacia_id == farmacia_id)
+        .where(Produto.codigo_barras.in_(set(codigos)))
+    ).all()
+    return {
+        codigo_barras: {
+            'codigo_barras': codigo_barras,
+            'produto_id': produto_id,
+            'nome': nome,
+            'preco_venda': preco_venda,
+            'quantidade': quantidade
+        }
+        for codigo_barras, produto_id, nome, preco_venda, quantidade in linhas
+    }
@@ -0,0 +1,75 @@
+import json
+import sqlite3
+import time
+from contextlib import closing
+import sqlalchemy as sa
+from app import app, db
+from app.models import Farmacia
+
+# Cache de relatórios em um arquivo SQLite à parte, visível para todos os workers.
+# Cada entrada guarda a versão dos dados da farmácia com que foi calculada; qualquer
+# escrita no estoque chama registrar_alteracao_dados, que muda Farmacia.versao_dados, e a
+# entrada deixa de valer.
+
+
+def registrar_alteracao_dados(farmacia_id):
+    # Muda a versão dos dados da farmácia (chave do cache); entra na mesma transação da escrita
+    db.session.execute(
+        sa.update(Farmacia)
+        .where(Farmacia.id == farmacia_id)
+        .values(versao_dados=Farmacia.versao_dados + 1)
+    )
+
+
+def _conectar():
+    conexao = sqlite3.connect(app.config['RELATORIO_CACHE_ARQUIVO'], timeout=5)
+    conexao.execute('PRAGMA journal_mode=WAL')
+    conexao.execute(
+        'CREATE TABLE IF NOT EXISTS relatorio_cache ('
+        'chave TEXT PRIMARY KEY, versao INTEGER NOT NULL, valor TEXT NOT NULL, criado_em REAL NOT NULL)'
+    )
+    return conexao
+
+
+def _chave(farmacia_id, nome, parametros):
+    return json.dumps([farmacia_id, nome, parametros], sort_keys=True, default=str)
+
+
+def obter(farmacia_id, versao, nome, parametros):
+    """Valor gravado para a farmácia e os parâmetros, se ainda for da versão atual; senão None."""
+    try:
+        with closing(_conectar()) as conexao:
+            linha = conexao.execute(
+                'SELECT valor FROM relatorio_cache WHERE chave = ? AND versao = ? AND criado_em > ?',
+                (_chave(farmacia_id, nome, parametros), versao, time.time() - app.config['RELATORIO_CACHE_SEGUNDOS'])
+            ).fetchone()
+    except sqlite3.Error:
+        app.logger.exception('Falha ao ler o cache de relatórios')
+        return None
+    return json.loads(linha[0]) if linha else None
+
+
+def gravar(farmacia_id, versao, nome, parametros, valor):
+    try:
+        with closing(_conectar()) as conexao, conexao:
+            conexao.execute(
+                'INSERT OR REPLACE INTO relatorio_cache (chave, versao, valor, criado_em) VALUES (?, ?, ?, ?)',
+                (_chave(farmacia_id, nome, parametros), versao, json.dumps(valor), time.time())
+            )
+            # Descarta entradas vencidas para o arquivo não crescer sem limite
+            conexao.execute(
+                'DELETE FROM relatorio_cache WHERE criado_em <= ?',
+                (time.time() - app.config['RELATORIO_CACHE_SEGUNDOS'],)
+            )
+    except sqlite3.Error:
+        app.logger.exception('Falha ao gravar o cache de relatórios')
+
+
+def em_cache(farmacia, nome, parametros, calcular):
+    """Devolve o relatório `nome` do cache ou o calcula com `calcular()` e o grava."""
+    versao = farmacia.versao_dados
+    valor = obter(farmacia.id, versao, nome, parametros)
+    if valor is None:
+        valor = calcular()
+        gravar(farmacia.id, versao, nome, parametros, valor)
+    return valor
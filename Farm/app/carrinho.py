@@ -0,0 +1,180 @@
+import threading
+from datetime import datetime, timedelta, timezone
+from flask import session
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+from app import app, db
+from app.models import Estoque, ItemCarrinho
+
+
+def _agora():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def caixa_atual():
+    # Identificação do caixa (terminal) guardada na sessão; padrão 'principal'
+    return session.get('caixa', 'principal')
+
+
+def _ativos():
+    return ItemCarrinho.expira_em > _agora()
+
+
+def itens_carrinho(user_id, caixa):
+    return dict(db.session().execute(
+        sa.select(ItemCarrinho.produto_id, ItemCarrinho.quantidade)
+        .where(ItemCarrinho.user_id == user_id, ItemCarrinho.caixa == caixa)
+        .where(_ativos())
+        .order_by(ItemCarrinho.id)
+    ).all())
+
+
+def reservado_por_outros(produto_ids, user_id, caixa):
+    """Quantidade reservada em carrinhos ativos de outros caixas, por produto."""
+    produto_ids = list(produto_ids)
+    if not produto_ids:
+        return {}
+    return dict(db.session().execute(
+        sa.select(ItemCarrinho.produto_id, sa.func.sum(ItemCarrinho.quantidade))
+        .where(ItemCarrinho.produto_id.in_(produto_ids))
+        .where(_ativos())
+        .where(sa.not_(sa.and_(ItemCarrinho.user_id == user_id, ItemCarrinho.caixa == caixa)))
+        .group_by(ItemCarrinho.produto_id)
+    ).all())
+
+
+def _renovar(user_id, caixa, expira_em):
+    db.session.execute(
+        sa.update(ItemCarrinho)
+        .where(ItemCarrinho.user_id == user_id, ItemCarrinho.caixa == caixa)
+        .values(expira_em=expira_em)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _disponivel(farmacia_id, user_id, caixa, produto_id):
+    # Saldo menos o reservado por outros caixas, como subconsulta do próprio comando que grava
+    outros = so.aliased(ItemCarrinho)
+    saldo = (
+        sa.select(sa.func.coalesce(sa.func.sum(Estoque.quantidade), 0))
+        .where(Estoque.farmacia_id == farmacia_id, Estoque.produto_id == produto_id)
+        .scalar_subquery()
+    )
+    reservado = (
+        sa.select(sa.func.coalesce(sa.func.sum(outros.quantidade), 0))
+        .where(outros.produto_id == produto_id, outros.expira_em > _agora())
+        .where(sa.not_(sa.and_(outros.user_id == user_id, outros.caixa == caixa)))
+        .scalar_subquery()
+    )
+    return saldo - reservado
+
+
+def reservar(farmacia_id, user_id, caixa, produto_id, quantidade):
+    """Coloca `quantidade` do produto no carrinho, reservando-a; devolve (ok, disponivel).
+
+    A disponibilidade é conferida no mesmo UPDATE/INSERT condicional que grava o item, para
+    dois caixas não reservarem juntos a mesma sobra (como a baixa por lote em app.checkout).
+    """
+    expira_em = _agora() + timedelta(minutes=app.config['RESERVAS_TTL_MINUTOS'])
+    do_item = sa.and_(
+        ItemCarrinho.user_id == user_id, ItemCarrinho.caixa == caixa, ItemCarrinho.produto_id == produto_id
+    )
+    for tentativa in range(2):
+        # No PostgreSQL a trava no Estoque do produto enfileira as reservas concorrentes; no
+        # SQLite, com um escritor por vez, o comando condicional já basta
+        db.session.execute(
+            sa.select(Estoque.id)
+            .where(Estoque.farmacia_id == farmacia_id, Estoque.produto_id == produto_id)
+            .with_for_update()
+        )
+        disponivel = _disponivel(farmacia_id, user_id, caixa, produto_id)
+        gravado = db.session.execute(
+            sa.update(ItemCarrinho)
+            .where(do_item, sa.literal(quantidade) <= disponivel)
+            .values(quantidade=quantidade, expira_em=expira_em)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not gravado:
+            try:
+                gravado = db.session.execute(
+                    sa.insert(ItemCarrinho).from_select(
+                        ['farmacia_id', 'user_id', 'caixa', 'produto_id', 'quantidade', 'expira_em'],
+                        sa.select(
+                            sa.literal(farmacia_id), sa.literal(user_id), sa.literal(caixa),
+                            sa.literal(produto_id), sa.literal(quantidade), sa.literal(expira_em, sa.DateTime)
+                        )
+                        .where(sa.literal(quantidade) <= disponivel)
+                        .where(~sa.exists().where(do_item))
+                    )
+                ).rowcount
+            except sa.exc.IntegrityError:
+                # O mesmo caixa inseriu o item ao mesmo tempo (clique duplo); a nova tentativa o atualiza
+                db.session.rollback()
+                if tentativa:
+                    raise
+                continue
+        break
+    if not gravado:
+        db.session.rollback()
+        return False, max(db.session().scalar(sa.select(_disponivel(farmacia_id, user_id, caixa, produto_id))), 0)
+    # Atividade no carrinho prolonga a reserva de todos os itens
+    _renovar(user_id, caixa, expira_em)
+    disponivel = db.session().scalar(sa.select(_disponivel(farmacia_id, user_id, caixa, produto_id)))
+    db.session.commit()
+    return True, disponivel
+
+
+def remover_item(user_id, caixa, produto_id):
+    removidos = db.session.execute(
+        sa.delete(ItemCarrinho)
+        .where(ItemCarrinho.user_id == user_id, ItemCarrinho.caixa == caixa)
+        .where(ItemCarrinho.produto_id == produto_id)
+        .where(_ativos())
+    ).rowcount
+    db.session.commit()
+    return removidos > 0
+
+
+def esvaziar_carrinho(user_id, caixa):
+    # Sem commit: acompanha a transação da venda
+    db.session.execute(
+        sa.delete(ItemCarrinho)
+        .where(ItemCarrinho.user_id == user_id, ItemCarrinho.caixa == caixa)
+    )
+
+
+def liberar_reservas_expiradas():
+    removidos = db.session.execute(
+        sa.delete(ItemCarrinho).where(ItemCarrinho.expira_em <= _agora())
+    ).rowcount
+    db.session.commit()
+    return removidos
+
+
+_limpeza = {'iniciada': False}
+_limpeza_lock = threading.Lock()
+
+
+def _laco_limpeza(intervalo):
+    evento = threading.Event()
+    while not evento.wait(intervalo):
+        with app.app_context():
+            try:
+                liberar_reservas_expiradas()
+            except sa.exc.SQLAlchemyError:
+                app.logger.exception('Falha ao liberar reservas expiradas')
+                db.session.rollback()
+
+
+def iniciar_limpeza_reservas():
+    """Inicia a thread que libera as reservas expiradas no processo, se ainda não estiver rodando.
+
+    Chamada nos processos que atendem requisições: workers do gunicorn e `flask run`.
+    """
+    intervalo = app.config['RESERVAS_INTERVALO_LIMPEZA']
+    if not intervalo:
+        return
+    with _limpeza_lock:
+        if not _limpeza['iniciada']:
+            threading.Thread(target=_laco_limpeza, args=(intervalo,), daemon=True, name='limpeza-reservas').start()
+            _limpeza['iniciada'] = True
@@ -0,0 +1,161 @@
+import random
+import time
+import sqlalchemy as sa
+from app import app, db
+from app.models import Produto, Validade
+from app.saldos import sincronizar_saldos
+from app.resumo import registrar_logs
+from app.alertas import invalidar_alertas
+from app.cache_relatorios import registrar_alteracao_dados
+from app.carrinho import reservado_por_outros, esvaziar_carrinho
+
+
+class FaltaEstoque:
+    def __init__(self, produto_id, nome, solicitado, disponivel):
+        self.produto_id = produto_id
+        self.nome = nome
+        self.solicitado = solicitado
+        self.disponivel = disponivel
+
+
+class LoteAlterado(Exception):
+    # Outro caixa baixou o lote entre a leitura e a atualização
+    pass
+
+
+def alocar_fefo(lotes, quantidade):
+    """Distribui `quantidade` entre os lotes (id, saldo) já ordenados pela validade mais próxima."""
+    alocacao = []
+    for lote_id, saldo in lotes:
+        if quantidade <= 0:
+            break
+        retirada = min(saldo, quantidade)
+        alocacao.append((lote_id, retirada))
+        quantidade -= retirada
+    return alocacao
+
+
+def _lotes_disponiveis(produto_ids):
+    lotes = {produto_id: [] for produto_id in produto_ids}
+    for lote_id, produto_id, saldo in db.session().execute(
+        sa.select(Validade.id, Validade.produto_id, Validade.quantidade)
+        .where(Validade.produto_id.in_(produto_ids))
+        .where(Validade.quantidade > 0)
+        .order_by(Validade.produto_id, Validade.data_validade, Validade.id)
+    ):
+        lotes[produto_id].append([lote_id, saldo])
+    return lotes
+
+
+def baixar_vendas(farmacia_id, vendas, reservado=None):
+    """Baixa por FEFO uma sequência de vendas [(itens, timestamp)] na transação corrente.
+
+    `itens` é {produto_id: quantidade} e `reservado` a quantidade por produto presa em
+    carrinhos de outros caixas. Os lotes são lidos uma vez e alocados em memória, venda a
+    venda; cada lote recebe um único UPDATE condicional com o total retirado.
+    Devolve, para cada venda, a lista de faltas (vazia se a venda foi baixada); uma venda
+    com falta não retira nada. Levanta LoteAlterado se o saldo lido mudou antes do UPDATE.
+    """
+    produto_ids = sorted({produto_id for itens, _ in vendas for produto_id in itens})
+    nomes = dict(db.session().execute(
+        sa.select(Produto.id, Produto.nome)
+        .where(Produto.id.in_(produto_ids))
+        .where(Produto.farmacia_id == farmacia_id)
+    ).all())
+    lotes = _lotes_disponiveis(produto_ids)
+    reservado = reservado or {}
+
+    resultados = []
+    retiradas = {}
+    logs = []
+    for itens, timestamp in vendas:
+        faltas = []
+        for produto_id, quantidade in itens.items():
+            disponivel = sum(saldo for _, saldo in lotes[produto_id]) if produto_id in nomes else 0
+            disponivel = max(disponivel - reservado.get(produto_id, 0), 0)
+            if disponivel < quantidade:
+                faltas.append(FaltaEstoque(produto_id, nomes.get(produto_id, f'#{produto_id}'), quantidade, disponivel))
+        resultados.append(faltas)
+        if faltas:
+            continue
+        for produto_id, quantidade in itens.items():
+            # A alocação percorre os lotes em ordem, então alinha com o início da lista
+            for (lote_id, retirada), lote in zip(alocar_fefo(lotes[produto_id], quantidade), lotes[produto_id]):
+                lote[1] -= retirada
+                retiradas[lote_id] = retiradas.get(lote_id, 0) + retirada
+            lotes[produto_id] = [lote for lote in lotes[produto_id] if lote[1] > 0]
+            log = {'produto_id': produto_id, 'quantidade': quantidade, 'operacao': 'removido'}
+            if timestamp is not None:
+                log['timestamp'] = timestamp
+            logs.append(log)
+    if not retiradas:
+        return resultados
+
+    baixa = sa.text(
+        'UPDATE validade SET quantidade = quantidade - :retirada '
+        'WHERE id = :id AND quantidade >= :retirada'
+    )
+    for lote_id, retirada in sorted(retiradas.items()):
+        if db.session.execute(baixa, {'id': lote_id, 'retirada': retirada}).rowcount != 1:
+            raise LoteAlterado(lote_id)
+
+    baixados = sorted({log['produto_id'] for log in logs})
+    # Remover entradas com quantidade 0
+    db.session.execute(
+        sa.delete(Validade)
+        .where(Validade.produto_id.in_(baixados))
+        .where(Validade.quantidade == 0)
+        .execution_options(synchronize_session=False)
+    )
+    sincronizar_saldos(baixados)
+    registrar_logs(farmacia_id, logs)
+    return resultados
+
+
+def baixar_itens(farmacia_id, itens, timestamp=None, reservado=None):
+    """Baixa uma única venda {produto_id: quantidade}; devolve as faltas, se houver."""
+    return baixar_vendas(farmacia_id, [(itens, timestamp)], reservado=reservado)[0]
+
+
+def banco_ocupado(erro):
+    mensagem = str(getattr(erro, 'orig', erro)).lower()
+    return 'database is locked' in mensagem or 'database is busy' in mensagem
+
+
+def com_tentativas(operacao):
+    """Executa `operacao` (que faz commit) repetindo em conflito de lote ou banco bloqueado."""
+    tentativas = app.config['CHECKOUT_TENTATIVAS']
+    for tentativa in range(tentativas):
+        try:
+            return operacao()
+        except (LoteAlterado, sa.exc.OperationalError) as erro:
+            db.session.rollback()
+            if tentativa == tentativas - 1:
+                raise
+            if isinstance(erro, sa.exc.OperationalError) and not banco_ocupado(erro):
+                raise
+            # Espera exponencial com variação para não sincronizar os caixas
+            time.sleep(app.config['CHECKOUT_ESPERA_BASE'] * 2 ** tentativa * (1 + random.random()))
+
+
+def finalizar_venda(farmacia_id, itens, user_id=None, caixa=None):
+    """Finaliza o carrinho inteiro em uma única transação curta; devolve as faltas, se houver.
+
+    Com `user_id` e `caixa`, respeita as reservas dos outros caixas e esvazia o carrinho no mesmo commit.
+    """
+    itens = {int(produto_id): int(quantidade) for produto_id, quantidade in itens.items() if int(quantidade) > 0}
+
+    def operacao():
+        reservado = reservado_por_outros(itens, user_id, caixa) if user_id is not None else {}
+        faltas = baixar_itens(farmacia_id, itens, reservado=reservado)
+        if faltas:
+            db.session.rollback()
+            return faltas
+        if user_id is not None:
+            esvaziar_carrinho(user_id, caixa)
+        invalidar_alertas(farmacia_id)
+        registrar_alteracao_dados(farmacia_id)
+        db.session.commit()
+        return []
+
+    return com_tentativas(operacao)
@@ -0,0 +1,361 @@
+import csv
+import json
+import time
+from datetime import datetime, timedelta
+import click
+from flask.helpers import get_debug_flag
+from werkzeug.serving import is_running_from_reloader
+import sqlalchemy as sa
+from app import app, db
+from app.models import Farmacia, User
+from app.saldos import saldos_divergentes, sincronizar_saldos
+from app.busca import reindexar
+from app.carrinho import liberar_reservas_expiradas
+from app.resumo import reconstruir_resumo
+from app.demanda import intervalo_periodo, PERIODOS_DIAS
+from app.rede import relatorio_rede, linhas_rede, CABECALHO_REDE
+from app.banco import verificar_banco
+from app.importacao_catalogo import importar_catalogo, ler_csv, CatalogoInvalido
+from app.benchmark import gerar_dados, executar_benchmark, comparar, gravar_resultado
+from app.estresse import estressar_checkout
+from app.arquivo_logs import arquivar_logs, limite_arquivamento, limpar_arquivos, verificar_arquivos
+
+
+@app.cli.group()
+def saldos():
+    """Comandos de manutenção do saldo de estoque."""
+    pass
+
+
+@saldos.command()
+@click.option('--corrigir', is_flag=True, help='Regrava os saldos divergentes a partir dos lotes.')
+def reconciliar(corrigir):
+    """Compara o saldo gravado em Estoque com a soma dos lotes."""
+    divergencias = saldos_divergentes()
+    for estoque_id, produto_id, quantidade, total, validade_proxima, proxima in divergencias:
+        click.echo(
+            f'Estoque {estoque_id} (produto {produto_id}): quantidade {quantidade} / lotes {total}, '
+            f'validade próxima {validade_proxima} / lotes {proxima}'
+        )
+    if not divergencias:
+        click.echo('Nenhuma divergência encontrada.')
+        return
+    if corrigir:
+        sincronizar_saldos(produto_id for _, produto_id, *_ in divergencias)
+        db.session.commit()
+        click.echo(f'{len(divergencias)} saldo(s) corrigido(s).')
+    else:
+        click.echo(f'{len(divergencias)} divergência(s). Use --corrigir para corrigir.')
+
+
+@app.cli.group()
+def busca():
+    """Comandos do índice de busca de produtos."""
+    pass
+
+
+@busca.command('reindexar')
+def busca_reindexar():
+    """Reconstrói o índice de busca a partir da tabela de produtos."""
+    if reindexar():
+        db.session.commit()
+        click.echo('Índice de busca reconstruído.')
+    else:
+        click.echo('Índice de busca indisponível (requer SQLite com FTS5); usando ILIKE.')
+
+
+@app.cli.group()
+def carrinho():
+    """Comandos do carrinho e das reservas de estoque."""
+    pass
+
+
+@carrinho.command('limpar')
+def carrinho_limpar():
+    """Libera as reservas de carrinho expiradas."""
+    click.echo(f'{liberar_reservas_expiradas()} reserva(s) expirada(s) liberada(s).')
+
+
+@app.cli.group()
+def resumo():
+    """Comandos do resumo diário de movimentação."""
+    pass
+
+
+@resumo.command('reconstruir')
+def resumo_reconstruir():
+    """Recalcula o resumo diário a partir de todos os logs de produto."""
+    linhas = reconstruir_resumo()
+    db.session.commit()
+    click.echo(f'Resumo diário reconstruído: {linhas} linha(s).')
+
+
+@app.cli.group()
+def usuarios():
+    """Comandos de usuários."""
+    pass
+
+
+@usuarios.command('administrador')
+@click.argument('username')
+@click.option('--remover', is_flag=True, help='Retira o acesso em vez de conceder.')
+def usuarios_administrador(username, remover):
+    """Concede (ou retira) o acesso aos relatórios da rede."""
+    user = db.session.scalar(sa.select(User).where(User.username == username))
+    if user is None:
+        raise click.ClickException(f'Usuário {username} não encontrado.')
+    user.administrador = not remover
+    db.session.commit()
+    click.echo(f'{username}: administrador = {user.administrador}.')
+
+
+@app.cli.group()
+def rede():
+    """Relatórios consolidados de todas as farmácias."""
+    pass
+
+
+@rede.command('relatorio')
+@click.option('--periodo', type=click.Choice(list(PERIODOS_DIAS)), default='semana', show_default=True)
+@click.option('--processos', type=int, default=None, help='Processos em paralelo (padrão: REDE_PROCESSOS ou um por CPU).')
+@click.option('--saida', type=click.Path(dir_okay=False), default=None, help='Grava a tabela consolidada em CSV.')
+def rede_relatorio(periodo, processos, saida):
+    """Calcula a demanda de todas as farmácias e mostra os totais da rede."""
+    now = datetime.now() - timedelta(hours=3)
+    data_inicio, data_fim = intervalo_periodo(periodo, now)
+    inicio = time.perf_counter()
+    resultado = relatorio_rede(data_inicio, data_fim, now, processos=processos)
+    for loja in resultado['lojas']:
+        totais = loja['totais']
+        click.echo(
+            f"{loja['nome']}: {totais['produtos']} produto(s), a pedir {totais['quantidade_a_pedir']} "
+            f"(R${totais['valor_a_pedir']:.2f})"
+        )
+    totais = resultado['totais']
+    click.echo(
+        f"Rede: {len(resultado['lojas'])} loja(s), {totais['produtos']} produto(s), a pedir "
+        f"{totais['quantidade_a_pedir']} (R${totais['valor_a_pedir']:.2f}) em {time.perf_counter() - inicio:.1f}s"
+    )
+    if saida:
+        with open(saida, 'w', newline='', encoding='utf-8') as arquivo:
+            escritor = csv.writer(arquivo)
+            escritor.writerow(CABECALHO_REDE)
+            escritor.writerows(linhas_rede(resultado))
+        click.echo(f'Tabela gravada em {saida}.')
+
+
+@app.cli.group()
+def banco():
+    """Comandos de configuração do banco de dados."""
+    pass
+
+
+@banco.command('verificar')
+def banco_verificar():
+    """Mostra as configurações em vigor no banco e no pool de conexões."""
+    configuracao, avisos = verificar_banco()
+    for chave, valor in configuracao.items():
+        click.echo(f'{chave}: {valor}')
+    for aviso in avisos:
+        click.echo(f'Aviso: {aviso}')
+    if not avisos:
+        click.echo('Configuração conforme o perfil.')
+
+
+@app.cli.group()
+def logs():
+    """Arquivo frio do histórico de movimentação."""
+    pass
+
+
+@logs.command('arquivar')
+@click.option('--meses', type=int, default=None, help='Meses mantidos na tabela (padrão: ARQUIVO_LOGS_MESES).')
+def logs_arquivar(meses):
+    """Move os logs antigos para arquivos mensais compactados, por farmácia."""
+    limite = limite_arquivamento(meses)
+    entradas = arquivar_logs(limite)
+    for entrada in entradas:
+        click.echo(f'Farmácia {entrada.farmacia_id}, {entrada.mes:%Y-%m}: {entrada.linhas} log(s) em {entrada.caminho}')
+    click.echo(f'{len(entradas)} mês(es) arquivado(s) antes de {limite:%Y-%m-%d}.')
+
+
+@logs.command('verificar')
+def logs_verificar():
+    """Confere os arquivos do histórico com o manifesto (existência e sha256)."""
+    problemas = verificar_arquivos()
+    for entrada, problema in problemas:
+        click.echo(f'Farmácia {entrada.farmacia_id}, {entrada.mes:%Y-%m} ({entrada.caminho}): {problema}')
+    if problemas:
+        raise click.ClickException(f'{len(problemas)} arquivo(s) com problema.')
+    click.echo('Arquivos conforme o manifesto.')
+
+
+@logs.command('limpar')
+@click.option('--carencia', type=int, default=None, help='Segundos desde a substituição (padrão: ARQUIVO_LOGS_CARENCIA_SEGUNDOS).')
+def logs_limpar(carencia):
+    """Apaga os arquivos que saíram do manifesto há mais que a carência."""
+    apagados = limpar_arquivos(carencia)
+    for caminho in apagados:
+        click.echo(f'Apagado: {caminho}')
+    click.echo(f'{len(apagados)} arquivo(s) apagado(s).')
+
+
+@app.cli.group()
+def catalogo():
+    """Importação do catálogo de produtos."""
+    pass
+
+
+@catalogo.command('importar')
+@click.argument('arquivo', type=click.File('rb'))
+@click.option('--farmacia', 'farmacia_id', type=int, required=True, help='ID da farmácia que recebe o catálogo.')
+@click.option('--erros', type=click.Path(dir_okay=False), default=None, help='Grava as linhas com erro em CSV.')
+def catalogo_importar(arquivo, farmacia_id, erros):
+    """Importa (ou atualiza) os produtos de um CSV no catálogo de uma farmácia."""
+    if db.session.get(Farmacia, farmacia_id) is None:
+        raise click.ClickException(f'Farmácia {farmacia_id} não encontrada.')
+    inicio = time.perf_counter()
+    try:
+        resultado = importar_catalogo(farmacia_id, ler_csv(arquivo.read()))
+    except CatalogoInvalido as erro:
+        raise click.ClickException(str(erro))
+    click.echo(
+        f'{resultado.inseridos} produto(s) adicionado(s), {resultado.atualizados} atualizado(s), '
+        f'{resultado.fabricantes} fabricante(s) e {resultado.fornecedores} fornecedor(es) criado(s) '
+        f'em {time.perf_counter() - inicio:.1f}s.'
+    )
+    if resultado.erros:
+        click.echo(f'{resultado.linhas_com_erro} linha(s) com erro.')
+        if erros:
+            with open(erros, 'w', newline='', encoding='utf-8') as saida:
+                escritor = csv.writer(saida)
+                escritor.writerow(['Linha', 'Erros'])
+                escritor.writerows((linha, '; '.join(mensagens)) for linha, mensagens in resultado.erros)
+            click.echo(f'Relatório de erros gravado em {erros}.')
+        else:
+            for linha, mensagens in resultado.erros[:20]:
+                click.echo(f'Linha {linha}: {"; ".join(mensagens)}')
+
+
+@app.cli.group()
+def benchmark():
+    """Dados sintéticos e medição de desempenho das telas principais."""
+    pass
+
+
+@benchmark.command('dados')
+@click.option('--farmacias', type=int, default=3, show_default=True)
+@click.option('--produtos', type=int, default=2000, show_default=True, help='Produtos por farmácia.')
+@click.option('--anos', type=float, default=2, show_default=True, help='Anos de histórico de vendas.')
+@click.option('--semente', type=int, default=42, show_default=True)
+def benchmark_dados(farmacias, produtos, anos, semente):
+    """Preenche um banco vazio com farmácias, produtos, lotes e histórico sintéticos."""
+    inicio = time.perf_counter()
+
+    def progresso(n, contagem):
+        click.echo(f'Farmácia {n}/{farmacias}: {contagem["produtos"]} produto(s), {contagem["logs"]} log(s) até agora.')
+
+    try:
+        contagem = gerar_dados(farmacias, produtos, anos, semente, progresso)
+    except ValueError as erro:
+        raise click.ClickException(str(erro))
+    click.echo(
+        f'{contagem["farmacias"]} farmácia(s), {contagem["produtos"]} produto(s), {contagem["validades"]} lote(s) e '
+        f'{contagem["logs"]} log(s) em {time.perf_counter() - inicio:.1f}s. Usuários bench1..bench{farmacias}, senha bench.'
+    )
+
+
+@benchmark.command('executar')
+@click.option('--repeticoes', type=int, default=20, show_default=True, help='Medidas por cenário.')
+@click.option('--usuario', default='bench1', show_default=True)
+@click.option('--com-cache', is_flag=True, help='Mede os relatórios com o cache ligado.')
+@click.option('--saida', type=click.Path(dir_okay=False), default=None, help='Grava o resultado em JSON.')
+@click.option('--comparar', 'base', type=click.File('r', encoding='utf-8'), default=None, help='JSON de uma execução anterior.')
+@click.option('--tolerancia', type=float, default=0.2, show_default=True, help='Piora aceita no p95 e nos comandos.')
+def benchmark_executar(repeticoes, usuario, com_cache, saida, base, tolerancia):
+    """Mede latência (percentis) e comandos SQL de cada cenário; falha se houver regressão."""
+    try:
+        resultado = executar_benchmark(repeticoes, usuario, com_cache=com_cache)
+    except ValueError as erro:
+        raise click.ClickException(str(erro))
+    click.echo(f'{"Cenário":<20}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"comandos":>10}{"banco ms":>10}{"erros":>7}')
+    for cenario, medidas in resultado['cenarios'].items():
+        click.echo(
+            f'{cenario:<20}{medidas["p50_ms"]:>10.1f}{medidas["p95_ms"]:>10.1f}{medidas["p99_ms"]:>10.1f}'
+            f'{medidas["comandos_medio"]:>10.1f}{medidas["banco_medio_ms"]:>10.1f}{medidas["erros"]:>7}'
+        )
+    if saida:
+        gravar_resultado(resultado, saida)
+        click.echo(f'Resultado gravado em {saida}.')
+    if base:
+        regressoes = comparar(resultado, json.load(base), tolerancia)
+        for cenario, metrica, anterior, atual in regressoes:
+            click.echo(f'Regressão em {cenario}: {metrica} {anterior} -> {atual}')
+        if regressoes:
+            raise click.ClickException(f'{len(regressoes)} regressão(ões) acima de {tolerancia:.0%}.')
+        click.echo(f'Sem regressões acima de {tolerancia:.0%}.')
+
+
+@app.cli.group()
+def estresse():
+    """Testes de carga concorrente contra o gunicorn."""
+    pass
+
+
+@estresse.command('checkout')
+@click.option('--workers', type=int, default=4, show_default=True, help='Workers do gunicorn.')
+@click.option('--caixas', type=int, default=16, show_default=True, help='Caixas simulados ao mesmo tempo.')
+@click.option('--duracao', type=float, default=30, show_default=True, help='Segundos de carga.')
+@click.option('--produtos', type=int, default=10, show_default=True, help='Produtos disputados pelos caixas.')
+@click.option('--estoque', type=int, default=300, show_default=True, help='Unidades iniciais de cada produto.')
+@click.option('--porta', type=int, default=8765, show_default=True)
+@click.option('--timeout', type=float, default=30, show_default=True, help='Segundos até desistir de uma requisição.')
+@click.option('--saida', type=click.Path(dir_okay=False), default=None, help='Grava o relatório em JSON.')
+def estresse_checkout(workers, caixas, duracao, produtos, estoque, porta, timeout, saida):
+    """Caixas concorrentes vendendo os mesmos produtos; falha se algum invariante do estoque quebrar.
+
+    Cria uma farmácia de teste no banco configurado (DATABASE_URL): use uma cópia do banco.
+    """
+    try:
+        resultado = estressar_checkout(workers, caixas, duracao, produtos, estoque, porta, timeout)
+    except (ValueError, RuntimeError) as erro:
+        raise click.ClickException(str(erro))
+    click.echo(
+        f'{resultado["decorrido_s"]:.1f}s, {resultado["vendas_por_segundo"]} venda(s)/s, '
+        f'{resultado["requisicoes_por_segundo"]} requisição(ões)/s, {resultado["unidades_vendidas"]} unidade(s) vendida(s).'
+    )
+    click.echo(f'{"Operação":<12}{"n":>8}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"max ms":>10}')
+    for operacao, medidas in resultado['latencia'].items():
+        if medidas['n']:
+            click.echo(
+                f'{operacao:<12}{medidas["n"]:>8}{medidas["p50_ms"]:>10.1f}{medidas["p95_ms"]:>10.1f}'
+                f'{medidas["p99_ms"]:>10.1f}{medidas["max_ms"]:>10.1f}'
+            )
+    for situacao, vezes in sorted(resultado['situacoes'].items()):
+        click.echo(f'  {situacao}: {vezes}')
+    click.echo(f'Erros de bloqueio (ocupado, 500, timeout): {resultado["erros_de_bloqueio"]}')
+    if resultado['vendas_sem_resposta'] or resultado['unidades_incertas']:
+        click.echo(
+            f'Sem resposta: {resultado["vendas_sem_resposta"]} venda(s), {resultado["unidades_incertas"]} unidade(s) '
+            'conferidas como possivelmente baixadas.'
+        )
+    if saida:
+        gravar_resultado(resultado, saida)
+        click.echo(f'Resultado gravado em {saida}.')
+    for violacao in resultado['violacoes']:
+        click.echo(f'Violação: {violacao}')
+    if resultado['violacoes']:
+        raise click.ClickException(f'{len(resultado["violacoes"])} invariante(s) violado(s).')
+    click.echo('Invariantes do estoque conferidos: nenhuma violação.')
+
+
+def servidor_de_desenvolvimento():
+    """Diz se o app foi carregado pelo `flask run` no processo que atende as requisições."""
+    contexto = click.get_current_context(silent=True)
+    if contexto is None or contexto.info_name != 'run':
+        return False
+    recarregar = contexto.params.get('reload')
+    if recarregar is None:
+        recarregar = get_debug_flag()
+    # Com o reloader, o processo pai só vigia os arquivos: quem atende é o filho
+    return not recarregar or is_running_from_reloader()
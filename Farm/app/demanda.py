@@ -0,0 +1,155 @@
+from datetime import timedelta
+import numpy as np
+import sqlalchemy as sa
+from app import db
+from app.models import Estoque, Produto, ResumoDiario, Validade
+from app.previsao import prever_demanda
+
+NIVEL_SERVICO_Z = 1.65  # Para 95% de nível de serviço
+VALIDADE_PADRAO_DIAS = 15  # Sem lotes válidos, assume 15 dias
+PERIODOS_DIAS = {'semana': 7, 'mes': 30, 'ano': 365}
+
+
+def intervalo_periodo(periodo, now):
+    # Do início do dia, `periodo` atrás, até o fim de hoje (padrão: última semana)
+    data_inicio = now - timedelta(days=PERIODOS_DIAS.get(periodo, 7))
+    return (
+        data_inicio.replace(hour=0, minute=0, second=0, microsecond=0),
+        now.replace(hour=23, minute=59, second=59, microsecond=999999)
+    )
+
+
+def movimento_diario(farmacia_id, data_inicio, data_fim):
+    """Entradas, saídas e número de saídas por produto e por dia local, lidos do resumo diário."""
+    return db.session().execute(
+        sa.select(
+            ResumoDiario.produto_id,
+            ResumoDiario.dia,
+            ResumoDiario.adicionado,
+            ResumoDiario.removido,
+            ResumoDiario.saidas,
+        )
+        .join(Estoque, sa.and_(Estoque.produto_id == ResumoDiario.produto_id, Estoque.farmacia_id == ResumoDiario.farmacia_id))
+        .where(ResumoDiario.farmacia_id == farmacia_id)
+        .where(ResumoDiario.dia >= data_inicio.date())
+        .where(ResumoDiario.dia <= data_fim.date())
+        .order_by(ResumoDiario.dia)
+    ).all()
+
+
+def _validade_media(farmacia_id, indices, now):
+    # Média dos dias restantes dos lotes com saldo que ainda não venceram
+    lotes = db.session().execute(
+        sa.select(Validade.produto_id, Validade.data_validade)
+        .join(Estoque, Estoque.produto_id == Validade.produto_id)
+        .where(Estoque.farmacia_id == farmacia_id)
+        .where(Validade.quantidade > 0)
+    ).all()
+    soma = np.zeros(len(indices))
+    contagem = np.zeros(len(indices))
+    # Lotes que sobraram de produtos excluídos ficam de fora, como no movimento
+    lotes = [lote for lote in lotes if lote[0] in indices]
+    if lotes:
+        posicao = np.array([indices[produto_id] for produto_id, _ in lotes])
+        datas = np.array([data_validade for _, data_validade in lotes], dtype='datetime64[us]')
+        dias = (datas - np.datetime64(now, 'us')) // np.timedelta64(1, 'D')
+        validos = dias > 0
+        soma = np.bincount(posicao[validos], weights=dias[validos], minlength=len(indices))
+        contagem = np.bincount(posicao[validos], minlength=len(indices))
+    return np.divide(soma, contagem, out=np.full(len(indices), float(VALIDADE_PADRAO_DIAS)), where=contagem > 0)
+
+
+def calcular_demandas(farmacia_id, data_inicio, data_fim, now, progresso=None):
+    """Indicadores de demanda de todos os produtos da farmácia que tiveram saídas no período.
+
+    O período de cada produto vai do dia da primeira ao dia da última saída; dias sem
+    saída contam como zero no desvio padrão. A quantidade a pedir usa a previsão de
+    demanda (app.previsao) em vez da média. `progresso(percentual)`, se informado, é
+    chamado entre as etapas.
+    """
+    progresso = progresso or (lambda percentual: None)
+    produtos = db.session().execute(
+        sa.select(Produto.id, Produto.nome, Produto.preco_venda)
+        .join(Estoque, Estoque.produto_id == Produto.id)
+        .where(Estoque.farmacia_id == farmacia_id)
+        .order_by(Estoque.id)
+    ).all()
+    progresso(20)
+    linhas = movimento_diario(farmacia_id, data_inicio, data_fim)
+    progresso(60)
+    if not produtos or not linhas:
+        return []
+
+    n = len(produtos)
+    indices = {produto_id: i for i, (produto_id, _, _) in enumerate(produtos)}
+    # Os logs de produtos excluídos ficam no histórico (com o estoque e os lotes deles), mas
+    # esses produtos já não entram no relatório
+    linhas = [linha for linha in linhas if linha[0] in indices]
+    if not linhas:
+        return []
+    posicao = np.array([indices[produto_id] for produto_id, _, _, _, _ in linhas])
+    dia = np.array([dia.toordinal() for _, dia, _, _, _ in linhas])
+    entradas = np.array([entradas for _, _, entradas, _, _ in linhas], dtype=float)
+    saidas = np.array([saidas for _, _, _, saidas, _ in linhas], dtype=float)
+    com_saida = np.array([removidos > 0 for _, _, _, _, removidos in linhas])
+
+    # Período: do primeiro ao último dia com saída
+    primeiro_dia = np.full(n, np.iinfo(np.int64).max)
+    ultimo_dia = np.full(n, np.iinfo(np.int64).min)
+    np.minimum.at(primeiro_dia, posicao[com_saida], dia[com_saida])
+    np.maximum.at(ultimo_dia, posicao[com_saida], dia[com_saida])
+    tem_saida = np.bincount(posicao[com_saida], minlength=n) > 0
+    periodo_dias = np.where(tem_saida, ultimo_dia - primeiro_dia + 1, 1)
+
+    entradas_total = np.bincount(posicao, weights=entradas, minlength=n)
+    saidas_total = np.bincount(posicao, weights=saidas, minlength=n)
+    demanda_media_diaria = saidas_total / periodo_dias
+
+    # Desvio padrão amostral das saídas diárias, incluindo os dias sem saída
+    dias_sem_saida = periodo_dias - np.bincount(posicao[com_saida], minlength=n)
+    desvios = np.bincount(
+        posicao[com_saida], weights=(saidas[com_saida] - demanda_media_diaria[posicao[com_saida]]) ** 2, minlength=n
+    ) + dias_sem_saida * demanda_media_diaria ** 2
+    desvio_padrao = np.sqrt(np.divide(desvios, periodo_dias - 1, out=np.zeros(n), where=periodo_dias > 1))
+
+    # Previsão da demanda diária no fim do período (SES ou Croston/SBA, conforme a intermitência)
+    previsao, intermitente = prever_demanda(
+        posicao[com_saida], dia[com_saida], saidas[com_saida], n,
+        data_inicio.date().toordinal(), min(data_fim, now).date().toordinal()
+    )
+
+    estoque_seguranca = np.rint(NIVEL_SERVICO_Z * desvio_padrao).astype(int)
+    # Sem lead time, o ponto de reposição é igual ao estoque de segurança
+    ponto_reposicao = estoque_seguranca
+    validade_media = _validade_media(farmacia_id, indices, now)
+    quantidade_maxima = np.rint(demanda_media_diaria * validade_media).astype(int)
+    # Na quantidade a pedir, a máxima vem da previsão: o que se prevê vender antes de os lotes vencerem
+    quantidade_maxima_prevista = np.rint(previsao * validade_media).astype(int)
+    progresso(90)
+    estoque_atual = (entradas_total - saidas_total).astype(int)
+    quantidade_a_pedir = np.where(
+        estoque_atual < ponto_reposicao,
+        np.maximum(0, np.minimum(quantidade_maxima_prevista - estoque_atual, ponto_reposicao - estoque_atual)),
+        0
+    )
+    tempo_duracao = np.divide(estoque_atual, demanda_media_diaria, out=np.zeros(n), where=demanda_media_diaria > 0)
+
+    return [
+        {
+            'produto_id': produto_id,
+            'nome': nome,
+            'preco_venda': preco_venda,
+            'demanda_media_diaria': round(float(demanda_media_diaria[i]), 2),
+            'previsao_diaria': round(float(previsao[i]), 2),
+            'metodo_previsao': 'Croston/SBA' if intermitente[i] else 'SES',
+            'estoque_seguranca': int(estoque_seguranca[i]),
+            'ponto_reposicao': int(ponto_reposicao[i]),
+            'quantidade_maxima': int(quantidade_maxima[i]),
+            'estoque_atual': int(estoque_atual[i]),
+            'quantidade_a_pedir': int(quantidade_a_pedir[i]),
+            'tempo_duracao': round(float(tempo_duracao[i]), 2),
+            'estoque_excedente': bool(estoque_atual[i] > quantidade_maxima[i])
+        }
+        for i, (produto_id, nome, preco_venda) in enumerate(produtos)
+        if tem_saida[i]
+    ]
@@ -0,0 +1,297 @@
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timedelta, timezone
+from http.cookiejar import CookieJar
+import sqlalchemy as sa
+from app import app, db
+from app.models import Estoque, Farmacia, Produto, ProdutoLog, User, Validade
+from app.importacao_catalogo import importar_catalogo
+from app.recebimento import receber_nota
+from app.saldos import saldos_divergentes
+from app.benchmark import percentil
+
+# Teste de estresse do caixa: sobe a aplicação com vários workers do gunicorn e simula caixas
+# que, ao mesmo tempo, colocam no carrinho e finalizam vendas dos mesmos produtos. Depois
+# confere os invariantes do estoque no banco: nada vendido além do que havia, nenhum lote
+# negativo, saldo de Estoque igual à soma dos lotes e cada venda confirmada registrada no log.
+# Uma requisição sem resposta (timeout ou erro 500) pode ter sido gravada mesmo assim: as
+# quantidades dela entram como incertas e a baixa fica entre o confirmado e o confirmado mais elas.
+
+SENHA = 'estresse'
+# Login e abertura do caixa não são medidos: usam um limite próprio, e não o `timeout` da carga
+TIMEOUT_PREPARO = 60
+_CSRF = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+MENSAGENS = {
+    'Compra registrada com sucesso!': 'sucesso',
+    'Estoque insuficiente para o produto': 'sem_estoque',
+    'ocupado por outro caixa': 'ocupado',
+    'O carrinho está vazio.': 'vazio',
+    'Quantidade insuficiente em estoque': 'reserva_negada',
+    'Produto adicionado ao carrinho!': 'adicionado',
+}
+
+
+def preparar(produtos, estoque, semente=42):
+    """Cria uma farmácia isolada com `produtos` produtos de `estoque` unidades cada (em 1 a 3 lotes).
+
+    Devolve (farmacia_id, username, {produto_id: estoque inicial}).
+    """
+    if not 0 < produtos <= 1000:
+        raise ValueError('Use de 1 a 1000 produtos.')
+    rng = random.Random(semente)
+    marca = datetime.now().strftime('%Y%m%d%H%M%S')
+    farmacia = Farmacia(nome=f'Farmácia Estresse {marca}', endereco='Rua do Estresse', cep='00000-000', cnpj=marca[:14])
+    db.session.add(farmacia)
+    db.session.flush()
+    user = User(username=f'estresse{marca}', email=f'estresse{marca}@exemplo.com', farmacia_id=farmacia.id)
+    user.set_password(SENHA)
+    db.session.add(user)
+    db.session.commit()
+    importar_catalogo(farmacia.id, [
+        (i + 2, {
+            'nome': f'Produto Estresse {i}', 'genero': 'Teste', 'tipo': 'Generico', 'grupo': 'Teste',
+            'fabricante_id': '1', 'quantidade_embalagem': '1', 'fornecedor_id': '1',
+            'preco_compra': '1.00', 'preco_venda': '2.00', 'codigo_barras': f'{marca[4:]}{i:03d}',
+        })
+        for i in range(produtos)
+    ])
+    produto_ids = db.session.scalars(sa.select(Produto.id).where(Produto.farmacia_id == farmacia.id)).all()
+    itens = []
+    for produto_id in produto_ids:
+        lotes = rng.randint(1, 3)
+        for lote in range(lotes):
+            itens.append({
+                'produto_id': produto_id,
+                'quantidade': estoque // lotes + (estoque % lotes if lote == 0 else 0),
+                'data_validade': (datetime.now().date() + timedelta(days=60 + 30 * lote)).isoformat(),
+            })
+    aplicada, resultados = receber_nota(farmacia.id, itens)
+    if not aplicada:
+        raise RuntimeError(f'Falha ao receber o estoque inicial: {resultados}')
+    return farmacia.id, user.username, {produto_id: estoque for produto_id in produto_ids}
+
+
+class Servidor:
+    """gunicorn com `workers` workers servindo a aplicação deste diretório, com o mesmo ambiente."""
+
+    def __init__(self, workers, porta):
+        self.workers = workers
+        self.porta = porta
+        self.processo = None
+
+    def __enter__(self):
+        self.processo = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-w', str(self.workers), '-b', f'127.0.0.1:{self.porta}',
+             '--timeout', '120', '--log-level', 'warning', 'app:app'],
+            cwd=os.path.dirname(app.root_path), env=dict(os.environ, TAREFAS_WORKERS='0')
+        )
+        limite = time.monotonic() + 30
+        while time.monotonic() < limite:
+            if self.processo.poll() is not None:
+                raise RuntimeError('O gunicorn terminou durante a inicialização.')
+            try:
+                with socket.create_connection(('127.0.0.1', self.porta), timeout=1):
+                    return self
+            except OSError:
+                time.sleep(0.2)
+        self.__exit__()
+        raise RuntimeError(f'O gunicorn não respondeu na porta {self.porta}.')
+
+    def __exit__(self, *erro):
+        self.processo.terminate()
+        try:
+            self.processo.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.processo.kill()
+
+
+class Caixa:
+    """Um caixa simulado: sessão própria (cookies e CSRF) e um identificador de caixa próprio."""
+
+    def __init__(self, base, username, numero, timeout):
+        self.base = base
+        self.timeout = timeout
+        self.abridor = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+        self.token = _CSRF.search(self._abrir('GET', '/login', timeout=TIMEOUT_PREPARO)[1]).group(1)
+        self._abrir('POST', '/login', {'username': username, 'password': SENHA}, timeout=TIMEOUT_PREPARO)
+        self._abrir('GET', f'/vendas?caixa=estresse-{numero}', timeout=TIMEOUT_PREPARO)
+
+    def _abrir(self, metodo, caminho, dados=None, timeout=None):
+        # Segue o redirecionamento como o navegador; devolve (status, página final)
+        corpo = urllib.parse.urlencode(dict(dados, csrf_token=self.token)).encode() if dados is not None else None
+        requisicao = urllib.request.Request(self.base + caminho, data=corpo, method=metodo)
+        try:
+            with self.abridor.open(requisicao, timeout=timeout or self.timeout) as resposta:
+                return resposta.status, resposta.read().decode('utf-8', 'replace')
+        except urllib.error.HTTPError as erro:
+            return erro.code, ''
+
+    def operacao(self, dados):
+        """POST em /vendas; devolve (situação, duração)."""
+        inicio = time.perf_counter()
+        try:
+            status, pagina = self._abrir('POST', '/vendas', dados)
+        except (socket.timeout, urllib.error.URLError):
+            return 'timeout', time.perf_counter() - inicio
+        duracao = time.perf_counter() - inicio
+        if status >= 500:
+            return 'erro_500', duracao
+        if status >= 400:
+            return f'erro_{status}', duracao
+        for mensagem, situacao in MENSAGENS.items():
+            if mensagem in pagina:
+                return situacao, duracao
+        return 'desconhecido', duracao
+
+
+SEM_RESPOSTA = {'timeout', 'erro_500'}
+
+
+def _somar(destino, itens):
+    for produto_id, quantidade in itens.items():
+        destino[produto_id] = destino.get(produto_id, 0) + quantidade
+
+
+def _executar_caixa(caixa, produto_ids, fim, rng, resultado, trava):
+    while time.monotonic() < fim:
+        # carrinho: reservas confirmadas; incerto: reservas sem resposta, que podem estar no carrinho do servidor
+        carrinho = {}
+        incerto = {}
+        for produto_id in rng.sample(produto_ids, rng.randint(1, min(3, len(produto_ids)))):
+            quantidade = rng.randint(1, 3)
+            situacao, duracao = caixa.operacao({'produto_id': produto_id, 'quantidade_carrinho': quantidade})
+            with trava:
+                resultado['adicionar'].append(duracao)
+                resultado['situacoes'][situacao] = resultado['situacoes'].get(situacao, 0) + 1
+            if situacao == 'adicionado':
+                carrinho[produto_id] = carrinho.get(produto_id, 0) + quantidade
+            elif situacao in SEM_RESPOSTA:
+                incerto[produto_id] = incerto.get(produto_id, 0) + quantidade
+        if not carrinho and not incerto:
+            continue
+        situacao, duracao = caixa.operacao({'finalizar_compra_action': 1})
+        with trava:
+            resultado['finalizar'].append(duracao)
+            resultado['situacoes'][situacao] = resultado['situacoes'].get(situacao, 0) + 1
+            if situacao == 'sucesso':
+                _somar(resultado['vendido'], carrinho)
+                _somar(resultado['incerto'], incerto)
+            elif situacao in SEM_RESPOSTA:
+                # A venda pode ter sido gravada antes de a resposta se perder
+                resultado['vendas_sem_resposta'] += 1
+                _somar(resultado['incerto'], carrinho)
+                _somar(resultado['incerto'], incerto)
+        if situacao != 'sucesso':
+            # Venda recusada ou sem resposta: o caixa desiste e libera as reservas (se a venda foi
+            # gravada, o carrinho já está vazio)
+            for produto_id in {**carrinho, **incerto}:
+                caixa.operacao({'produto_id': produto_id, 'remove_from_cart_action': 1})
+
+
+def verificar_invariantes(farmacia_id, inicial, vendido, incerto=None):
+    """Violações dos invariantes do estoque da farmácia de teste, em texto.
+
+    `incerto` é a quantidade, por produto, de vendas e reservas sem resposta: a baixa pode ir
+    do confirmado aos caixas até o confirmado mais o incerto.
+    """
+    incerto = incerto or {}
+    produto_ids = list(inicial)
+    violacoes = []
+    negativos = db.session.execute(
+        sa.select(Validade.id, Validade.produto_id, Validade.quantidade)
+        .where(Validade.produto_id.in_(produto_ids)).where(Validade.quantidade < 0)
+    ).all()
+    violacoes += [f'Lote {id} do produto {produto_id} com quantidade {quantidade}' for id, produto_id, quantidade in negativos]
+    violacoes += [
+        f'Estoque {estoque_id} (produto {produto_id}): saldo {quantidade}, lotes {total}'
+        for estoque_id, produto_id, quantidade, total, *_ in saldos_divergentes() if produto_id in inicial
+    ]
+    saldos = dict(db.session.execute(
+        sa.select(Estoque.produto_id, Estoque.quantidade).where(Estoque.farmacia_id == farmacia_id)
+    ).all())
+    registrado = dict(db.session.execute(
+        sa.select(ProdutoLog.produto_id, sa.func.sum(ProdutoLog.quantidade))
+        .where(ProdutoLog.farmacia_id == farmacia_id).where(ProdutoLog.operacao == 'removido')
+        .group_by(ProdutoLog.produto_id)
+    ).all())
+    for produto_id, quantidade in inicial.items():
+        baixado = quantidade - saldos.get(produto_id, 0)
+        if baixado > quantidade:
+            violacoes.append(f'Produto {produto_id}: vendido {baixado} de um estoque de {quantidade} (oversell)')
+        if baixado != registrado.get(produto_id, 0):
+            violacoes.append(f'Produto {produto_id}: baixa de {baixado} no estoque e {registrado.get(produto_id, 0)} no log')
+        confirmado = vendido.get(produto_id, 0)
+        if not confirmado <= baixado <= confirmado + incerto.get(produto_id, 0):
+            violacoes.append(
+                f'Produto {produto_id}: baixa de {baixado} no estoque, {confirmado} confirmado aos caixas '
+                f'e {incerto.get(produto_id, 0)} sem resposta'
+            )
+    return violacoes
+
+
+def _latencias(duracoes):
+    ordenadas = sorted(duracoes)
+    if not ordenadas:
+        return {'n': 0}
+    return {
+        'n': len(ordenadas),
+        'media_ms': round(sum(ordenadas) / len(ordenadas) * 1000, 2),
+        **{f'p{p}_ms': round(percentil(ordenadas, p) * 1000, 2) for p in (50, 90, 95, 99)},
+        'max_ms': round(ordenadas[-1] * 1000, 2),
+    }
+
+
+def estressar_checkout(workers=4, caixas=16, duracao=30, produtos=10, estoque=300, porta=8765, timeout=30, semente=42):
+    """Sobe o gunicorn, roda `caixas` caixas por `duracao` segundos e devolve o relatório (JSON)."""
+    farmacia_id, username, inicial = preparar(produtos, estoque, semente)
+    resultado = {'adicionar': [], 'finalizar': [], 'situacoes': {}, 'vendido': {}, 'incerto': {}, 'vendas_sem_resposta': 0}
+    trava = threading.Lock()
+    with Servidor(workers, porta):
+        base = f'http://127.0.0.1:{porta}'
+        registros = [Caixa(base, username, numero, timeout) for numero in range(caixas)]
+        inicio = time.monotonic()
+        fim = inicio + duracao
+        threads = [
+            threading.Thread(
+                target=_executar_caixa,
+                args=(caixa, list(inicial), fim, random.Random(semente + numero), resultado, trava)
+            )
+            for numero, caixa in enumerate(registros)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        decorrido = time.monotonic() - inicio
+
+    db.session.expire_all()
+    violacoes = verificar_invariantes(farmacia_id, inicial, resultado['vendido'], resultado['incerto'])
+    situacoes = resultado['situacoes']
+    return {
+        'gerado_em': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'banco': db.engine.dialect.name,
+        'configuracao': {
+            'workers': workers, 'caixas': caixas, 'duracao_s': duracao, 'produtos': produtos, 'estoque': estoque
+        },
+        'farmacia_id': farmacia_id,
+        'decorrido_s': round(decorrido, 2),
+        'vendas_por_segundo': round(situacoes.get('sucesso', 0) / decorrido, 2),
+        'requisicoes_por_segundo': round((len(resultado['adicionar']) + len(resultado['finalizar'])) / decorrido, 2),
+        'latencia': {'adicionar': _latencias(resultado['adicionar']), 'finalizar': _latencias(resultado['finalizar'])},
+        'situacoes': situacoes,
+        'erros_de_bloqueio': situacoes.get('ocupado', 0) + situacoes.get('erro_500', 0) + situacoes.get('timeout', 0),
+        'unidades_vendidas': sum(resultado['vendido'].values()),
+        # Finalizações sem resposta e unidades que podem ou não ter sido baixadas
+        'vendas_sem_resposta': resultado['vendas_sem_resposta'],
+        'unidades_incertas': sum(resultado['incerto'].values()),
+        'violacoes': violacoes,
+    }
@@ -0,0 +1,92 @@
+import csv
+import heapq
+import io
+from datetime import timedelta
+from itertools import islice
+from flask import Response, stream_with_context
+import sqlalchemy as sa
+from app import app, db
+from app.models import Produto, ProdutoLog
+from app.arquivo_logs import LogArquivado, carregar_produtos, logs_arquivados
+
+CABECALHO_LOGS = ['Data', 'Produto', 'Código de Barras', 'Operação', 'Quantidade']
+CABECALHO_DEMANDAS = [
+    'Produto', 'Preço de Venda', 'Demanda Média Diária', 'Previsão Diária', 'Método de Previsão',
+    'Estoque de Segurança', 'Ponto de Reposição', 'Quantidade Máxima', 'Estoque Atual', 'Quantidade a Pedir',
+    'Tempo de Duração (dias)', 'Estoque Excedente'
+]
+
+
+def _csv(cabecalho, lotes):
+    # Um pedaço da resposta por lote: a memória não cresce com o tamanho da exportação
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    # BOM para o Excel reconhecer o UTF-8 (acentos)
+    buffer.write('\ufeff')
+    escritor.writerow(cabecalho)
+    for linhas in lotes:
+        escritor.writerows(linhas)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def resposta_csv(nome_arquivo, cabecalho, lotes):
+    return Response(
+        stream_with_context(_csv(cabecalho, lotes)),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename="{nome_arquivo}"'}
+    )
+
+
+def _linha_log(log):
+    # Linha da tabela viva (nome e código já no join) ou log arquivado (com log.produto carregado)
+    if isinstance(log, LogArquivado):
+        nome = log.produto.nome if log.produto else None
+        codigo_barras = log.produto.codigo_barras if log.produto else None
+    else:
+        nome, codigo_barras = log.nome, log.codigo_barras
+    return (
+        # Horário local (GMT-3), como na tela
+        (log.timestamp - timedelta(hours=3)).strftime('%Y-%m-%d %H:%M:%S') if log.timestamp else '',
+        nome if nome is not None else 'Produto Excluído',
+        codigo_barras if codigo_barras is not None else 'N/A',
+        log.operacao,
+        log.quantidade
+    )
+
+
+def lotes_logs(filtro):
+    """Logs filtrados em ordem cronológica, lidos em lotes com cursor no servidor.
+
+    Os logs arquivados (app.arquivo_logs) são intercalados com os da tabela pela ordem (timestamp, id).
+    """
+    tamanho = app.config['EXPORTACAO_LOTE']
+    vivos = db.session().execute(
+        sa.select(
+            ProdutoLog.timestamp, ProdutoLog.id, Produto.nome, Produto.codigo_barras,
+            ProdutoLog.operacao, ProdutoLog.quantidade
+        )
+        .join(Produto, Produto.id == ProdutoLog.produto_id, isouter=True)
+        .where(*filtro.condicoes())
+        .order_by(ProdutoLog.timestamp, ProdutoLog.id)
+        .execution_options(yield_per=tamanho)
+    )
+    logs = heapq.merge(vivos, logs_arquivados(filtro), key=lambda log: (log.timestamp, log.id))
+    while lote := list(islice(logs, tamanho)):
+        carregar_produtos([log for log in lote if isinstance(log, LogArquivado)])
+        yield [_linha_log(log) for log in lote]
+
+
+def lotes_demandas(demandas):
+    yield [
+        (
+            # Relatórios em cache gerados antes da previsão não têm essas colunas
+            demanda['nome'], demanda['preco_venda'], demanda['demanda_media_diaria'], demanda.get('previsao_diaria', ''),
+            demanda.get('metodo_previsao', ''), demanda['estoque_seguranca'],
+            demanda['ponto_reposicao'], demanda['quantidade_maxima'], demanda['estoque_atual'],
+            demanda['quantidade_a_pedir'], demanda['tempo_duracao'], 'sim' if demanda['estoque_excedente'] else 'não'
+        )
+        for demanda in demandas
+    ]
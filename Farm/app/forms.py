@@ -1,10 +1,12 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, BooleanField, SubmitField, FloatField, IntegerField, SelectField, HiddenField, DateField
-from wtforms.validators import DataRequired, Email, EqualTo, ValidationError, Length, NumberRange
+from flask_wtf.file import FileField, FileRequired, FileAllowed
+from wtforms import TextAreaField, StringField, PasswordField, BooleanField, SubmitField, FloatField, IntegerField, SelectField, HiddenField, DateField
+from wtforms.validators import DataRequired, Email, EqualTo, ValidationError, Length, NumberRange, Optional
 from app.models import User, Produto, Farmacia, Fornecedor, Fabricante
-from app import db
+from app import app, db
 import sqlalchemy as sa
 from flask import request
+from flask_login import current_user
 import re
 from datetime import datetime, timedelta
 
@@ -67,18 +69,41 @@ class ProdutoForm(FlaskForm):
     codigo_barras = StringField('Código de Barras', validators=[DataRequired(), Length(min=12, max=13)])
     submit = SubmitField('Enviar')
 
-    def __init__(self, original_nome=None, *args, **kwargs):
+    def __init__(self, original_nome=None, original_codigo_barras=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.original_nome = original_nome
+        self.original_codigo_barras = original_codigo_barras
+
+    def validate_codigo_barras(self, codigo_barras):
+        if codigo_barras.data == self.original_codigo_barras:
+            return
+        produto = db.session().scalar(sa.select(Produto).where(
+            Produto.farmacia_id == current_user.farmacia_id,
+            Produto.codigo_barras == codigo_barras.data
+        ))
+        if produto is not None:
+            raise ValidationError('Já existe um produto com esse código de barras nesta farmácia.')
+
+class ImportarCatalogoForm(FlaskForm):
+    arquivo = FileField('Arquivo CSV', validators=[FileRequired(), FileAllowed(['csv'], 'Envie um arquivo .csv.')])
+    submit = SubmitField('Importar')
 
 class FiltroProdutoForm(FlaskForm):
     nome = StringField('Nome do Produto')
     genero = StringField('Gênero')
+    grupo = StringField('Grupo')
     tipo = SelectField('Tipo', choices=[('', 'Todos'), ('Generico', 'Genérico'), ('Original', 'Original'), ('Outros', 'Outros')])
     fabricante_id = IntegerField('ID do Fabricante', default=None)
     codigo_barras = StringField('Código de Barras')
     submit = SubmitField('Filtrar')
 
+class FiltroLogForm(FlaskForm):
+    operacao = SelectField('Operação', choices=[('', 'Todas'), ('adicionado', 'Adicionado'), ('removido', 'Removido'), ('editado', 'Editado')])
+    produto = StringField('Produto')
+    log_de = DateField('De', validators=[Optional()])
+    log_ate = DateField('Até', validators=[Optional()])
+    submit = SubmitField('Filtrar')
+
 class FiltroVendaForm(FlaskForm):
     nome = StringField('Nome do Produto')
     codigo_barras = StringField('Código de Barras')
@@ -96,6 +121,10 @@ class AddQuantidadeForm(FlaskForm):
     submit = SubmitField('Adicionar Quantidade')
 
     def validate_data_validade(self, field):
-        min_date = datetime.now().date() + timedelta(weeks=2)
+        min_date = datetime.now().date() + timedelta(days=app.config['VALIDADE_MINIMA_DIAS'])
         if field.data < min_date:
-            raise ValidationError('Não foi possível adicionar a quantidade pois a data de validade é muito baixa (mínimo 2 semanas a partir de hoje). Verifique novamente ou entre em contato com o fornecedor.')
\ No newline at end of file
+            raise ValidationError(f'Não foi possível adicionar a quantidade pois a data de validade é muito baixa (mínimo {app.config["VALIDADE_MINIMA_DIAS"]} dias a partir de hoje). Verifique novamente ou entre em contato com o fornecedor.')
+
+class RecebimentoForm(FlaskForm):
+    itens = TextAreaField('Itens da Nota', validators=[DataRequired()])
+    submit = SubmitField('Receber Nota')
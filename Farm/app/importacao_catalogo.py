@@ -0,0 +1,220 @@
+import csv
+import io
+import re
+from types import SimpleNamespace
+import sqlalchemy as sa
+from app import app, db
+from app.models import Estoque, Fabricante, Fornecedor, Produto
+from app.busca import indexar_produtos
+from app.checkout import com_tentativas
+from app.alertas import invalidar_alertas
+from app.cache_relatorios import registrar_alteracao_dados
+from app.resumo import registrar_logs
+
+# Importação do catálogo por CSV: uma linha por produto, identificado na farmácia pelo código
+# de barras. Produtos novos são inseridos e os existentes atualizados, com fabricantes,
+# fornecedores e estoques criados em lote; cada bloco de linhas é uma transação.
+
+COLUNAS = [
+    'nome', 'genero', 'tipo', 'numeracao_original', 'grupo', 'fabricante_id', 'quantidade_embalagem',
+    'fornecedor_id', 'preco_compra', 'preco_venda', 'codigo_barras'
+]
+OBRIGATORIAS = [coluna for coluna in COLUNAS if coluna != 'numeracao_original']
+TIPOS = {'generico': 'Generico', 'genérico': 'Generico', 'original': 'Original', 'outros': 'Outros'}
+TAMANHOS = {'nome': 100, 'genero': 100, 'grupo': 50}
+# 1.234.567 sem vírgula: só pontos de milhar (1.234 continua sendo decimal)
+MILHARES = re.compile(r'-?\d{1,3}(\.\d{3}){2,}')
+
+
+class CatalogoInvalido(ValueError):
+    pass
+
+
+class ResultadoImportacao:
+    def __init__(self):
+        self.inseridos = 0
+        self.atualizados = 0
+        self.fabricantes = 0
+        self.fornecedores = 0
+        self.erros = []  # (linha do arquivo, [mensagens])
+
+    @property
+    def linhas_com_erro(self):
+        return len(self.erros)
+
+
+def ler_csv(dados):
+    """Linhas (número da linha no arquivo, dicionário) de um CSV em bytes, separado por vírgula ou ponto e vírgula."""
+    try:
+        texto = dados.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        # Planilhas salvas pelo Excel em português
+        texto = dados.decode('cp1252')
+    primeira = texto.split('\n', 1)[0]
+    leitor = csv.DictReader(io.StringIO(texto), delimiter=';' if primeira.count(';') > primeira.count(',') else ',')
+    if leitor.fieldnames is None:
+        raise CatalogoInvalido('Arquivo vazio.')
+    leitor.fieldnames = [campo.strip().lower() for campo in leitor.fieldnames]
+    faltando = [coluna for coluna in OBRIGATORIAS if coluna not in leitor.fieldnames]
+    if faltando:
+        raise CatalogoInvalido(f'Colunas ausentes no cabeçalho: {", ".join(faltando)}.')
+    return [(leitor.line_num, linha) for linha in leitor]
+
+
+def _inteiro(valor):
+    return int(valor)
+
+
+def _decimal(valor):
+    # Aceita o formato brasileiro, com vírgula decimal e ponto de milhar (12,50 e 1.234,56)
+    if ',' in valor:
+        if valor.rfind('.') > valor.rfind(','):
+            # 1,234.56: vírgula de milhar
+            return float(valor.replace(',', ''))
+        return float(valor.replace('.', '').replace(',', '.'))
+    if MILHARES.fullmatch(valor):
+        return float(valor.replace('.', ''))
+    return float(valor)
+
+
+def _validar(linha):
+    # Mesmas regras do ProdutoForm; devolve os valores do produto ou a lista de erros
+    valores = {}
+    erros = []
+    campos = {coluna: (linha.get(coluna) or '').strip() for coluna in COLUNAS}
+    for coluna in OBRIGATORIAS:
+        if not campos[coluna]:
+            erros.append(f'{coluna}: obrigatório')
+    for coluna, tamanho in TAMANHOS.items():
+        if campos[coluna]:
+            if len(campos[coluna]) > tamanho:
+                erros.append(f'{coluna}: no máximo {tamanho} caracteres')
+            valores[coluna] = campos[coluna]
+    if campos['tipo']:
+        if campos['tipo'].lower() not in TIPOS:
+            erros.append('tipo: use Generico, Original ou Outros')
+        else:
+            valores['tipo'] = TIPOS[campos['tipo'].lower()]
+    for coluna, conversao in (
+        ('numeracao_original', _inteiro), ('fabricante_id', _inteiro), ('quantidade_embalagem', _inteiro),
+        ('fornecedor_id', _inteiro), ('preco_compra', _decimal), ('preco_venda', _decimal)
+    ):
+        if not campos[coluna]:
+            valores[coluna] = None
+            continue
+        try:
+            valores[coluna] = conversao(campos[coluna])
+        except ValueError:
+            erros.append(f'{coluna}: número inválido')
+            continue
+        if coluna != 'numeracao_original' and valores[coluna] <= 0:
+            erros.append(f'{coluna}: deve ser maior que zero')
+    codigo_barras = campos['codigo_barras']
+    if codigo_barras and not 12 <= len(codigo_barras) <= 13:
+        erros.append('codigo_barras: deve ter 12 ou 13 caracteres')
+    valores['codigo_barras'] = codigo_barras
+    if erros:
+        raise CatalogoInvalido(erros)
+    return valores
+
+
+def _criar_faltantes(modelo, ids):
+    # Fabricantes e fornecedores são só o id; os que não existem são criados de uma vez
+    ids = set(ids)
+    existentes = set(db.session().scalars(sa.select(modelo.id).where(modelo.id.in_(ids)))) if ids else set()
+    novos = sorted(ids - existentes)
+    if novos:
+        db.session.execute(sa.insert(modelo), [{'id': id} for id in novos])
+    return len(novos)
+
+
+def _existentes(farmacia_id, codigos_barras):
+    # {código de barras: id} dos produtos que a farmácia já tem
+    return dict(db.session.execute(
+        sa.select(Produto.codigo_barras, Produto.id)
+        .where(Produto.farmacia_id == farmacia_id)
+        .where(Produto.codigo_barras.in_(codigos_barras))
+    ).all())
+
+
+def _aplicar_com_tentativas(farmacia_id, bloco, resultado):
+    # Outra importação pode inserir o mesmo código de barras entre a leitura dos existentes e o
+    # INSERT; o índice único recusa o bloco, que é refeito e passa a atualizar o produto dela
+    tentativas = app.config['CHECKOUT_TENTATIVAS']
+    for tentativa in range(tentativas):
+        try:
+            return com_tentativas(lambda: _aplicar_bloco(farmacia_id, bloco, resultado))
+        except sa.exc.IntegrityError:
+            db.session.rollback()
+            if tentativa == tentativas - 1:
+                raise
+
+
+def _aplicar_bloco(farmacia_id, bloco, resultado):
+    """Grava um bloco de produtos válidos em uma transação."""
+    fabricantes = _criar_faltantes(Fabricante, (valores['fabricante_id'] for valores in bloco))
+    fornecedores = _criar_faltantes(Fornecedor, (valores['fornecedor_id'] for valores in bloco))
+
+    existentes = _existentes(farmacia_id, [valores['codigo_barras'] for valores in bloco])
+    atualizar = [dict(valores, produto_id=existentes[valores['codigo_barras']]) for valores in bloco if valores['codigo_barras'] in existentes]
+    inserir = [dict(valores, farmacia_id=farmacia_id) for valores in bloco if valores['codigo_barras'] not in existentes]
+    # Core (tabela) em vez do bulk do ORM, que processa cada linha como objeto
+    tabela = Produto.__table__
+    if atualizar:
+        db.session.execute(sa.update(tabela).where(tabela.c.id == sa.bindparam('produto_id')), atualizar)
+        # Log de edição, como em edit_produto, com o saldo atual de cada produto
+        saldos = dict(db.session.execute(
+            sa.select(Estoque.produto_id, sa.func.sum(Estoque.quantidade))
+            .where(Estoque.produto_id.in_([valores['produto_id'] for valores in atualizar]))
+            .group_by(Estoque.produto_id)
+        ).all())
+        registrar_logs(farmacia_id, [
+            {'produto_id': valores['produto_id'], 'quantidade': saldos.get(valores['produto_id'], 0), 'operacao': 'editado'}
+            for valores in atualizar
+        ])
+    novos = []
+    if inserir:
+        novos = db.session.execute(
+            sa.insert(tabela).returning(Produto.id, Produto.codigo_barras), inserir
+        ).all()
+        db.session.execute(sa.insert(Estoque.__table__), [
+            {'farmacia_id': farmacia_id, 'produto_id': produto_id, 'quantidade': 0} for produto_id, _ in novos
+        ])
+    ids = dict(existentes, **{codigo_barras: produto_id for produto_id, codigo_barras in novos})
+    indexar_produtos(SimpleNamespace(id=ids[valores['codigo_barras']], **valores) for valores in bloco)
+    invalidar_alertas(farmacia_id)
+    registrar_alteracao_dados(farmacia_id)
+    db.session.commit()
+
+    resultado.atualizados += len(atualizar)
+    resultado.inseridos += len(inserir)
+    resultado.fabricantes += fabricantes
+    resultado.fornecedores += fornecedores
+
+
+def importar_catalogo(farmacia_id, linhas):
+    """Importa as linhas (número, dicionário) de ler_csv no catálogo da farmácia.
+
+    Linhas inválidas ficam de fora e entram em `erros` com o número da linha no arquivo;
+    um código de barras repetido no arquivo vale só na primeira ocorrência.
+    """
+    resultado = ResultadoImportacao()
+    validas = []
+    vistos = {}
+    for numero, linha in linhas:
+        try:
+            valores = _validar(linha)
+        except CatalogoInvalido as erro:
+            resultado.erros.append((numero, erro.args[0]))
+            continue
+        if valores['codigo_barras'] in vistos:
+            resultado.erros.append((numero, [f'codigo_barras: repetido (linha {vistos[valores["codigo_barras"]]})']))
+            continue
+        vistos[valores['codigo_barras']] = numero
+        validas.append(valores)
+
+    tamanho = app.config['CATALOGO_LOTE_TRANSACAO']
+    for inicio in range(0, len(validas), tamanho):
+        bloco = validas[inicio:inicio + tamanho]
+        _aplicar_com_tentativas(farmacia_id, bloco, resultado)
+    return resultado
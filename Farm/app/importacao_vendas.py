@@ -0,0 +1,142 @@
+import json
+from datetime import timezone
+from dateutil import parser
+import sqlalchemy as sa
+from app import app, db
+from app.models import VendaImportada
+from app.busca import resolver_codigos
+from app.checkout import baixar_vendas, com_tentativas
+from app.alertas import invalidar_alertas
+from app.cache_relatorios import registrar_alteracao_dados
+
+
+class VendaInvalida(ValueError):
+    pass
+
+
+def _timestamp_utc(valor):
+    # ISO 8601; sem fuso é tratado como UTC, como ProdutoLog.timestamp
+    try:
+        timestamp = parser.isoparse(valor)
+    except (TypeError, ValueError):
+        raise VendaInvalida('timestamp inválido (use ISO 8601)')
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def _validar(venda, codigos):
+    if not isinstance(venda, dict):
+        raise VendaInvalida('venda deve ser um objeto')
+    chave = venda.get('chave')
+    if not isinstance(chave, str) or not 0 < len(chave) <= 64:
+        raise VendaInvalida('chave de idempotência ausente ou maior que 64 caracteres')
+    timestamp = _timestamp_utc(venda.get('timestamp'))
+    itens_brutos = venda.get('itens')
+    if not isinstance(itens_brutos, list) or not itens_brutos:
+        raise VendaInvalida('itens ausentes')
+    itens = {}
+    for item in itens_brutos:
+        quantidade = item.get('quantidade') if isinstance(item, dict) else None
+        if not isinstance(quantidade, int) or isinstance(quantidade, bool) or quantidade <= 0:
+            raise VendaInvalida('quantidade deve ser um inteiro maior que zero')
+        if isinstance(item.get('produto_id'), int):
+            produto_id = item['produto_id']
+        elif item.get('codigo_barras') in codigos:
+            produto_id = codigos[item['codigo_barras']]['produto_id']
+        else:
+            raise VendaInvalida(f'produto não encontrado: {item.get("produto_id") or item.get("codigo_barras")}')
+        itens[produto_id] = itens.get(produto_id, 0) + quantidade
+    return chave, timestamp, itens
+
+
+def _chaves_existentes(farmacia_id, chaves):
+    return {
+        venda.chave: json.loads(venda.resultado)
+        for venda in db.session().scalars(
+            sa.select(VendaImportada)
+            .where(VendaImportada.farmacia_id == farmacia_id)
+            .where(VendaImportada.chave.in_(chaves))
+        )
+    }
+
+
+def _aplicar_bloco(farmacia_id, bloco):
+    """Baixa um bloco de vendas válidas em uma transação; devolve {chave: resultado}."""
+    existentes = _chaves_existentes(farmacia_id, [chave for chave, _, _ in bloco])
+    novas = [venda for venda in bloco if venda[0] not in existentes]
+    resultados = {chave: dict(resultado, status='duplicada') for chave, resultado in existentes.items()}
+    if not novas:
+        db.session.rollback()
+        return resultados
+
+    faltas_por_venda = baixar_vendas(farmacia_id, [(itens, timestamp) for _, timestamp, itens in novas])
+    registros = []
+    for (chave, timestamp, _), faltas in zip(novas, faltas_por_venda):
+        resultado = {
+            'chave': chave,
+            'status': 'sem_estoque' if faltas else 'registrada',
+            'faltas': [
+                {'produto_id': falta.produto_id, 'nome': falta.nome,
+                 'solicitado': falta.solicitado, 'disponivel': falta.disponivel}
+                for falta in faltas
+            ]
+        }
+        resultados[chave] = resultado
+        registros.append({
+            'farmacia_id': farmacia_id, 'chave': chave, 'timestamp_cliente': timestamp,
+            'status': resultado['status'], 'resultado': json.dumps(resultado)
+        })
+    db.session.execute(sa.insert(VendaImportada), registros)
+    invalidar_alertas(farmacia_id)
+    registrar_alteracao_dados(farmacia_id)
+    db.session.commit()
+    return resultados
+
+
+def importar_vendas(farmacia_id, vendas):
+    """Aplica um lote de vendas offline, em ordem de timestamp, e devolve um resultado por venda.
+
+    Vendas já recebidas (mesma chave) não são reaplicadas: devolvem o resultado gravado com
+    status 'duplicada'. Vendas sem estoque ficam gravadas como 'sem_estoque' e também não
+    são reaplicadas no reenvio.
+    """
+    codigos = resolver_codigos(farmacia_id, [
+        item['codigo_barras']
+        for venda in vendas if isinstance(venda, dict) and isinstance(venda.get('itens'), list)
+        for item in venda['itens'] if isinstance(item, dict) and isinstance(item.get('codigo_barras'), str)
+    ])
+
+    resultados = [None] * len(vendas)
+    validas = []
+    vistas = set()
+    for posicao, venda in enumerate(vendas):
+        try:
+            chave, timestamp, itens = _validar(venda, codigos)
+        except VendaInvalida as erro:
+            resultados[posicao] = {'chave': venda.get('chave') if isinstance(venda, dict) else None,
+                                   'status': 'invalida', 'erro': str(erro)}
+            continue
+        if chave in vistas:
+            resultados[posicao] = {'chave': chave, 'status': 'invalida', 'erro': 'chave repetida no lote'}
+            continue
+        vistas.add(chave)
+        validas.append((timestamp, posicao, chave, itens))
+
+    validas.sort()
+    posicoes = {chave: posicao for _, posicao, chave, _ in validas}
+    tamanho = app.config['VENDAS_LOTE_TRANSACAO']
+    for inicio in range(0, len(validas), tamanho):
+        bloco = [(chave, timestamp, itens) for timestamp, _, chave, itens in validas[inicio:inicio + tamanho]]
+
+        def operacao():
+            try:
+                return _aplicar_bloco(farmacia_id, bloco)
+            except sa.exc.IntegrityError:
+                # Outro envio gravou as mesmas chaves ao mesmo tempo: reler e aplicar o restante
+                db.session.rollback()
+                return _aplicar_bloco(farmacia_id, bloco)
+
+        for chave, resultado in com_tentativas(operacao).items():
+            resultados[posicoes[chave]] = resultado
+    return resultados
@@ -0,0 +1,133 @@
+import re
+import threading
+import time
+from collections import Counter, deque
+import sqlalchemy as sa
+from flask import g, has_app_context, request
+from app import app
+
+# Instrumentação do SQL por requisição: número de comandos e tempo no banco, comandos repetidos
+# com a mesma forma (N+1) e o cabeçalho Server-Timing. Com INSTRUMENTACAO_SQL=0 nada disso é
+# registrado: os listeners nem são instalados.
+
+_ativa = {'instalada': False}
+_resumo = {}
+_resumo_lock = threading.Lock()
+
+_ESPACOS = re.compile(r'\s+')
+_LISTA_PARAMETROS = re.compile(r'\?(?:\s*,\s*\?)+|%\(\w+\)s(?:\s*,\s*%\(\w+\)s)+')
+_LITERAIS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+def forma(comando):
+    """Forma do comando: sem literais, espaços repetidos e tamanho das listas de IN."""
+    comando = _ESPACOS.sub(' ', comando).strip()
+    comando = _LISTA_PARAMETROS.sub('?, ...', comando)
+    return _LITERAIS.sub('?', comando)
+
+
+def _coletando():
+    return has_app_context() and g.get('sql') is not None
+
+
+def _antes(conexao, cursor, comando, parametros, contexto, executemany):
+    if _coletando():
+        conexao.info.setdefault('instrumentacao_inicio', []).append(time.perf_counter())
+
+
+def _depois(conexao, cursor, comando, parametros, contexto, executemany):
+    inicios = conexao.info.get('instrumentacao_inicio')
+    if not inicios or not _coletando():
+        return
+    duracao = time.perf_counter() - inicios.pop()
+    sql = g.sql
+    sql['comandos'] += 1
+    sql['tempo'] += duracao
+    sql['formas'][forma(comando)] += 1
+
+
+def _erro(contexto):
+    # Comando que falhou não passa pelo after_cursor_execute
+    conexao = contexto.connection
+    if conexao is not None and conexao.info.get('instrumentacao_inicio'):
+        conexao.info['instrumentacao_inicio'].pop()
+
+
+class ResumoEndpoint:
+    """Janela das últimas requisições de um endpoint neste processo."""
+
+    def __init__(self, tamanho):
+        self.requisicoes = deque(maxlen=tamanho)  # (duração, comandos, tempo no banco, N+1)
+        self.total = 0
+        self.ultimo_n1 = None
+
+    def registrar(self, duracao, comandos, tempo, repetidos):
+        self.requisicoes.append((duracao, comandos, tempo, bool(repetidos)))
+        self.total += 1
+        if repetidos:
+            self.ultimo_n1 = repetidos[0]
+
+    def estatisticas(self):
+        duracoes = sorted(duracao for duracao, _, _, _ in self.requisicoes)
+        n = len(duracoes)
+        return {
+            'requisicoes': self.total,
+            'janela': n,
+            'duracao_media_ms': sum(duracoes) / n * 1000,
+            'duracao_p95_ms': duracoes[min(n - 1, int(n * 0.95))] * 1000,
+            'comandos_medio': sum(comandos for _, comandos, _, _ in self.requisicoes) / n,
+            'comandos_maximo': max(comandos for _, comandos, _, _ in self.requisicoes),
+            'banco_medio_ms': sum(tempo for _, _, tempo, _ in self.requisicoes) / n * 1000,
+            'com_n1': sum(1 for *_, n1 in self.requisicoes if n1),
+            'ultimo_n1': self.ultimo_n1,
+        }
+
+
+def resumo_endpoints():
+    """Estatísticas por endpoint, do mais lento (tempo médio) para o mais rápido."""
+    with _resumo_lock:
+        estatisticas = [dict(resumo.estatisticas(), endpoint=endpoint) for endpoint, resumo in _resumo.items()]
+    return sorted(estatisticas, key=lambda linha: linha['duracao_media_ms'], reverse=True)
+
+
+def _iniciar_requisicao():
+    g.sql = {'comandos': 0, 'tempo': 0.0, 'formas': Counter(), 'inicio': time.perf_counter()}
+
+
+def _finalizar_requisicao(resposta):
+    sql = g.pop('sql', None)
+    if sql is None:
+        return resposta
+    duracao = time.perf_counter() - sql['inicio']
+    limite = app.config['INSTRUMENTACAO_N1_LIMITE']
+    repetidos = [(comando, vezes) for comando, vezes in sql['formas'].most_common() if vezes >= limite]
+    endpoint = request.endpoint or request.path
+    for comando, vezes in repetidos:
+        app.logger.warning('Possível N+1 em %s: %d comandos com a forma %s', endpoint, vezes, comando[:300])
+    # Respostas em streaming (exportações CSV) contam só o SQL emitido antes do primeiro pedaço
+    resposta.headers.add(
+        'Server-Timing',
+        f'db;dur={sql["tempo"] * 1000:.1f};desc="{sql["comandos"]} comandos", app;dur={duracao * 1000:.1f}'
+    )
+    with _resumo_lock:
+        resumo = _resumo.get(endpoint)
+        if resumo is None:
+            resumo = _resumo[endpoint] = ResumoEndpoint(app.config['INSTRUMENTACAO_JANELA'])
+        resumo.registrar(duracao, sql['comandos'], sql['tempo'], repetidos)
+    return resposta
+
+
+def ativar():
+    """Instala os listeners em todos os engines e os ganchos da requisição (uma vez por processo)."""
+    if _ativa['instalada']:
+        return
+    _ativa['instalada'] = True
+    sa.event.listen(sa.engine.Engine, 'before_cursor_execute', _antes)
+    sa.event.listen(sa.engine.Engine, 'after_cursor_execute', _depois)
+    sa.event.listen(sa.engine.Engine, 'handle_error', _erro)
+    app.before_request_funcs.setdefault(None, []).insert(0, _iniciar_requisicao)
+    app.after_request_funcs.setdefault(None, []).append(_finalizar_requisicao)
+
+
+if app.config['INSTRUMENTACAO_SQL']:
+    ativar()
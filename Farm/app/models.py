@@ -1,4 +1,4 @@
-from datetime import datetime, timezone
+from datetime import date, datetime, timezone
 from typing import Optional
 import sqlalchemy as sa
 import sqlalchemy.orm as so
@@ -12,6 +12,7 @@ class User(UserMixin, db.Model):
     email: so.Mapped[str] = so.mapped_column(sa.String(120), index=True, unique=True)
     password_hash: so.Mapped[Optional[str]] = so.mapped_column(sa.String(256))
     farmacia_id: so.Mapped[Optional[int]] = so.mapped_column(sa.ForeignKey('farmacia.id'), index=True)
+    administrador: so.Mapped[bool] = so.mapped_column(default=False, server_default=sa.false())  # Acesso aos relatórios da rede
 
     farmacia: so.Mapped[Optional['Farmacia']] = so.relationship(back_populates='users')
 
@@ -31,6 +32,8 @@ class Farmacia(db.Model):
     telefone: so.Mapped[Optional[str]] = so.mapped_column(sa.String(20))
     cep: so.Mapped[str] = so.mapped_column(sa.String(9), nullable=False)
     cnpj: so.Mapped[str] = so.mapped_column(sa.String(14), nullable=False)
+    alertas_atualizados_em: so.Mapped[Optional[datetime]] = so.mapped_column()
+    versao_dados: so.Mapped[int] = so.mapped_column(default=0, server_default='0')  # Muda a cada escrita no estoque
     farmaceuticos: so.WriteOnlyMapped['Farmaceutico'] = so.relationship(
         back_populates='farmacia',
         cascade="all, delete-orphan",
@@ -79,7 +82,7 @@ class Vendedor(db.Model):
 
 class Produto(db.Model):
     id: so.Mapped[int] = so.mapped_column(primary_key=True)
-    nome: so.Mapped[str] = so.mapped_column(sa.String(100))
+    nome: so.Mapped[str] = so.mapped_column(sa.String(100), index=True)
     genero: so.Mapped[str] = so.mapped_column(sa.String(100), nullable=False)
     tipo: so.Mapped[str] = so.mapped_column(sa.String(20), nullable=False)
     numeracao_original: so.Mapped[Optional[int]] = so.mapped_column()
@@ -88,8 +91,9 @@ class Produto(db.Model):
     quantidade_embalagem: so.Mapped[int] = so.mapped_column(nullable=False)
     fornecedor_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey('fornecedor.id'), nullable=False)
     preco_compra: so.Mapped[float] = so.mapped_column(nullable=False)
-    preco_venda: so.Mapped[float] = so.mapped_column(nullable=False)
+    preco_venda: so.Mapped[float] = so.mapped_column(nullable=False, index=True)
     codigo_barras: so.Mapped[str] = so.mapped_column(sa.String(13), nullable=False)
+    farmacia_id: so.Mapped[Optional[int]] = so.mapped_column(sa.ForeignKey('farmacia.id'))
     fornecedor: so.Mapped['Fornecedor'] = so.relationship(back_populates='produtos')
     fabricante: so.Mapped['Fabricante'] = so.relationship(back_populates='produtos')
     estoques: so.WriteOnlyMapped['Estoque'] = so.relationship(
@@ -108,29 +112,52 @@ class Produto(db.Model):
         passive_deletes=True
     )
 
+    # Leitura do código de barras no caixa: busca exata por farmácia
+    __table_args__ = (
+        sa.Index('ix_produto_farmacia_id_codigo_barras', 'farmacia_id', 'codigo_barras', unique=True),
+    )
+
     @property
     def quantidade(self):
-        validades = db.session().scalars(
-            sa.select(Validade).where(Validade.produto_id == self.id)
-        ).all()
-        return sum(validade.quantidade for validade in validades) if validades else 0
+        # Saldo mantido em Estoque a cada escrita de Validade (ver app.saldos)
+        return db.session().scalar(
+            sa.select(sa.func.coalesce(sa.func.sum(Estoque.quantidade), 0))
+            .where(Estoque.produto_id == self.id)
+        )
 
 class Estoque(db.Model):
     id: so.Mapped[int] = so.mapped_column(primary_key=True)
     farmacia_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey('farmacia.id'))
-    produto_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey('produto.id'))
+    produto_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey('produto.id'), index=True)
     quantidade: so.Mapped[int] = so.mapped_column(default=0)
+    validade_proxima: so.Mapped[Optional[datetime]] = so.mapped_column()
     farmacia: so.Mapped['Farmacia'] = so.relationship(back_populates='estoques')
     produto: so.Mapped['Produto'] = so.relationship(back_populates='estoques')
 
+    # Índices das ordenações por cursor do /stock; um só estoque por produto na farmácia
+    __table_args__ = (
+        sa.Index('ix_estoque_farmacia_id_produto_id', 'farmacia_id', 'produto_id', unique=True),
+        sa.Index('ix_estoque_farmacia_id_quantidade', 'farmacia_id', 'quantidade'),
+        sa.Index('ix_estoque_farmacia_id_validade_proxima', 'farmacia_id', 'validade_proxima'),
+    )
+
 class ProdutoLog(db.Model):
     id: so.Mapped[int] = so.mapped_column(primary_key=True)
     produto_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey('produto.id'), nullable=False)
+    farmacia_id: so.Mapped[Optional[int]] = so.mapped_column(sa.ForeignKey('farmacia.id', name='fk_produto_log_farmacia_id'))
     quantidade: so.Mapped[int] = so.mapped_column(nullable=False)
     timestamp: so.Mapped[datetime] = so.mapped_column(default=lambda: datetime.now(timezone.utc))
     operacao: so.Mapped[str] = so.mapped_column(sa.String(20), nullable=False)  # Novo campo para operação
     produto: so.Mapped['Produto'] = so.relationship(back_populates='logs')
 
+    __table_args__ = (
+        # Listagem por cursor (timestamp, id) do histórico da farmácia, com ou sem filtro de produto
+        sa.Index('ix_produto_log_farmacia_id_timestamp_id', 'farmacia_id', 'timestamp', 'id'),
+        sa.Index('ix_produto_log_farmacia_id_produto_id_timestamp_id', 'farmacia_id', 'produto_id', 'timestamp', 'id'),
+        # Histórico de um produto (exclusão, resumo diário), independente da farmácia
+        sa.Index('ix_produto_log_produto_id_timestamp', 'produto_id', 'timestamp'),
+    )
+
 class Validade(db.Model):
     id: so.Mapped[int] = so.mapped_column(primary_key=True)
     produto_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey('produto.id'), nullable=False)
@@ -138,6 +165,105 @@ class Validade(db.Model):
     quantidade: so.Mapped[int] = so.mapped_column(nullable=False)
     produto: so.Mapped['Produto'] = so.relationship(back_populates='validades')
 
+    # Lotes de um produto em ordem de vencimento (FEFO, saldo e validade próxima)
+    __table_args__ = (
+        sa.Index('ix_validade_produto_id_data_validade', 'produto_id', 'data_validade'),
+    )
+
+class Alerta(db.Model):
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    farmacia_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey('farmacia.id'), index=True)
+    produto_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey('produto.id'), index=True)
+    tipo: so.Mapped[str] = so.mapped_column(sa.String(20))  # estoque_zerado, validade_proxima, estoque_excedente
+    mensagem: so.Mapped[str] = so.mapped_column(sa.String(300))
+    criado_em: so.Mapped[datetime] = so.mapped_column(default=lambda: datetime.now(timezone.utc))
+
+class ItemCarrinho(db.Model):
+    # Carrinho do caixa guardado no servidor; cada item reserva estoque até expira_em
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    farmacia_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey('farmacia.id'))
+    user_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey('user.id'))
+    caixa: so.Mapped[str] = so.mapped_column(sa.String(40))
+    produto_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey('produto.id'))
+    quantidade: so.Mapped[int] = so.mapped_column()
+    expira_em: so.Mapped[datetime] = so.mapped_column(index=True)
+
+    __table_args__ = (
+        sa.Index('ix_item_carrinho_user_id_caixa_produto_id', 'user_id', 'caixa', 'produto_id', unique=True),
+        sa.Index('ix_item_carrinho_produto_id_expira_em', 'produto_id', 'expira_em'),
+    )
+
+class VendaImportada(db.Model):
+    # Vendas recebidas em lote dos caixas offline; a chave garante que o reenvio não baixe de novo
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    farmacia_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey('farmacia.id'))
+    chave: so.Mapped[str] = so.mapped_column(sa.String(64))
+    timestamp_cliente: so.Mapped[datetime] = so.mapped_column()
+    status: so.Mapped[str] = so.mapped_column(sa.String(20))  # registrada, sem_estoque
+    resultado: so.Mapped[str] = so.mapped_column(sa.Text)  # JSON devolvido ao caixa
+    recebida_em: so.Mapped[datetime] = so.mapped_column(default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        sa.Index('ix_venda_importada_farmacia_id_chave', 'farmacia_id', 'chave', unique=True),
+    )
+
+class ResumoDiario(db.Model):
+    # Movimento consolidado por farmácia, produto e dia (GMT-3), mantido junto com cada ProdutoLog
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    farmacia_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey('farmacia.id'))
+    produto_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey('produto.id'))
+    dia: so.Mapped[date] = so.mapped_column()
+    adicionado: so.Mapped[int] = so.mapped_column(default=0)  # Soma das quantidades dos logs 'adicionado'
+    removido: so.Mapped[int] = so.mapped_column(default=0)  # Soma das quantidades dos logs 'removido'
+    saidas: so.Mapped[int] = so.mapped_column(default=0)  # Número de logs 'removido'
+    edicoes: so.Mapped[int] = so.mapped_column(default=0)  # Número de logs 'editado'
+    variacao: so.Mapped[int] = so.mapped_column(default=0)  # Variação líquida do saldo no dia
+    saldo_final: so.Mapped[int] = so.mapped_column(default=0)  # Saldo ao fim do dia
+
+    __table_args__ = (
+        sa.Index('ix_resumo_diario_farmacia_id_produto_id_dia', 'farmacia_id', 'produto_id', 'dia', unique=True),
+    )
+
+class TarefaRelatorio(db.Model):
+    # Relatório calculado em segundo plano; a tabela é compartilhada para que qualquer worker responda o andamento
+    id: so.Mapped[str] = so.mapped_column(sa.String(32), primary_key=True)
+    farmacia_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey('farmacia.id'), index=True)
+    tipo: so.Mapped[str] = so.mapped_column(sa.String(20))
+    chave: so.Mapped[str] = so.mapped_column(sa.String(64), unique=True)  # Tarefas idênticas têm a mesma chave
+    parametros: so.Mapped[str] = so.mapped_column(sa.Text)  # JSON
+    status: so.Mapped[str] = so.mapped_column(sa.String(20), default='pendente')  # pendente, executando, concluida, erro
+    progresso: so.Mapped[int] = so.mapped_column(default=0)
+    resultado: so.Mapped[Optional[str]] = so.mapped_column(sa.Text)  # JSON
+    erro: so.Mapped[Optional[str]] = so.mapped_column(sa.String(300))
+    criada_em: so.Mapped[datetime] = so.mapped_column(default=lambda: datetime.now(timezone.utc))
+    atualizada_em: so.Mapped[Optional[datetime]] = so.mapped_column()  # Batimento: última notícia do worker que executa
+    concluida_em: so.Mapped[Optional[datetime]] = so.mapped_column()
+
+class ArquivoLog(db.Model):
+    # Manifesto do arquivo frio: um arquivo .csv.gz por farmácia e mês com os logs tirados de produto_log
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    farmacia_id: so.Mapped[Optional[int]] = so.mapped_column(sa.ForeignKey('farmacia.id'))
+    mes: so.Mapped[date] = so.mapped_column()  # Primeiro dia do mês (UTC)
+    caminho: so.Mapped[str] = so.mapped_column(sa.String(300))  # Relativo a ARQUIVO_LOGS_PASTA
+    linhas: so.Mapped[int] = so.mapped_column()
+    primeiro: so.Mapped[datetime] = so.mapped_column()  # Timestamp do log mais antigo do arquivo
+    ultimo: so.Mapped[datetime] = so.mapped_column()  # Timestamp do log mais recente do arquivo
+    sha256: so.Mapped[str] = so.mapped_column(sa.String(64))
+    arquivado_em: so.Mapped[datetime] = so.mapped_column(default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        sa.Index('ix_arquivo_log_farmacia_id_mes', 'farmacia_id', 'mes', unique=True),
+    )
+
+
+class ArquivoLogContagem(db.Model):
+    # Linhas de cada arquivo do manifesto por produto e operação, para contar o histórico sem abrir os arquivos
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    arquivo_log_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey('arquivo_log.id', ondelete='CASCADE'), index=True)
+    produto_id: so.Mapped[int] = so.mapped_column()  # Sem chave estrangeira: o produto pode ter sido excluído
+    operacao: so.Mapped[str] = so.mapped_column(sa.String(20))
+    linhas: so.Mapped[int] = so.mapped_column()
+
 @login.user_loader
 def load_user(id):
     return db.session.get(User, int(id))
\ No newline at end of file
@@ -0,0 +1,79 @@
+import base64
+import binascii
+import heapq
+import json
+from datetime import datetime
+import sqlalchemy as sa
+from app import db
+
+
+def codificar_cursor(valores):
+    dados = json.dumps(
+        list(valores),
+        default=lambda valor: {'$dt': valor.isoformat()} if isinstance(valor, datetime) else str(valor)
+    )
+    return base64.urlsafe_b64encode(dados.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    # Cursor inválido ou adulterado volta para a primeira página
+    if not cursor:
+        return None
+    try:
+        dados = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        valores = json.loads(
+            dados,
+            object_hook=lambda obj: datetime.fromisoformat(obj['$dt']) if '$dt' in obj else obj
+        )
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        return None
+    return valores if isinstance(valores, list) else None
+
+
+def _depois_de(colunas, valores, decrescente):
+    # Comparação lexicográfica (c1, c2, ...) > (v1, v2, ...) escrita com AND/OR
+    condicoes = []
+    for i, coluna in enumerate(colunas):
+        passo = coluna < valores[i] if decrescente else coluna > valores[i]
+        iguais = [colunas[j] == valores[j] for j in range(i)]
+        condicoes.append(sa.and_(*iguais, passo))
+    return sa.or_(*condicoes)
+
+
+class PaginaKeyset:
+    def __init__(self, itens, proximo, anterior):
+        self.itens = itens
+        self.proximo = proximo
+        self.anterior = anterior
+
+
+def paginar_keyset(query, colunas, chave, por_pagina, cursor=None, voltar=False, decrescente=False, complemento=None):
+    """Pagina `query` por cursor sobre `colunas`, a última delas única (normalmente o id).
+
+    `chave` extrai de cada item os valores das colunas, na mesma ordem, para montar os cursores.
+    `complemento(cursor, reverso, limite, fronteira)`, se informado, devolve itens de outra fonte
+    já na ordem da página (por exemplo, logs arquivados), intercalados com os da consulta. Com a
+    página já completa pela consulta, `fronteira` é a chave do último item dela: o complemento só
+    precisa do que vem antes.
+    """
+    valores = decodificar_cursor(cursor)
+    if valores is not None and len(valores) != len(colunas):
+        valores = None
+    if valores is None:
+        voltar = False
+    reverso = decrescente != voltar
+    if valores is not None:
+        query = query.where(_depois_de(colunas, valores, reverso))
+    ordem = [coluna.desc() if reverso else coluna.asc() for coluna in colunas]
+    itens = db.session().scalars(query.order_by(*ordem).limit(por_pagina + 1)).unique().all()
+    if complemento is not None:
+        fronteira = chave(itens[-1]) if len(itens) > por_pagina else None
+        extras = complemento(valores, reverso, por_pagina + 1, fronteira)
+        itens = list(heapq.merge(itens, extras, key=chave, reverse=reverso))[:por_pagina + 1]
+    mais = len(itens) > por_pagina
+    itens = itens[:por_pagina]
+    if voltar:
+        itens.reverse()
+    proximo = codificar_cursor(chave(itens[-1])) if itens and (mais or voltar) else None
+    anterior = codificar_cursor(chave(itens[0])) if itens and valores is not None and (mais or not voltar) else None
+    return PaginaKeyset(itens, proximo, anterior)
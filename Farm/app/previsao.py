@@ -0,0 +1,53 @@
+import numpy as np
+
+# Previsão da demanda diária de todos os produtos de uma vez: cada passo do laço é um dia
+# com saídas e atualiza, com operações vetoriais, só os produtos que venderam naquele dia.
+
+ALFA = 0.1  # Constante de suavização (SES e Croston)
+ADI_INTERMITENTE = 1.32  # Intervalo médio entre saídas acima do qual a demanda é intermitente (Syntetos-Boylan)
+
+
+def prever_demanda(posicao, dia, quantidade, n, dia_inicio, dia_fim, alfa=ALFA):
+    """Previsão da demanda diária de `n` produtos a partir das saídas no período.
+
+    `posicao`, `dia` (ordinal) e `quantidade` descrevem as saídas, uma por produto e dia;
+    dias sem saída contam como zero. Demanda regular usa suavização exponencial simples
+    (SES); intermitente usa Croston com a correção de Syntetos-Boylan (SBA).
+    Devolve (previsao, intermitente), arrays de tamanho `n`.
+    """
+    dias = dia_fim - dia_inicio + 1
+    if np.any(dia[1:] < dia[:-1]):
+        ordem = np.argsort(dia, kind='stable')
+        posicao, dia, quantidade = posicao[ordem], dia[ordem], quantidade[ordem]
+    dias_com_saida, inicio_grupo = np.unique(dia, return_index=True)
+
+    # SES: começa na média do período para não partir de zero
+    nivel = np.bincount(posicao, weights=quantidade, minlength=n) / dias
+    # Croston: tamanho médio das saídas, intervalo médio entre elas e dia da última saída
+    tamanho = np.zeros(n)
+    intervalo = np.zeros(n)
+    ultimo = np.full(n, dia_inicio - 1)
+    iniciado = np.zeros(n, dtype=bool)
+
+    anterior = dia_inicio - 1
+    for d, produtos, valores in zip(
+        dias_com_saida, np.split(posicao, inicio_grupo[1:]), np.split(quantidade, inicio_grupo[1:])
+    ):
+        # Os dias sem nenhuma saída só multiplicam o nível por (1 - alfa)
+        nivel *= (1 - alfa) ** (d - anterior)
+        nivel[produtos] += alfa * valores
+        anterior = d
+
+        novos = ~iniciado[produtos]
+        entre = d - ultimo[produtos]
+        tamanho[produtos] = np.where(novos, valores, tamanho[produtos] + alfa * (valores - tamanho[produtos]))
+        intervalo[produtos] = np.where(novos, entre, intervalo[produtos] + alfa * (entre - intervalo[produtos]))
+        ultimo[produtos] = d
+        iniciado[produtos] = True
+    nivel *= (1 - alfa) ** (dia_fim - anterior)
+
+    croston = np.divide((1 - alfa / 2) * tamanho, intervalo, out=np.zeros(n), where=intervalo > 0)
+    dias_venda = np.bincount(posicao, minlength=n)
+    adi = np.divide(dias, dias_venda, out=np.full(n, np.inf), where=dias_venda > 0)
+    intermitente = adi > ADI_INTERMITENTE
+    return np.where(intermitente, croston, nivel), intermitente
@@ -0,0 +1,119 @@
+from datetime import datetime, timedelta
+import sqlalchemy as sa
+from app import app, db
+from app.models import Estoque, Produto, Validade
+from app.busca import resolver_codigos
+from app.checkout import com_tentativas
+from app.saldos import sincronizar_saldos
+from app.resumo import registrar_logs
+from app.alertas import invalidar_alertas
+from app.cache_relatorios import registrar_alteracao_dados
+
+# Recebimento de uma nota de fornecedor: todos os lotes entram numa só transação, ou nenhum.
+# As regras de cada linha são as do add_quantidade (AddQuantidadeForm).
+
+
+class ItemInvalido(ValueError):
+    pass
+
+
+def validade_minima(hoje=None):
+    """Primeiro vencimento aceito no recebimento (mesma regra do AddQuantidadeForm)."""
+    return (hoje or datetime.now().date()) + timedelta(days=app.config['VALIDADE_MINIMA_DIAS'])
+
+
+def _data(valor):
+    # AAAA-MM-DD (API) ou DD/MM/AAAA (como impresso na nota)
+    if isinstance(valor, str):
+        for formato in ('%Y-%m-%d', '%d/%m/%Y'):
+            try:
+                return datetime.strptime(valor.strip(), formato).date()
+            except ValueError:
+                pass
+    raise ItemInvalido('data_validade inválida (use AAAA-MM-DD ou DD/MM/AAAA)')
+
+
+def _validar(item, codigos, permitidos, minima):
+    if not isinstance(item, dict):
+        raise ItemInvalido('item deve ser um objeto')
+    quantidade = item.get('quantidade')
+    if not isinstance(quantidade, int) or isinstance(quantidade, bool) or quantidade <= 0:
+        raise ItemInvalido('quantidade deve ser um inteiro maior que zero')
+    if isinstance(item.get('produto_id'), int) and not isinstance(item['produto_id'], bool):
+        produto_id = item['produto_id']
+    elif item.get('codigo_barras') in codigos:
+        produto_id = codigos[item['codigo_barras']]['produto_id']
+    else:
+        raise ItemInvalido(f'produto não encontrado: {item.get("produto_id") or item.get("codigo_barras")}')
+    if produto_id not in permitidos:
+        raise ItemInvalido(f'produto {produto_id} não pertence ao estoque da farmácia')
+    data_validade = _data(item.get('data_validade'))
+    if data_validade < minima:
+        raise ItemInvalido(f'validade {data_validade:%d/%m/%Y} abaixo do mínimo ({minima:%d/%m/%Y})')
+    return produto_id, quantidade, data_validade
+
+
+def _aplicar(farmacia_id, lotes):
+    produto_ids = {produto_id for produto_id, _, _ in lotes}
+    db.session.execute(sa.insert(Validade.__table__), [
+        {'produto_id': produto_id, 'quantidade': quantidade,
+         'data_validade': datetime.combine(data_validade, datetime.min.time())}
+        for produto_id, quantidade, data_validade in lotes
+    ])
+    # Lotes zerados dos produtos recebidos saem num DELETE só, como no add_quantidade
+    db.session.execute(
+        sa.delete(Validade)
+        .where(Validade.produto_id.in_(produto_ids))
+        .where(Validade.quantidade == 0)
+    )
+    sincronizar_saldos(produto_ids)
+    registrar_logs(farmacia_id, [
+        {'produto_id': produto_id, 'quantidade': quantidade, 'operacao': 'adicionado'}
+        for produto_id, quantidade, _ in lotes
+    ])
+    invalidar_alertas(farmacia_id)
+    registrar_alteracao_dados(farmacia_id)
+    db.session.commit()
+
+
+def receber_nota(farmacia_id, itens):
+    """Valida os itens da nota e, se todos forem válidos, grava os lotes em uma transação.
+
+    Cada item tem produto_id ou codigo_barras, quantidade e data_validade; o mesmo produto
+    pode vir em várias linhas (um lote por linha). Devolve (aplicada, resultados), com um
+    resultado por item na ordem recebida.
+    """
+    codigos = resolver_codigos(farmacia_id, [
+        item['codigo_barras'] for item in itens
+        if isinstance(item, dict) and isinstance(item.get('codigo_barras'), str)
+    ])
+    candidatos = {item['produto_id'] for item in itens if isinstance(item, dict) and isinstance(item.get('produto_id'), int)}
+    permitidos = {codigo['produto_id'] for codigo in codigos.values()} | set(db.session().scalars(
+        sa.select(Estoque.produto_id)
+        .where(Estoque.farmacia_id == farmacia_id)
+        .where(Estoque.produto_id.in_(candidatos))
+    ) if candidatos else [])
+    nomes = dict(db.session.execute(
+        sa.select(Produto.id, Produto.nome).where(Produto.id.in_(permitidos))
+    ).all()) if permitidos else {}
+    minima = validade_minima()
+
+    resultados = []
+    lotes = []
+    for posicao, item in enumerate(itens, start=1):
+        try:
+            produto_id, quantidade, data_validade = _validar(item, codigos, permitidos, minima)
+        except ItemInvalido as erro:
+            resultados.append({'linha': posicao, 'status': 'invalido', 'erro': str(erro)})
+            continue
+        lotes.append((produto_id, quantidade, data_validade))
+        resultados.append({
+            'linha': posicao, 'status': 'valido', 'produto_id': produto_id, 'nome': nomes.get(produto_id),
+            'quantidade': quantidade, 'data_validade': data_validade.isoformat()
+        })
+    if not lotes or len(lotes) < len(itens):
+        return False, resultados
+    com_tentativas(lambda: _aplicar(farmacia_id, lotes))
+    for resultado in resultados:
+        resultado['status'] = 'recebido'
+    return True, resultados
@@ -0,0 +1,113 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+import sqlalchemy as sa
+from app import app, db
+from app.models import Farmacia
+from app.demanda import calcular_demandas
+from app.roteamento import usar_leitura
+
+# Relatório consolidado de todas as farmácias. O trabalho é dividido por farmácia entre
+# processos; cada processo abre as próprias conexões com o banco.
+
+CAMPOS_SOMADOS = ('demanda_media_diaria', 'estoque_atual', 'quantidade_a_pedir', 'valor_a_pedir')
+
+CABECALHO_REDE = [
+    'Loja', 'Produto', 'Demanda Média Diária', 'Estoque de Segurança', 'Ponto de Reposição',
+    'Estoque Atual', 'Quantidade a Pedir', 'Valor a Pedir', 'Estoque Excedente'
+]
+
+
+def _iniciar_processo():
+    # Conexões herdadas do processo pai não podem ser usadas aqui
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+def _calcular_farmacia(farmacia_id, nome, data_inicio, data_fim, now):
+    with app.app_context():
+        usar_leitura()
+        demandas = calcular_demandas(
+            farmacia_id, datetime.fromisoformat(data_inicio), datetime.fromisoformat(data_fim),
+            datetime.fromisoformat(now)
+        )
+    for demanda in demandas:
+        # Valor do pedido sugerido, a preço de venda
+        demanda['valor_a_pedir'] = round(demanda['quantidade_a_pedir'] * (demanda['preco_venda'] or 0), 2)
+    return {'farmacia_id': farmacia_id, 'nome': nome, 'itens': demandas, 'totais': _totais([demandas])}
+
+
+def _totais(listas):
+    totais = {campo: 0 for campo in CAMPOS_SOMADOS}
+    totais.update(produtos=0, produtos_excedentes=0)
+    for demandas in listas:
+        for demanda in demandas:
+            for campo in CAMPOS_SOMADOS:
+                totais[campo] += demanda[campo]
+            totais['produtos'] += 1
+            totais['produtos_excedentes'] += demanda['estoque_excedente']
+    totais['demanda_media_diaria'] = round(totais['demanda_media_diaria'], 2)
+    totais['valor_a_pedir'] = round(totais['valor_a_pedir'], 2)
+    return totais
+
+
+def versao_rede():
+    # Muda sempre que qualquer farmácia registra uma movimentação
+    return db.session().scalar(sa.select(sa.func.coalesce(sa.func.sum(Farmacia.versao_dados), 0)))
+
+
+def relatorio_rede(data_inicio, data_fim, now, processos=None, progresso=None):
+    """Demanda de todas as farmácias, uma tarefa por farmácia em um pool de processos.
+
+    Devolve {'lojas': [...], 'totais': {...}} com os itens e os totais de cada loja e da rede.
+    Com `processos` igual a 1 (ou uma só farmácia) calcula no próprio processo.
+    """
+    progresso = progresso or (lambda percentual: None)
+    farmacias = db.session().execute(sa.select(Farmacia.id, Farmacia.nome).order_by(Farmacia.id)).all()
+    argumentos = [
+        (farmacia_id, nome, data_inicio.isoformat(), data_fim.isoformat(), now.isoformat())
+        for farmacia_id, nome in farmacias
+    ]
+    processos = min(processos or app.config['REDE_PROCESSOS'] or multiprocessing.cpu_count(), len(argumentos))
+    lojas = []
+    if processos <= 1:
+        for i, argumento in enumerate(argumentos):
+            lojas.append(_calcular_farmacia(*argumento))
+            progresso(int(100 * (i + 1) / len(argumentos)))
+    else:
+        # 'spawn' evita herdar threads e conexões abertas do processo web
+        contexto = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(processos, mp_context=contexto, initializer=_iniciar_processo) as executor:
+            futuros = [executor.submit(_calcular_farmacia, *argumento) for argumento in argumentos]
+            for i, futuro in enumerate(as_completed(futuros)):
+                lojas.append(futuro.result())
+                progresso(int(100 * (i + 1) / len(futuros)))
+        lojas.sort(key=lambda loja: loja['farmacia_id'])
+    return {
+        'data_inicio': data_inicio.strftime('%Y-%m-%d'),
+        'data_fim': data_fim.strftime('%Y-%m-%d'),
+        'lojas': lojas,
+        'totais': _totais(loja['itens'] for loja in lojas)
+    }
+
+
+def linhas_rede(relatorio):
+    """Tabela consolidada: uma linha por produto, o subtotal de cada loja e o total da rede."""
+    for loja in relatorio['lojas']:
+        for item in loja['itens']:
+            yield (
+                loja['nome'], item['nome'], item['demanda_media_diaria'], item['estoque_seguranca'],
+                item['ponto_reposicao'], item['estoque_atual'], item['quantidade_a_pedir'], item['valor_a_pedir'],
+                'sim' if item['estoque_excedente'] else 'não'
+            )
+        totais = loja['totais']
+        yield (
+            loja['nome'], 'Total da loja', totais['demanda_media_diaria'], '', '', totais['estoque_atual'],
+            totais['quantidade_a_pedir'], totais['valor_a_pedir'], totais['produtos_excedentes']
+        )
+    totais = relatorio['totais']
+    yield (
+        'Rede', 'Total da rede', totais['demanda_media_diaria'], '', '', totais['estoque_atual'],
+        totais['quantidade_a_pedir'], totais['valor_a_pedir'], totais['produtos_excedentes']
+    )
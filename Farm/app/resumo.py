@@ -0,0 +1,149 @@
+from datetime import datetime, timedelta, timezone
+import sqlalchemy as sa
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from app import db
+from app.models import ArquivoLog, Estoque, Produto, ProdutoLog, ResumoDiario
+
+FUSO_HORAS = 3  # Os logs são gravados em UTC; os relatórios usam GMT-3
+
+
+class dia_local(FunctionElement):
+    # Data (GMT-3) de um timestamp UTC, calculada no banco
+    type = sa.Date()
+    name = 'dia_local'
+    inherit_cache = True
+
+
+@compiles(dia_local)
+def _dia_local(elemento, compilador, **kw):
+    return f"DATE({compilador.process(elemento.clauses, **kw)} - INTERVAL '{FUSO_HORAS} hours')"
+
+
+@compiles(dia_local, 'sqlite')
+def _dia_local_sqlite(elemento, compilador, **kw):
+    return f"DATE({compilador.process(elemento.clauses, **kw)}, '-{FUSO_HORAS} hours')"
+
+
+@compiles(dia_local, 'mysql')
+def _dia_local_mysql(elemento, compilador, **kw):
+    return f"DATE(DATE_SUB({compilador.process(elemento.clauses, **kw)}, INTERVAL {FUSO_HORAS} HOUR))"
+
+
+def _variacao(operacao, quantidade):
+    # Efeito do log no saldo: edit_validade grava 'removido' com quantidade negativa
+    if operacao == 'adicionado':
+        return abs(quantidade)
+    if operacao == 'removido':
+        return -abs(quantidade)
+    return 0
+
+
+def registrar_logs(farmacia_id, logs):
+    """Grava os logs [{produto_id, quantidade, operacao[, timestamp]}] e atualiza o resumo diário.
+
+    Deve ser chamada na mesma transação da escrita e depois de sincronizar_saldos, pois o
+    saldo final do dia parte de Estoque.quantidade.
+    """
+    if not logs:
+        return
+    agora = datetime.now(timezone.utc).replace(tzinfo=None)
+    logs = [dict(log, farmacia_id=farmacia_id, timestamp=log.get('timestamp') or agora) for log in logs]
+    db.session.execute(sa.insert(ProdutoLog), logs)
+
+    totais = {}
+    for log in logs:
+        chave = (log['produto_id'], (log['timestamp'] - timedelta(hours=FUSO_HORAS)).date())
+        total = totais.setdefault(chave, {'adicionado': 0, 'removido': 0, 'saidas': 0, 'edicoes': 0, 'variacao': 0})
+        if log['operacao'] == 'adicionado':
+            total['adicionado'] += log['quantidade']
+        elif log['operacao'] == 'removido':
+            total['removido'] += log['quantidade']
+            total['saidas'] += 1
+        elif log['operacao'] == 'editado':
+            total['edicoes'] += 1
+        total['variacao'] += _variacao(log['operacao'], log['quantidade'])
+
+    # Saldo antes destes logs; os dias são aplicados em ordem, como se chegassem um a um
+    saldos = {produto_id: 0 for produto_id, _ in totais}
+    saldos.update(db.session().execute(
+        sa.select(Estoque.produto_id, Estoque.quantidade).where(Estoque.produto_id.in_(saldos))
+    ).all())
+    for (produto_id, _), total in totais.items():
+        saldos[produto_id] -= total['variacao']
+    for (produto_id, dia), total in sorted(totais.items()):
+        saldos[produto_id] += total['variacao']
+        do_produto = sa.and_(ResumoDiario.farmacia_id == farmacia_id, ResumoDiario.produto_id == produto_id)
+        if total['variacao']:
+            # Movimento retroativo (venda offline): os dias seguintes fecham com o novo saldo
+            db.session.execute(
+                sa.update(ResumoDiario)
+                .where(do_produto, ResumoDiario.dia > dia)
+                .values(saldo_final=ResumoDiario.saldo_final + total['variacao'])
+                .execution_options(synchronize_session=False)
+            )
+        atualizados = db.session.execute(
+            sa.update(ResumoDiario)
+            .where(do_produto, ResumoDiario.dia == dia)
+            .values({
+                campo: getattr(ResumoDiario, campo) + valor for campo, valor in total.items()
+            } | {'saldo_final': ResumoDiario.saldo_final + total['variacao']})
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if atualizados:
+            continue
+        posteriores = db.session().scalar(
+            sa.select(sa.func.coalesce(sa.func.sum(ResumoDiario.variacao), 0))
+            .where(do_produto, ResumoDiario.dia > dia)
+        )
+        db.session.execute(sa.insert(ResumoDiario).values(
+            farmacia_id=farmacia_id, produto_id=produto_id, dia=dia,
+            saldo_final=saldos[produto_id] - posteriores, **total
+        ))
+
+
+def reconstruir_resumo():
+    """Recalcula o resumo diário a partir de ProdutoLog; devolve o número de linhas.
+
+    Os dias já arquivados (app.arquivo_logs) não estão mais em ProdutoLog e mantêm o resumo gravado.
+    """
+    dia = dia_local(ProdutoLog.timestamp)
+    arquivado_ate = db.session.scalar(sa.select(sa.func.max(ArquivoLog.ultimo)))
+    corte = (arquivado_ate - timedelta(hours=FUSO_HORAS)).date() if arquivado_ate else None
+    adicionado = ProdutoLog.operacao == 'adicionado'
+    removido = ProdutoLog.operacao == 'removido'
+    diario = (
+        sa.select(
+            Produto.farmacia_id,
+            ProdutoLog.produto_id,
+            dia.label('dia'),
+            sa.func.sum(sa.case((adicionado, ProdutoLog.quantidade), else_=0)).label('adicionado'),
+            sa.func.sum(sa.case((removido, ProdutoLog.quantidade), else_=0)).label('removido'),
+            sa.func.count(sa.case((removido, 1))).label('saidas'),
+            sa.func.count(sa.case((ProdutoLog.operacao == 'editado', 1))).label('edicoes'),
+            sa.func.sum(sa.case(
+                (adicionado, sa.func.abs(ProdutoLog.quantidade)),
+                (removido, -sa.func.abs(ProdutoLog.quantidade)),
+                else_=0
+            )).label('variacao'),
+        )
+        .join(Produto, Produto.id == ProdutoLog.produto_id)
+        .where(Produto.farmacia_id.is_not(None))
+        .where(*([dia > corte] if corte else []))
+        .group_by(Produto.farmacia_id, ProdutoLog.produto_id, dia)
+        .subquery()
+    )
+    saldo_atual = sa.func.coalesce(
+        sa.select(Estoque.quantidade).where(Estoque.produto_id == diario.c.produto_id).scalar_subquery(), 0
+    )
+    # Saldo ao fim do dia = saldo atual menos a variação dos dias seguintes
+    posteriores = sa.func.sum(diario.c.variacao).over(
+        partition_by=diario.c.produto_id, order_by=diario.c.dia.desc(), rows=(None, -1)
+    )
+    colunas = ['farmacia_id', 'produto_id', 'dia', 'adicionado', 'removido', 'saidas', 'edicoes', 'variacao']
+    db.session.execute(sa.delete(ResumoDiario).where(*([ResumoDiario.dia > corte] if corte else [])))
+    db.session.execute(sa.insert(ResumoDiario).from_select(
+        colunas + ['saldo_final'],
+        sa.select(*(diario.c[coluna] for coluna in colunas), saldo_atual - sa.func.coalesce(posteriores, 0))
+    ))
+    return db.session().scalar(sa.select(sa.func.count()).select_from(ResumoDiario))
@@ -0,0 +1,61 @@
+import functools
+import sqlalchemy as sa
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+
+# Leituras das telas de consulta e dos relatórios vão para o engine 'leitura' (SQLite em mode=ro
+# sob WAL ou uma réplica do PostgreSQL); escritas e tudo o que vier depois delas na mesma
+# transação ficam no primário, para a transação enxergar o que acabou de gravar.
+
+BIND_LEITURA = 'leitura'
+
+
+def _escrita(clause):
+    if isinstance(clause, sa.sql.dml.UpdateBase):
+        return True
+    if isinstance(clause, sa.sql.elements.TextClause):
+        return not clause.text.lstrip().upper().startswith('SELECT')
+    # SELECT ... FOR UPDATE trava linhas no primário
+    return getattr(clause, '_for_update_arg', None) is not None
+
+
+class SessaoRoteada(Session):
+    """Sessão que envia as leituras ao engine de leitura quando a requisição permite."""
+
+    def __init__(self, db, **kwargs):
+        super().__init__(db, **kwargs)
+        self._escreveu = False
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and BIND_LEITURA in self._db.engines and has_app_context() and g.get('banco_leitura'):
+            if self._flushing or _escrita(clause):
+                self._escreveu = True
+            elif not self._escreveu:
+                return self._db.engines[BIND_LEITURA]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@sa.event.listens_for(SessaoRoteada, 'after_commit')
+@sa.event.listens_for(SessaoRoteada, 'after_rollback')
+def _fim_da_transacao(sessao):
+    # Gravado o commit, o SQLite em mode=ro já enxerga as escritas
+    sessao._escreveu = False
+
+
+def usar_leitura():
+    """Envia as próximas leituras deste contexto (requisição ou tarefa) ao engine de leitura."""
+    g.banco_leitura = True
+
+
+def usar_primario():
+    """Volta a ler do primário: para quem precisa ler o que acabou de gravar numa réplica com atraso."""
+    g.banco_leitura = False
+
+
+def somente_leitura(view):
+    """Decorador das views que só consultam: as leituras usam o engine de leitura."""
+    @functools.wraps(view)
+    def decorada(*args, **kwargs):
+        usar_leitura()
+        return view(*args, **kwargs)
+    return decorada
@@ -1,109 +1,55 @@
 from urllib.parse import urlsplit
-from flask import render_template, flash, redirect, url_for, request, session
+from flask import render_template, flash, redirect, url_for, request, session, jsonify, abort
 from flask_login import current_user, login_user, logout_user, login_required
 import sqlalchemy as sa
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import joinedload, contains_eager
 from app import app, db
-from app.forms import LoginForm, RegistrationForm, ProdutoForm, FarmaciaManagementForm, FiltroProdutoForm, FiltroVendaForm, VendaForm, AddQuantidadeForm
-from app.models import User, Produto, Estoque, Farmacia, Fornecedor, Fabricante, ProdutoLog, Validade
+from app.forms import LoginForm, RegistrationForm, ProdutoForm, FarmaciaManagementForm, FiltroProdutoForm, FiltroLogForm, FiltroVendaForm, VendaForm, AddQuantidadeForm, ImportarCatalogoForm, RecebimentoForm
+from app.models import User, Produto, Estoque, Farmacia, Fornecedor, Fabricante, ProdutoLog, Validade, Alerta, TarefaRelatorio
+from app.alertas import atualizar_alertas, invalidar_alertas
+from app.saldos import sincronizar_saldos
+from app.paginacao import paginar_keyset
+from app.busca import filtro_produtos, indexar_produtos, remover_produtos
+from app.checkout import finalizar_venda, LoteAlterado
+from app.carrinho import caixa_atual, itens_carrinho, reservar, remover_item
+from app.demanda import calcular_demandas, intervalo_periodo
+from app.resumo import registrar_logs
+from app.cache_relatorios import em_cache, registrar_alteracao_dados
+from app.tarefas import enfileirar, situacao
+from app.exportacao import resposta_csv, lotes_logs, lotes_demandas, CABECALHO_LOGS, CABECALHO_DEMANDAS
+from app.roteamento import somente_leitura
+from app.importacao_catalogo import importar_catalogo, ler_csv, CatalogoInvalido, COLUNAS as COLUNAS_CATALOGO
+from app.recebimento import receber_nota, validade_minima
+from app.instrumentacao import resumo_endpoints
+from app.arquivo_logs import FiltroLogs, complemento_paginacao, contar_arquivados
+from app.rede import relatorio_rede as calcular_relatorio_rede, versao_rede, linhas_rede, CABECALHO_REDE
 from datetime import datetime, timedelta
-import statistics
+import json
+import re
 from dateutil import parser
 
 @app.route('/')
 @app.route('/index')
 @login_required
+@somente_leitura
 def index():
     if not current_user.farmacia:
         return redirect(url_for('manage_farmacia'))
-    estoques = db.session().scalars(
-        sa.select(Estoque).where(Estoque.farmacia_id == current_user.farmacia_id)
-    ).all()
-    produtos = [estoque.produto for estoque in estoques if estoque.produto is not None]
     farmacia_nome = current_user.farmacia.nome if current_user.farmacia else "Nenhuma farmácia associada"
 
-    # Verificar produtos com estoque zerado, próximos da validade e estoque excedente
-    now = datetime.now() - timedelta(hours=3)
-    data_limite_validade = now + timedelta(days=7)  # 1 semana para vencer
-    for produto in produtos:
-        if produto is not None:
-            # Estoque zerado
-            total_quantidade = db.session().scalar(
-                sa.select(sa.func.sum(Validade.quantidade))
-                .where(Validade.produto_id == produto.id)
-            ) or 0
-            if total_quantidade == 0:
-                flash(f'O produto {produto.nome} está com estoque zerado. Considere reabastecer.', 'warning')
-
-            # Produtos próximos da validade
-            validades = db.session().scalars(
-                sa.select(Validade)
-                .where(Validade.produto_id == produto.id)
-                .where(Validade.quantidade > 0)
-                .where(Validade.data_validade <= data_limite_validade)
-            ).all()
-            for validade in validades:
-                dias_restantes = (validade.data_validade - now).days
-                if 0 < dias_restantes <= 7:
-                    flash(f'O produto {produto.nome} tem {validade.quantidade} unidades vencendo em {dias_restantes} dias (em {validade.data_validade.strftime("%d-%m-%Y")}).', 'warning')
-
-            # Calcular estoque excedente (estoque atual > quantidade máxima)
-            # Usar um período padrão (ex.: última semana) para calcular a demanda
-            data_inicio = now - timedelta(days=7)
-            data_fim = now
-            data_inicio = data_inicio.replace(hour=0, minute=0, second=0, microsecond=0)
-            data_fim = data_fim.replace(hour=23, minute=59, second=59, microsecond=999999)
-
-            logs_produto = db.session().scalars(
-                sa.select(ProdutoLog)
-                .where(ProdutoLog.produto_id == produto.id)
-                .where(ProdutoLog.timestamp >= data_inicio)
-                .where(ProdutoLog.timestamp <= data_fim)
-                .order_by(ProdutoLog.timestamp.asc())
-            ).all()
-
-            entradas = []
-            saidas = []
-            for log in logs_produto:
-                log_timestamp = log.timestamp - timedelta(hours=3)
-                if log.operacao == 'adicionado':
-                    entradas.append({'data': log_timestamp, 'quantidade': log.quantidade})
-                elif log.operacao == 'removido':
-                    saidas.append({'data': log_timestamp, 'quantidade': log.quantidade})
-
-            if saidas:  # Só calcular se houver saídas
-                datas_saidas = [saida['data'] for saida in saidas]
-                data_inicio_saidas = min(datas_saidas)
-                data_fim_saidas = max(datas_saidas)
-                periodo_dias = (data_fim_saidas - data_inicio_saidas).days + 1
-
-                demanda_total = sum(saida['quantidade'] for saida in saidas)
-                demanda_media_diaria = demanda_total / periodo_dias if periodo_dias > 0 else 0
-
-                validades_produto = db.session().scalars(
-                    sa.select(Validade)
-                    .where(Validade.produto_id == produto.id)
-                    .where(Validade.quantidade > 0)
-                ).all()
-                if validades_produto:
-                    dias_validade = []
-                    for validade in validades_produto:
-                        dias_restantes = (validade.data_validade - now).days
-                        if dias_restantes > 0:
-                            dias_validade.append(dias_restantes)
-                    validade_media = sum(dias_validade) / len(dias_validade) if dias_validade else 15
-                else:
-                    validade_media = 15
-
-                quantidade_maxima = round(demanda_media_diaria * validade_media)
-                entradas_total = sum(entrada['quantidade'] for entrada in entradas)
-                saidas_total = sum(saida['quantidade'] for saida in saidas)
-                estoque_atual = entradas_total - saidas_total
-
-                if estoque_atual > quantidade_maxima:
-                    flash(f'O produto {produto.nome} tem estoque excedente ({estoque_atual} unidades) acima da quantidade máxima ({quantidade_maxima} unidades). Considere reduzir o estoque para evitar perdas por validade.', 'warning')
-
-    return render_template('index.html', title='Início - Stock Farm', farmacia_nome=farmacia_nome)
+    # Alertas de estoque zerado, próximos da validade e estoque excedente, calculados em lote
+    atualizar_alertas(current_user.farmacia)
+    page = request.args.get('page', default=1, type=int)
+    alertas = db.paginate(
+        sa.select(Alerta)
+        .where(Alerta.farmacia_id == current_user.farmacia_id)
+        .order_by(Alerta.id),
+        page=page,
+        per_page=app.config['ALERTAS_POR_PAGINA'],
+        error_out=False
+    )
+
+    return render_template('index.html', title='Início - Stock Farm', farmacia_nome=farmacia_nome, alertas=alertas)
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -177,8 +123,21 @@ def manage_farmacia():
 
     return render_template('manage_farmacia.html', title='Gerenciar Farmácia - Stock Farm', form=form)
 
+# Ordenações aceitas em /stock: expressão avaliada no SQL e o mesmo valor lido do objeto Estoque
+VALIDADE_SEM_LOTE = datetime(9999, 12, 31)
+ORDENACOES_ESTOQUE = {
+    'nome': (Produto.nome, lambda estoque: estoque.produto.nome),
+    'validade_proxima': (
+        sa.func.coalesce(Estoque.validade_proxima, VALIDADE_SEM_LOTE),
+        lambda estoque: estoque.validade_proxima or VALIDADE_SEM_LOTE
+    ),
+    'quantidade': (Estoque.quantidade, lambda estoque: estoque.quantidade),
+    'preco_venda': (Produto.preco_venda, lambda estoque: estoque.produto.preco_venda),
+}
+
 @app.route('/stock', methods=['GET'])
 @login_required
+@somente_leitura
 def stock():
     if not current_user.farmacia:
         return redirect(url_for('manage_farmacia'))
@@ -188,44 +147,62 @@ def stock():
         sa.select(Estoque)
         .where(Estoque.farmacia_id == current_user.farmacia_id)
         .join(Produto, Produto.id == Estoque.produto_id)
-        .options(joinedload(Estoque.produto))
+        .options(contains_eager(Estoque.produto))
     )
 
-    if form.nome.data:
-        query = query.where(Produto.nome.ilike(f'%{form.nome.data}%'))
-    if form.genero.data:
-        query = query.where(Produto.genero.ilike(f'%{form.genero.data}%'))
+    # Campos de texto usam o índice de busca (FTS5), com ILIKE quando indisponível
+    query = query.where(*filtro_produtos(
+        nome=form.nome.data,
+        genero=form.genero.data,
+        grupo=form.grupo.data,
+        codigo_barras=form.codigo_barras.data
+    ))
     if form.tipo.data:
         query = query.where(Produto.tipo == form.tipo.data)
     if form.fabricante_id.data:
         query = query.where(Produto.fabricante_id == form.fabricante_id.data)
-    if form.codigo_barras.data:
-        query = query.where(Produto.codigo_barras.ilike(f'%{form.codigo_barras.data}%'))
-
-    estoques = db.session().scalars(query).all()
-
-    # Calcular a validade mais próxima e quantidade total para cada produto
-    for estoque in estoques:
-        total_quantidade = db.session().scalar(
-            sa.select(sa.func.sum(Validade.quantidade))
-            .where(Validade.produto_id == estoque.produto_id)
-        ) or 0
-        estoque.produto.quantidade_total = total_quantidade
-        # Buscar a validade mais próxima
-        validade_proxima = db.session().scalar(
-            sa.select(Validade.data_validade)
-            .where(Validade.produto_id == estoque.produto_id)
-            .where(Validade.quantidade > 0)
-            .order_by(Validade.data_validade.asc())
-            .limit(1)
-        )
-        # Ajustar o formato para DD-MM-YYYY
-        estoque.produto.validade_proxima = validade_proxima.strftime('%d-%m-%Y') if validade_proxima else 'N/A'
 
-    if not estoques and (form.nome.data or form.genero.data or form.tipo.data or form.fabricante_id.data or form.codigo_barras.data):
+    # Ordenação e paginação por cursor, avaliadas no SQL
+    ordem = request.args.get('ordem', 'nome')
+    if ordem not in ORDENACOES_ESTOQUE:
+        ordem = 'nome'
+    direcao = 'desc' if request.args.get('direcao') == 'desc' else 'asc'
+    por_pagina = request.args.get('por_pagina', default=app.config['ESTOQUE_POR_PAGINA'], type=int)
+    por_pagina = max(1, min(por_pagina, app.config['ESTOQUE_POR_PAGINA_MAXIMO']))
+    coluna, valor = ORDENACOES_ESTOQUE[ordem]
+    # Quantidade total e validade mais próxima já vêm gravadas em Estoque
+    pagina = paginar_keyset(
+        query,
+        [coluna, Estoque.id],
+        lambda estoque: (valor(estoque), estoque.id),
+        por_pagina,
+        cursor=request.args.get('cursor'),
+        voltar=request.args.get('sentido') == 'anterior',
+        decrescente=direcao == 'desc'
+    )
+    estoques = pagina.itens
+
+    if not estoques and (form.nome.data or form.genero.data or form.grupo.data or form.tipo.data or form.fabricante_id.data or form.codigo_barras.data):
         flash('Nenhum produto encontrado com essas especificações.', 'info')
 
-    return render_template('stock.html', title='Estoque - Stock Farm', estoques=estoques, can_manage=True, form=form)
+    # Parâmetros do filtro e da ordenação preservados nos links de página
+    parametros = {
+        chave: valor for chave, valor in request.args.items()
+        if chave not in ('cursor', 'sentido', 'csrf_token', 'submit') and valor
+    }
+    parametros.update(ordem=ordem, direcao=direcao, por_pagina=por_pagina)
+
+    return render_template(
+        'stock.html',
+        title='Estoque - Stock Farm',
+        estoques=estoques,
+        can_manage=True,
+        form=form,
+        pagina=pagina,
+        parametros=parametros,
+        ordem=ordem,
+        direcao=direcao
+    )
 
 @app.route('/add_produto', methods=['GET', 'POST'])
 @login_required
@@ -257,7 +234,8 @@ def add_produto():
             fornecedor_id=form.fornecedor_id.data,
             preco_compra=form.preco_compra.data,
             preco_venda=form.preco_venda.data,
-            codigo_barras=form.codigo_barras.data
+            codigo_barras=form.codigo_barras.data,
+            farmacia_id=current_user.farmacia_id
         )
         db.session.add(produto)
         db.session.commit()
@@ -272,11 +250,37 @@ def add_produto():
 
         estoque = Estoque(farmacia_id=current_user.farmacia_id, produto_id=produto.id, quantidade=0)
         db.session.add(estoque)
+        indexar_produtos([produto])
+        invalidar_alertas(current_user.farmacia_id)
+        registrar_alteracao_dados(current_user.farmacia_id)
         db.session.commit()
         flash('Produto adicionado com sucesso!')
         return redirect(url_for('stock'))
     return render_template('edit_produto.html', title='Adicionar Produto - Stock Farm', form=form)
 
+@app.route('/importar_produtos', methods=['GET', 'POST'])
+@login_required
+def importar_produtos():
+    if not current_user.farmacia:
+        return redirect(url_for('manage_farmacia'))
+    form = ImportarCatalogoForm()
+    resultado = None
+    if form.validate_on_submit():
+        try:
+            resultado = importar_catalogo(current_user.farmacia_id, ler_csv(form.arquivo.data.read()))
+        except CatalogoInvalido as erro:
+            flash(str(erro))
+        else:
+            flash(f'{resultado.inseridos} produto(s) adicionado(s) e {resultado.atualizados} atualizado(s).')
+    return render_template(
+        'importar_produtos.html',
+        title='Importar Produtos - Stock Farm',
+        form=form,
+        resultado=resultado,
+        colunas=COLUNAS_CATALOGO,
+        erros_exibidos=app.config['CATALOGO_ERROS_EXIBIDOS']
+    )
+
 @app.route('/edit_produto/<int:id>', methods=['GET', 'POST'])
 @login_required
 def edit_produto(id):
@@ -292,7 +296,7 @@ def edit_produto(id):
     if not estoque:
         flash('Você não tem permissão para editar este produto.')
         return redirect(url_for('stock'))
-    form = ProdutoForm(original_nome=produto.nome)
+    form = ProdutoForm(original_nome=produto.nome, original_codigo_barras=produto.codigo_barras)
     if form.validate_on_submit():
         produto.nome = form.nome.data
         produto.genero = form.genero.data
@@ -317,8 +321,10 @@ def edit_produto(id):
             db.session.commit()
         db.session.commit()
         # Registrar log de edição
-        log = ProdutoLog(produto_id=produto.id, quantidade=produto.quantidade, operacao='editado')
-        db.session.add(log)
+        registrar_logs(current_user.farmacia_id, [{'produto_id': produto.id, 'quantidade': produto.quantidade, 'operacao': 'editado'}])
+        indexar_produtos([produto])
+        invalidar_alertas(current_user.farmacia_id)
+        registrar_alteracao_dados(current_user.farmacia_id)
         db.session.commit()
         flash('Produto atualizado com sucesso!')
         return redirect(url_for('stock'))
@@ -357,12 +363,13 @@ def edit_validade(id):
         quantidade_anterior = validade.quantidade
         validade.data_validade = datetime.combine(form.data_validade.data, datetime.min.time())
         validade.quantidade = form.quantidade.data
-        db.session.commit()
+        sincronizar_saldos([produto.id])
         # Registrar log de edição de validade (se houve mudança)
         if quantidade_anterior != form.quantidade.data:
-            log = ProdutoLog(produto_id=produto.id, quantidade=form.quantidade.data - quantidade_anterior, operacao='adicionado' if form.quantidade.data > quantidade_anterior else 'removido')
-            db.session.add(log)
-            db.session.commit()
+            registrar_logs(current_user.farmacia_id, [{'produto_id': produto.id, 'quantidade': form.quantidade.data - quantidade_anterior, 'operacao': 'adicionado' if form.quantidade.data > quantidade_anterior else 'removido'}])
+        invalidar_alertas(current_user.farmacia_id)
+        registrar_alteracao_dados(current_user.farmacia_id)
+        db.session.commit()
         flash('Validade atualizada com sucesso!')
         return redirect(url_for('view_produto', id=produto.id))
     elif request.method == 'GET':
@@ -393,20 +400,63 @@ def add_quantidade(id):
             quantidade=form.quantidade.data
         )
         db.session.add(validade)
-        # Registrar log de adição
-        log = ProdutoLog(produto_id=produto.id, quantidade=form.quantidade.data, operacao='adicionado')
-        db.session.add(log)
         # Remover entradas com quantidade 0
         db.session.execute(
             sa.delete(Validade)
             .where(Validade.produto_id == produto.id)
             .where(Validade.quantidade == 0)
         )
+        sincronizar_saldos([produto.id])
+        # Registrar log de adição
+        registrar_logs(current_user.farmacia_id, [{'produto_id': produto.id, 'quantidade': form.quantidade.data, 'operacao': 'adicionado'}])
+        invalidar_alertas(current_user.farmacia_id)
+        registrar_alteracao_dados(current_user.farmacia_id)
         db.session.commit()
         flash('Quantidade adicionada com sucesso!')
         return redirect(url_for('stock'))
     return render_template('add_quantidade.html', title='Adicionar Quantidade - Stock Farm', form=form, produto=produto)
 
+def _itens_da_nota(texto):
+    # Uma linha por lote: código de barras (ou id do produto); quantidade; validade
+    itens = []
+    for linha in texto.splitlines():
+        if not linha.strip():
+            continue
+        campos = [campo.strip() for campo in re.split(r'[;\t]', linha)]
+        produto, quantidade, data_validade = (campos + ['', '', ''])[:3]
+        item = {'quantidade': int(quantidade) if quantidade.isdigit() else quantidade, 'data_validade': data_validade}
+        if produto.isdigit() and len(produto) < 12:
+            item['produto_id'] = int(produto)
+        else:
+            item['codigo_barras'] = produto
+        itens.append(item)
+    return itens
+
+@app.route('/recebimento', methods=['GET', 'POST'])
+@login_required
+def recebimento():
+    if not current_user.farmacia:
+        return redirect(url_for('manage_farmacia'))
+    form = RecebimentoForm()
+    resultados = None
+    if form.validate_on_submit():
+        itens = _itens_da_nota(form.itens.data)
+        if len(itens) > app.config['RECEBIMENTO_ITENS_MAXIMO']:
+            flash(f'No máximo {app.config["RECEBIMENTO_ITENS_MAXIMO"]} linhas por nota.')
+        else:
+            aplicada, resultados = receber_nota(current_user.farmacia_id, itens)
+            if aplicada:
+                flash(f'Nota recebida: {len(resultados)} lote(s) adicionado(s).')
+                return redirect(url_for('stock'))
+            flash('Nenhum lote foi gravado: corrija as linhas com erro e envie a nota de novo.')
+    return render_template(
+        'recebimento.html',
+        title='Receber Nota - Stock Farm',
+        form=form,
+        resultados=resultados,
+        validade_minima=validade_minima()
+    )
+
 @app.route('/delete_produto/<int:id>')
 @login_required
 def delete_produto(id):
@@ -424,16 +474,20 @@ def delete_produto(id):
         return redirect(url_for('stock'))
     quantidade = produto.quantidade
     db.session.delete(produto)
+    remover_produtos([id])
     db.session.commit()
     # Registrar log de remoção
-    log = ProdutoLog(produto_id=id, quantidade=quantidade, operacao='removido')
-    db.session.add(log)
+    registrar_logs(current_user.farmacia_id, [{'produto_id': id, 'quantidade': quantidade, 'operacao': 'removido'}])
+    db.session.execute(sa.delete(Alerta).where(Alerta.produto_id == id))
+    invalidar_alertas(current_user.farmacia_id)
+    registrar_alteracao_dados(current_user.farmacia_id)
     db.session.commit()
     flash('Produto excluído com sucesso!')
     return redirect(url_for('stock'))
 
 @app.route('/view_produto/<int:id>')
 @login_required
+@somente_leitura
 def view_produto(id):
     if not current_user.farmacia:
         return redirect(url_for('manage_farmacia'))
@@ -466,9 +520,10 @@ def vendas():
     filtro_form = FiltroVendaForm(request.args)
     venda_form = VendaForm()
 
-    # Inicializar o carrinho na sessão se não existir
-    if 'carrinho' not in session:
-        session['carrinho'] = {}
+    # Carrinho guardado no servidor por usuário e caixa, com reserva de estoque
+    if request.args.get('caixa'):
+        session['caixa'] = request.args.get('caixa')[:40]
+    caixa = caixa_atual()
 
     # Lógica para adicionar ao carrinho
     if request.method == 'POST' and 'quantidade_carrinho' in request.form:
@@ -478,20 +533,19 @@ def vendas():
             flash('Erro: Produto ou quantidade não informados.', 'error')
             return redirect(url_for('vendas'))
         try:
-            produto_id = str(produto_id)
+            produto_id = int(produto_id)
             quantidade = int(quantidade)
-            produto = db.session().get(Produto, int(produto_id))
+            produto = db.session().get(Produto, produto_id)
             if not produto:
                 flash('Produto não encontrado.', 'error')
                 return redirect(url_for('vendas'))
             if quantidade <= 0:
                 flash('A quantidade deve ser maior que zero.', 'error')
                 return redirect(url_for('vendas'))
-            if quantidade > produto.quantidade:
-                flash(f'Quantidade insuficiente em estoque. Disponível: {produto.quantidade}.', 'error')
+            reservado, disponivel = reservar(current_user.farmacia_id, current_user.id, caixa, produto_id, quantidade)
+            if not reservado:
+                flash(f'Quantidade insuficiente em estoque. Disponível: {disponivel}.', 'error')
                 return redirect(url_for('vendas'))
-            session['carrinho'][produto_id] = quantidade
-            session.modified = True
             flash('Produto adicionado ao carrinho!', 'success')
             return redirect(url_for('vendas'))
         except ValueError:
@@ -500,74 +554,33 @@ def vendas():
 
     # Lógica para remover do carrinho
     if request.method == 'POST' and 'remove_from_cart_action' in request.form:
-        produto_id = request.form.get('produto_id')
+        produto_id = request.form.get('produto_id', type=int)
         if not produto_id:
             flash('Erro: Produto não informado.', 'error')
             return redirect(url_for('vendas'))
-        produto_id = str(produto_id)
-        if produto_id in session['carrinho']:
-            del session['carrinho'][produto_id]
-            session.modified = True
+        if remover_item(current_user.id, caixa, produto_id):
             flash('Produto removido do carrinho!', 'success')
         else:
             flash('Produto não estava no carrinho.', 'info')
         return redirect(url_for('vendas'))
 
+    carrinho = itens_carrinho(current_user.id, caixa)
+
     # Lógica para registrar a compra
     if request.method == 'POST' and 'finalizar_compra_action' in request.form:
-        if not session['carrinho']:
+        if not carrinho:
             flash('O carrinho está vazio.', 'error')
             return redirect(url_for('vendas'))
-        for produto_id, quantidade in session['carrinho'].items():
-            try:
-                produto = db.session().get(Produto, int(produto_id))
-                if produto:
-                    if produto.quantidade < quantidade:
-                        flash(f'Erro: Estoque insuficiente para o produto {produto.nome}.', 'error')
-                        return redirect(url_for('vendas'))
-                    
-                    # Consultar validades ordenadas por data de validade (mais próxima primeiro)
-                    validades = db.session().scalars(
-                        sa.select(Validade)
-                        .where(Validade.produto_id == produto.id)
-                        .where(Validade.quantidade > 0)
-                        .order_by(Validade.data_validade.asc())
-                    ).all()
-
-                    quantidade_restante = quantidade
-                    for validade in validades:
-                        if quantidade_restante <= 0:
-                            break
-                        if validade.quantidade >= quantidade_restante:
-                            validade.quantidade -= quantidade_restante
-                            quantidade_restante = 0
-                        else:
-                            quantidade_restante -= validade.quantidade
-                            validade.quantidade = 0
-                        db.session.add(validade)
-
-                    if quantidade_restante > 0:
-                        flash(f'Erro: Estoque insuficiente para o produto {produto.nome} após alocação por validade.', 'error')
-                        db.session.rollback()
-                        return redirect(url_for('vendas'))
-
-                    # Remover entradas com quantidade 0
-                    db.session.execute(
-                        sa.delete(Validade)
-                        .where(Validade.produto_id == produto.id)
-                        .where(Validade.quantidade == 0)
-                    )
-
-                    # Registrar log de remoção
-                    log = ProdutoLog(produto_id=produto.id, quantidade=quantidade, operacao='removido')
-                    db.session.add(log)
-            except Exception as e:
-                flash(f'Erro ao processar o produto {produto_id}: {str(e)}', 'error')
-                db.session.rollback()
-                return redirect(url_for('vendas'))
-        db.session.commit()
-        session['carrinho'] = {}
-        session.modified = True
+        # Baixa FEFO do carrinho inteiro em uma transação, com UPDATEs condicionais por lote
+        try:
+            faltas = finalizar_venda(current_user.farmacia_id, carrinho, user_id=current_user.id, caixa=caixa)
+        except (LoteAlterado, sa.exc.OperationalError):
+            flash('Erro: O estoque está ocupado por outro caixa. Tente registrar a compra novamente.', 'error')
+            return redirect(url_for('vendas'))
+        if faltas:
+            for falta in faltas:
+                flash(f'Erro: Estoque insuficiente para o produto {falta.nome}. Solicitado: {falta.solicitado}, disponível: {falta.disponivel}.', 'error')
+            return redirect(url_for('vendas'))
         flash('Compra registrada com sucesso!', 'success')
         return redirect(url_for('vendas'))
 
@@ -576,36 +589,30 @@ def vendas():
         sa.select(Estoque)
         .where(Estoque.farmacia_id == current_user.farmacia_id)
         .join(Produto, Produto.id == Estoque.produto_id)
-        .options(joinedload(Estoque.produto))
+        .options(contains_eager(Estoque.produto))
     )
 
-    if filtro_form.nome.data:
-        query = query.where(Produto.nome.ilike(f'%{filtro_form.nome.data}%'))
-    if filtro_form.codigo_barras.data:
-        query = query.where(Produto.codigo_barras.ilike(f'%{filtro_form.codigo_barras.data}%'))
-
-    estoques = db.session().scalars(query).all()
-
-    # Calcular a quantidade total para cada produto
-    for estoque in estoques:
-        total_quantidade = db.session().scalar(
-            sa.select(sa.func.sum(Validade.quantidade))
-            .where(Validade.produto_id == estoque.produto_id)
-        ) or 0
-        estoque.produto.quantidade_total = total_quantidade
-
-    # Se o filtro estiver vazio, mostrar apenas os produtos no carrinho
-    if not (filtro_form.nome.data or filtro_form.codigo_barras.data):
-        if session['carrinho']:
-            estoques = [
-                estoque for estoque in estoques
-                if str(estoque.produto_id) in session['carrinho']
-            ]
-        else:
-            estoques = []
+    filtrado = bool(filtro_form.nome.data or filtro_form.codigo_barras.data)
+    codigo_barras = (filtro_form.codigo_barras.data or '').strip()
+    if re.fullmatch(r'\d{12,13}', codigo_barras):
+        # Código completo lido no caixa: busca exata pelo índice único
+        query = query.where(Produto.farmacia_id == current_user.farmacia_id, Produto.codigo_barras == codigo_barras)
+        codigo_barras = None
+    query = query.where(*filtro_produtos(
+        nome=filtro_form.nome.data,
+        codigo_barras=codigo_barras
+    ))
+
+    # Se o filtro estiver vazio, mostrar apenas os produtos no carrinho (uma consulta IN)
+    if filtrado:
+        estoques = db.session().scalars(query).all()
+    elif carrinho:
+        estoques = db.session().scalars(query.where(Estoque.produto_id.in_(carrinho))).all()
+    else:
+        estoques = []
 
     # Mensagem se não houver resultados após filtragem
-    if not estoques and (filtro_form.nome.data or filtro_form.codigo_barras.data):
+    if not estoques and filtrado:
         flash('Nenhum produto encontrado com essas especificações.', 'info')
 
     return render_template(
@@ -614,55 +621,10 @@ def vendas():
         filtro_form=filtro_form,
         venda_form=venda_form,
         estoques=estoques,
-        carrinho=session['carrinho']
+        carrinho={str(produto_id): quantidade for produto_id, quantidade in carrinho.items()}
     )
 
-@app.route('/relatorio', methods=['GET', 'POST'])
-@login_required
-def relatorio():
-    if not current_user.farmacia:
-        return redirect(url_for('manage_farmacia'))
-
-    # Lógica para logs existentes
-    page = request.args.get('page', default=1, type=int)
-    per_page = 10
-    offset = (page - 1) * per_page
-
-    query = (
-        sa.select(ProdutoLog)
-        .join(Produto, Produto.id == ProdutoLog.produto_id, isouter=True)
-        .options(joinedload(ProdutoLog.produto))
-        .order_by(ProdutoLog.timestamp.desc())
-    )
-
-    total_logs = db.session().scalar(sa.select(sa.func.count()).select_from(ProdutoLog))
-    logs = db.session().scalars(query.offset(offset).limit(per_page)).all()
-
-    # Preparar dados para exibição dos logs
-    logs_data = []
-    for log in logs:
-        produto_nome = log.produto.nome if log.produto else "Produto Excluído"
-        produto_codigo = log.produto.codigo_barras if log.produto else "N/A"
-        # Ajustar o timestamp para GMT -3 (subtrair 3 horas) e formatar como DD-MM-YYYY HH:MM
-        if log.timestamp:
-            adjusted_timestamp = log.timestamp - timedelta(hours=3)
-            data = adjusted_timestamp.strftime('%d-%m-%Y %H:%M')
-        else:
-            data = 'Sem data'
-        operacao = log.operacao
-        quantidade = log.quantidade
-        logs_data.append({
-            'data': data,
-            'produto': produto_nome,
-            'operacao': operacao,
-            'quantidade': quantidade,
-            'codigo_barras': produto_codigo
-        })
-
-    has_next = offset + per_page < total_logs
-    has_prev = page > 1
-
-    # Lógica para cálculo de demanda
+def _periodo_relatorio():
     # Determinar o período com base nos parâmetros
     periodo = request.args.get('periodo', 'semana')  # Padrão: última semana
     data_inicio_str = request.args.get('data_inicio')
@@ -684,155 +646,243 @@ def relatorio():
             data_inicio = now - timedelta(days=7)
             data_fim = now
     else:
-        if periodo == 'semana':
-            data_inicio = now - timedelta(days=7)
-        elif periodo == 'mes':
-            data_inicio = now - timedelta(days=30)
-        elif periodo == 'ano':
-            data_inicio = now - timedelta(days=365)
-        else:
-            data_inicio = now - timedelta(days=7)  # Padrão: última semana
-        data_fim = now
+        data_inicio, data_fim = intervalo_periodo(periodo, now)
 
     # Ajustar datas para remover a parte de horário (considerar apenas o dia)
     data_inicio = data_inicio.replace(hour=0, minute=0, second=0, microsecond=0)
     data_fim = data_fim.replace(hour=23, minute=59, second=59, microsecond=999999)
+    return periodo, data_inicio, data_fim, now
+
+def _demandas(periodo, data_inicio, data_fim, now):
+    # Indicadores de demanda de todos os produtos de uma vez (consulta agrupada por dia)
+    identificacao = {'periodo': periodo, 'data_inicio': data_inicio.date(), 'data_fim': data_fim.date()}
+    if app.config['TAREFAS_WORKERS'] and (data_fim - data_inicio).days >= app.config['RELATORIO_DIAS_SEGUNDO_PLANO']:
+        # Período longo: calculado em segundo plano para não prender o worker; tarefas idênticas são reaproveitadas
+        tarefa = enfileirar(
+            current_user.farmacia, 'demanda',
+            {'data_inicio': data_inicio.isoformat(), 'data_fim': data_fim.isoformat(), 'now': now.isoformat()},
+            identificacao
+        )
+        return tarefa, json.loads(tarefa.resultado) if tarefa.status == 'concluida' else None
+    # Reaproveitados do cache enquanto o estoque da farmácia não mudar
+    return None, em_cache(
+        current_user.farmacia, 'demanda', identificacao,
+        lambda: calcular_demandas(current_user.farmacia_id, data_inicio, data_fim, now)
+    )
 
-    # Buscar todos os produtos da farmácia
-    estoques = db.session().scalars(
-        sa.select(Estoque)
-        .where(Estoque.farmacia_id == current_user.farmacia_id)
-        .options(joinedload(Estoque.produto))
-    ).all()
+def _filtro_log(filtro_log):
+    # Filtros do histórico de movimentação da farmácia, aplicados à tabela viva e ao arquivo
+    # As datas do filtro são dias locais (GMT-3); os logs ficam em UTC
+    return FiltroLogs(
+        current_user.farmacia_id,
+        operacao=filtro_log.operacao.data or None,
+        produto=filtro_log.produto.data or None,
+        de=datetime.combine(filtro_log.log_de.data, datetime.min.time()) + timedelta(hours=3) if filtro_log.log_de.data else None,
+        ate=datetime.combine(filtro_log.log_ate.data, datetime.min.time()) + timedelta(days=1, hours=3) if filtro_log.log_ate.data else None
+    )
 
-    # Calcular a validade média dos produtos (em dias) com base na validade mais próxima
-    demandas = []
-    nivel_servico_z = 1.65  # Para 95% de nível de serviço
-
-    for estoque in estoques:
-        if not estoque.produto:
-            continue  # Pular produtos excluídos
-
-        produto = estoque.produto
-
-        # Buscar logs de entrada (adicionado) e saída (removido) no período
-        logs_produto = db.session().scalars(
-            sa.select(ProdutoLog)
-            .where(ProdutoLog.produto_id == produto.id)
-            .where(ProdutoLog.timestamp >= data_inicio)
-            .where(ProdutoLog.timestamp <= data_fim)
-            .order_by(ProdutoLog.timestamp.asc())
-        ).all()
-
-        entradas = []
-        saidas = []
-        for log in logs_produto:
-            # Ajustar timestamp para GMT-3
-            log_timestamp = log.timestamp - timedelta(hours=3)
-            if log.operacao == 'adicionado':
-                entradas.append({'data': log_timestamp, 'quantidade': log.quantidade})
-            elif log.operacao == 'removido':
-                saidas.append({'data': log_timestamp, 'quantidade': log.quantidade})
-
-        # Se não houver saídas, pular o cálculo para este produto
-        if not saidas:
-            continue
+@app.route('/relatorio', methods=['GET', 'POST'])
+@login_required
+@somente_leitura
+def relatorio():
+    if not current_user.farmacia:
+        return redirect(url_for('manage_farmacia'))
 
-        # Passo 1: Determinar o período total com base nas saídas
-        datas_saidas = [saida['data'] for saida in saidas]
-        data_inicio_saidas = min(datas_saidas)
-        data_fim_saidas = max(datas_saidas)
-        periodo_dias = (data_fim_saidas - data_inicio_saidas).days + 1
-
-        # Passo 2: Calcular a demanda total e a demanda média diária
-        demanda_total = sum(saida['quantidade'] for saida in saidas)
-        demanda_media_diaria = demanda_total / periodo_dias if periodo_dias > 0 else 0
-
-        # Passo 3: Calcular o desvio padrão da demanda diária
-        # Agrupar saídas por dia
-        saídas_por_dia = {}
-        data_atual = data_inicio_saidas
-        while data_atual <= data_fim_saidas:
-            saídas_por_dia[data_atual.date()] = 0
-            data_atual += timedelta(days=1)
-
-        for saida in saidas:
-            data_saida = saida['data'].date()
-            saídas_por_dia[data_saida] += saida['quantidade']
-
-        quantidades_diarias = list(saídas_por_dia.values())
-        desvio_padrao = statistics.stdev(quantidades_diarias) if len(quantidades_diarias) > 1 else 0
-
-        # Passo 4: Calcular o estoque de segurança
-        estoque_seguranca = nivel_servico_z * desvio_padrao
-        estoque_seguranca = round(estoque_seguranca)
-
-        # Passo 5: Calcular o ponto de reposição (sem lead time, é igual ao estoque de segurança)
-        ponto_reposicao = estoque_seguranca
-
-        # Passo 6: Calcular a validade média do produto (em dias)
-        validades = db.session().scalars(
-            sa.select(Validade)
-            .where(Validade.produto_id == produto.id)
-            .where(Validade.quantidade > 0)
-        ).all()
-
-        if validades:
-            dias_validade = []
-            for validade in validades:
-                dias_restantes = (validade.data_validade - now).days
-                if dias_restantes > 0:
-                    dias_validade.append(dias_restantes)
-            validade_media = sum(dias_validade) / len(dias_validade) if dias_validade else 15  # Padrão: 15 dias
+    # Histórico de movimentação da farmácia, paginado por cursor (timestamp, id)
+    filtro_log = FiltroLogForm(request.args)
+    filtro = _filtro_log(filtro_log)
+
+    # Os logs já arquivados entram na página intercalados com os da tabela
+    pagina_logs = paginar_keyset(
+        sa.select(ProdutoLog).where(*filtro.condicoes()).options(joinedload(ProdutoLog.produto)),
+        [ProdutoLog.timestamp, ProdutoLog.id],
+        lambda log: (log.timestamp, log.id),
+        app.config['LOGS_POR_PAGINA'],
+        cursor=request.args.get('cursor'),
+        voltar=request.args.get('sentido') == 'anterior',
+        decrescente=True,
+        complemento=complemento_paginacao(filtro)
+    )
+    # Filtros do histórico, preservados nos links; o total por filtro fica no cache até a próxima movimentação
+    parametros_log = {
+        chave: valor for chave, valor in request.args.items()
+        if chave in ('operacao', 'produto', 'log_de', 'log_ate') and valor
+    }
+    total_logs = em_cache(
+        current_user.farmacia, 'contagem_logs', parametros_log,
+        lambda: db.session().scalar(sa.select(sa.func.count()).select_from(ProdutoLog).where(*filtro.condicoes())) + contar_arquivados(filtro)
+    )
+
+    # Preparar dados para exibição dos logs
+    logs_data = []
+    for log in pagina_logs.itens:
+        produto_nome = log.produto.nome if log.produto else "Produto Excluído"
+        produto_codigo = log.produto.codigo_barras if log.produto else "N/A"
+        # Ajustar o timestamp para GMT -3 (subtrair 3 horas) e formatar como DD-MM-YYYY HH:MM
+        if log.timestamp:
+            adjusted_timestamp = log.timestamp - timedelta(hours=3)
+            data = adjusted_timestamp.strftime('%d-%m-%Y %H:%M')
         else:
-            validade_media = 15  # Padrão: 15 dias se não houver validades
+            data = 'Sem data'
+        operacao = log.operacao
+        quantidade = log.quantidade
+        logs_data.append({
+            'data': data,
+            'produto': produto_nome,
+            'operacao': operacao,
+            'quantidade': quantidade,
+            'codigo_barras': produto_codigo
+        })
 
-        # Passo 7: Calcular a quantidade máxima permitida
-        quantidade_maxima = demanda_media_diaria * validade_media
-        quantidade_maxima = round(quantidade_maxima)
+    # Lógica para cálculo de demanda
+    periodo, data_inicio, data_fim, now = _periodo_relatorio()
 
-        # Passo 8: Calcular o estoque atual (entradas - saídas)
-        entradas_total = sum(entrada['quantidade'] for entrada in entradas)
-        saidas_total = sum(saida['quantidade'] for saida in saidas)
-        estoque_atual = entradas_total - saidas_total
+    tarefa, demandas = _demandas(periodo, data_inicio, data_fim, now)
 
-        # Passo 9: Calcular a quantidade a pedir
-        if estoque_atual < ponto_reposicao:
-            quantidade_a_pedir = min(quantidade_maxima - estoque_atual, ponto_reposicao - estoque_atual)
-            quantidade_a_pedir = max(0, round(quantidade_a_pedir))
-        else:
-            quantidade_a_pedir = 0
-
-        # Passo 10: Calcular o tempo de duração do estoque
-        tempo_duracao = (estoque_atual / demanda_media_diaria) if demanda_media_diaria > 0 else 0
-        tempo_duracao = round(tempo_duracao, 2)
-
-        # Passo 11: Verificar se o estoque atual excede a quantidade máxima
-        estoque_excedente = estoque_atual > quantidade_maxima
-
-        # Adicionar resultados à lista de demandas
-        demandas.append({
-            'nome': produto.nome,
-            'preco_venda': produto.preco_venda,
-            'demanda_media_diaria': round(demanda_media_diaria, 2),
-            'estoque_seguranca': estoque_seguranca,
-            'ponto_reposicao': ponto_reposicao,
-            'quantidade_maxima': quantidade_maxima,
-            'estoque_atual': estoque_atual,
-            'quantidade_a_pedir': quantidade_a_pedir,
-            'tempo_duracao': tempo_duracao,
-            'estoque_excedente': estoque_excedente
-        })
+    # Período da demanda preservado nos links do histórico
+    parametros_periodo = {
+        chave: valor for chave, valor in request.args.items()
+        if chave in ('periodo', 'data_inicio', 'data_fim') and valor
+    }
 
     return render_template(
         'relatorio.html',
         title='Relatório - Stock Farm',
         logs=logs_data,
-        page=page,
-        has_next=has_next,
-        has_prev=has_prev,
+        pagina_logs=pagina_logs,
+        total_logs=total_logs,
+        filtro_log=filtro_log,
+        parametros_log=parametros_log,
+        parametros_periodo=parametros_periodo,
+        parametros=dict(parametros_periodo, **parametros_log),
         demandas=demandas,
+        tarefa=tarefa,
         periodo=periodo,
         data_inicio=data_inicio.strftime('%Y-%m-%d'),
         data_fim=data_fim.strftime('%Y-%m-%d')
-    )
\ No newline at end of file
+    )
+
+@app.route('/relatorio/exportar/logs.csv')
+@login_required
+@somente_leitura
+def exportar_logs():
+    if not current_user.farmacia:
+        return redirect(url_for('manage_farmacia'))
+    filtro = _filtro_log(FiltroLogForm(request.args))
+    return resposta_csv(f'logs_{datetime.now():%Y%m%d}.csv', CABECALHO_LOGS, lotes_logs(filtro))
+
+@app.route('/relatorio/exportar/demanda.csv')
+@login_required
+@somente_leitura
+def exportar_demanda():
+    if not current_user.farmacia:
+        return redirect(url_for('manage_farmacia'))
+    periodo, data_inicio, data_fim, now = _periodo_relatorio()
+    # Período longo: a mesma tarefa em segundo plano do relatório
+    tarefa, demandas = _demandas(periodo, data_inicio, data_fim, now)
+    if demandas is None:
+        flash('O relatório de demanda ainda está sendo gerado. Tente exportar quando ele for concluído.', 'info')
+        return redirect(url_for('relatorio', **request.args))
+    nome_arquivo = f'demanda_{data_inicio:%Y%m%d}_{data_fim:%Y%m%d}.csv'
+    return resposta_csv(nome_arquivo, CABECALHO_DEMANDAS, lotes_demandas(demandas))
+
+def _relatorio_rede(periodo, data_inicio, data_fim, now):
+    # Relatório da rede do período: em segundo plano (reaproveitando tarefas idênticas) ou na hora
+    parametros = {'data_inicio': data_inicio.isoformat(), 'data_fim': data_fim.isoformat(), 'now': now.isoformat()}
+    if not app.config['TAREFAS_WORKERS']:
+        return None, calcular_relatorio_rede(data_inicio, data_fim, now)
+    # A versão da rede entra na identificação: movimentação em qualquer loja gera um novo cálculo
+    identificacao = {
+        'periodo': periodo, 'data_inicio': data_inicio.date(), 'data_fim': data_fim.date(), 'versao_rede': versao_rede()
+    }
+    tarefa = enfileirar(current_user.farmacia, 'rede', parametros, identificacao)
+    return tarefa, json.loads(tarefa.resultado) if tarefa.status == 'concluida' else None
+
+@app.route('/relatorio/rede')
+@login_required
+@somente_leitura
+def relatorio_rede():
+    if not current_user.farmacia:
+        return redirect(url_for('manage_farmacia'))
+    if not current_user.administrador:
+        abort(403)
+    periodo, data_inicio, data_fim, now = _periodo_relatorio()
+    tarefa, rede = _relatorio_rede(periodo, data_inicio, data_fim, now)
+    return render_template(
+        'relatorio_rede.html',
+        title='Relatório da Rede - Stock Farm',
+        tarefa=tarefa,
+        rede=rede,
+        periodo=periodo,
+        data_inicio=data_inicio.strftime('%Y-%m-%d'),
+        data_fim=data_fim.strftime('%Y-%m-%d')
+    )
+
+@app.route('/relatorio/rede/exportar.csv')
+@login_required
+def exportar_rede():
+    if not current_user.farmacia:
+        return redirect(url_for('manage_farmacia'))
+    if not current_user.administrador:
+        abort(403)
+    tarefa, rede = _relatorio_rede(*_periodo_relatorio())
+    if rede is None:
+        flash('O relatório da rede ainda está sendo gerado. Tente exportar quando ele for concluído.', 'info')
+        return redirect(url_for('relatorio_rede', **request.args))
+    nome_arquivo = f"rede_{rede['data_inicio'].replace('-', '')}_{rede['data_fim'].replace('-', '')}.csv"
+    return resposta_csv(nome_arquivo, CABECALHO_REDE, [list(linhas_rede(rede))])
+
+@app.route('/instrumentacao')
+@login_required
+def instrumentacao():
+    if not current_user.administrador:
+        abort(403)
+    return render_template(
+        'instrumentacao.html',
+        title='Instrumentação do SQL - Stock Farm',
+        ativa=bool(app.config['INSTRUMENTACAO_SQL']),
+        endpoints=resumo_endpoints()
+    )
+
+def _tarefa_da_farmacia(id):
+    tarefa = db.first_or_404(
+        sa.select(TarefaRelatorio)
+        .where(TarefaRelatorio.id == id)
+        .where(TarefaRelatorio.farmacia_id == current_user.farmacia_id)
+    )
+    # O relatório da rede tem dados das outras lojas
+    if tarefa.tipo == 'rede' and not current_user.administrador:
+        abort(403)
+    return tarefa
+
+@app.route('/relatorio/tarefas/<id>')
+@login_required
+@somente_leitura
+def relatorio_tarefa(id):
+    tarefa = _tarefa_da_farmacia(id)
+    return jsonify(dict(situacao(tarefa), resultado_url=url_for('relatorio_tarefa_resultado', id=tarefa.id)))
+
+@app.route('/relatorio/tarefas/<id>/resultado')
+@login_required
+@somente_leitura
+def relatorio_tarefa_resultado(id):
+    tarefa = _tarefa_da_farmacia(id)
+    parametros = json.loads(tarefa.parametros)
+    if tarefa.tipo == 'rede':
+        return render_template(
+            'relatorio_rede.html',
+            title='Relatório da Rede - Stock Farm',
+            tarefa=tarefa,
+            rede=json.loads(tarefa.resultado) if tarefa.status == 'concluida' else None,
+            periodo=None,
+            data_inicio=parametros['data_inicio'][:10],
+            data_fim=parametros['data_fim'][:10]
+        )
+    return render_template(
+        'relatorio_tarefa.html',
+        title='Relatório - Stock Farm',
+        tarefa=tarefa,
+        demandas=json.loads(tarefa.resultado) if tarefa.status == 'concluida' else None,
+        data_inicio=parametros['data_inicio'][:10],
+        data_fim=parametros['data_fim'][:10]
+    )
@@ -0,0 +1,51 @@
+import sqlalchemy as sa
+from app import db
+from app.models import Estoque, Validade
+
+
+def _total_lotes():
+    return (
+        sa.select(sa.func.coalesce(sa.func.sum(Validade.quantidade), 0))
+        .where(Validade.produto_id == Estoque.produto_id)
+        .scalar_subquery()
+    )
+
+
+def _validade_proxima_lotes():
+    return (
+        sa.select(sa.func.min(Validade.data_validade))
+        .where(Validade.produto_id == Estoque.produto_id)
+        .where(Validade.quantidade > 0)
+        .scalar_subquery()
+    )
+
+
+def sincronizar_saldos(produto_ids):
+    """Atualiza Estoque.quantidade e Estoque.validade_proxima a partir dos lotes.
+
+    Deve ser chamada depois de toda escrita em Validade e antes do commit, para que
+    o saldo seja gravado na mesma transação que os lotes.
+    """
+    produto_ids = {int(produto_id) for produto_id in produto_ids}
+    if not produto_ids:
+        return
+    db.session.execute(
+        sa.update(Estoque)
+        .where(Estoque.produto_id.in_(produto_ids))
+        .values(quantidade=_total_lotes(), validade_proxima=_validade_proxima_lotes())
+        .execution_options(synchronize_session='fetch')
+    )
+
+
+def saldos_divergentes():
+    # Linhas de Estoque cujo saldo gravado não confere com a soma dos lotes
+    total = _total_lotes()
+    proxima = _validade_proxima_lotes()
+    return db.session().execute(
+        sa.select(Estoque.id, Estoque.produto_id, Estoque.quantidade, total, Estoque.validade_proxima, proxima)
+        .where(sa.or_(
+            Estoque.quantidade != total,
+            Estoque.validade_proxima.is_distinct_from(proxima)
+        ))
+        .order_by(Estoque.id)
+    ).all()
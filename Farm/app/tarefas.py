@@ -0,0 +1,158 @@
+import hashlib
+import json
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import sqlalchemy as sa
+from app import app, db
+from app.models import TarefaRelatorio
+from app.demanda import calcular_demandas
+from app.rede import relatorio_rede
+from app.roteamento import usar_leitura, usar_primario
+
+# Relatórios pesados rodam em um pool de threads limitado, um por processo (worker do gunicorn).
+# O estado fica em TarefaRelatorio, então qualquer worker responde o andamento e o resultado.
+
+_pool = {'executor': None}
+_pool_lock = threading.Lock()
+
+
+def _executor():
+    with _pool_lock:
+        if _pool['executor'] is None:
+            _pool['executor'] = ThreadPoolExecutor(
+                max_workers=app.config['TAREFAS_WORKERS'], thread_name_prefix='tarefa-relatorio'
+            )
+        return _pool['executor']
+
+
+def _agora():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _demanda(farmacia_id, parametros, progresso):
+    return calcular_demandas(
+        farmacia_id,
+        datetime.fromisoformat(parametros['data_inicio']),
+        datetime.fromisoformat(parametros['data_fim']),
+        datetime.fromisoformat(parametros['now']),
+        progresso=progresso
+    )
+
+
+def _rede(farmacia_id, parametros, progresso):
+    return relatorio_rede(
+        datetime.fromisoformat(parametros['data_inicio']),
+        datetime.fromisoformat(parametros['data_fim']),
+        datetime.fromisoformat(parametros['now']),
+        progresso=progresso
+    )
+
+
+TIPOS = {'demanda': _demanda, 'rede': _rede}
+
+
+def chave_tarefa(farmacia, tipo, identificacao):
+    # Mesma farmácia, tipo, parâmetros e versão dos dados: mesmo resultado
+    dados = json.dumps([farmacia.id, farmacia.versao_dados, tipo, identificacao], sort_keys=True, default=str)
+    return hashlib.sha256(dados.encode()).hexdigest()
+
+
+def _abandonada(tarefa):
+    # Pendente ou executando sem batimento há tempo demais: o worker que a recebeu provavelmente morreu
+    limite = timedelta(seconds=app.config['TAREFAS_LIMITE_SEGUNDOS'])
+    ultimo = tarefa.atualizada_em or tarefa.criada_em
+    return tarefa.status in ('pendente', 'executando') and _agora() - ultimo > limite
+
+
+def enfileirar(farmacia, tipo, parametros, identificacao):
+    """Devolve a tarefa idêntica já existente (em andamento ou concluída) ou cria e agenda uma nova.
+
+    `parametros` é o que a execução recebe; `identificacao` é o subconjunto que define tarefas idênticas.
+    """
+    chave = chave_tarefa(farmacia, tipo, identificacao)
+    tarefa = db.session().scalar(sa.select(TarefaRelatorio).where(TarefaRelatorio.chave == chave))
+    if tarefa is not None and tarefa.status != 'erro' and not _abandonada(tarefa):
+        return tarefa
+
+    # A tarefa é gravada e relida a seguir pela view: o resto da requisição fica no primário,
+    # que já enxerga a tarefa nova mesmo com a réplica atrasada
+    usar_primario()
+    # Tarefas antigas da farmácia já não servem: a versão dos dados mudou ou o dia virou
+    db.session.execute(
+        sa.delete(TarefaRelatorio)
+        .where(TarefaRelatorio.farmacia_id == farmacia.id)
+        .where(TarefaRelatorio.criada_em < _agora() - timedelta(days=1))
+        .where(TarefaRelatorio.chave != chave)
+    )
+    if tarefa is None:
+        tarefa = TarefaRelatorio(id=uuid.uuid4().hex, farmacia_id=farmacia.id, tipo=tipo, chave=chave)
+        db.session.add(tarefa)
+    tarefa.parametros = json.dumps(parametros, default=str)
+    tarefa.status = 'pendente'
+    tarefa.progresso = 0
+    tarefa.erro = None
+    tarefa.criada_em = tarefa.atualizada_em = _agora()
+    try:
+        db.session.commit()
+    except sa.exc.IntegrityError:
+        # Outro worker criou a mesma tarefa ao mesmo tempo
+        db.session.rollback()
+        return db.session().scalar(sa.select(TarefaRelatorio).where(TarefaRelatorio.chave == chave))
+    _executor().submit(_executar, tarefa.id)
+    return tarefa
+
+
+def _atualizar(tarefa_id, **valores):
+    # Toda atualização também é um batimento
+    db.session.execute(
+        sa.update(TarefaRelatorio).where(TarefaRelatorio.id == tarefa_id).values(atualizada_em=_agora(), **valores)
+    )
+    db.session.commit()
+
+
+def _pulsar(tarefa_id, parar):
+    # Batimento periódico enquanto o cálculo roda, também entre duas atualizações de progresso
+    with app.app_context():
+        while not parar.wait(app.config['TAREFAS_BATIMENTO_SEGUNDOS']):
+            try:
+                _atualizar(tarefa_id)
+            except sa.exc.OperationalError:
+                db.session.rollback()
+
+
+def _executar(tarefa_id):
+    with app.app_context():
+        tarefa = db.session.get(TarefaRelatorio, tarefa_id)
+        if tarefa is None or tarefa.status != 'pendente':
+            return
+        farmacia_id, tipo, parametros = tarefa.farmacia_id, tarefa.tipo, json.loads(tarefa.parametros)
+        _atualizar(tarefa_id, status='executando', progresso=5)
+        # O cálculo só lê; o andamento e o resultado continuam gravados no primário
+        usar_leitura()
+        parar = threading.Event()
+        threading.Thread(target=_pulsar, args=(tarefa_id, parar), daemon=True).start()
+        try:
+            resultado = TIPOS[tipo](farmacia_id, parametros, lambda percentual: _atualizar(tarefa_id, progresso=percentual))
+        except Exception as erro:
+            app.logger.exception('Falha na tarefa de relatório %s', tarefa_id)
+            db.session.rollback()
+            _atualizar(tarefa_id, status='erro', erro=str(erro)[:300], concluida_em=_agora())
+            return
+        finally:
+            parar.set()
+        _atualizar(
+            tarefa_id, status='concluida', progresso=100,
+            resultado=json.dumps(resultado), concluida_em=_agora()
+        )
+
+
+def situacao(tarefa):
+    return {
+        'id': tarefa.id,
+        'tipo': tarefa.tipo,
+        'status': tarefa.status,
+        'progresso': tarefa.progresso,
+        'erro': tarefa.erro
+    }
@@ -2,7 +2,103 @@ import os
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 
+
+def _opcoes_engine(uri):
+    # Perfil do engine conforme o banco: SQLite em arquivo ou servidor (PostgreSQL)
+    if uri.startswith('sqlite'):
+        if ':memory:' in uri or uri.rstrip('/') == 'sqlite:':
+            return {}
+        return {
+            # Conexões SQLite são baratas; o limite real é um escritor por vez (WAL)
+            'pool_size': int(os.environ.get('DB_POOL_SIZE') or 5),
+            'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW') or 10),
+            'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT') or 30),
+            # Espera do driver pelo lock, além do PRAGMA busy_timeout aplicado na conexão
+            'connect_args': {'timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS') or 5000) / 1000},
+        }
+    return {
+        # Por worker do gunicorn: workers * (pool_size + max_overflow) deve caber em max_connections
+        'pool_size': int(os.environ.get('DB_POOL_SIZE') or 10),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW') or 20),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT') or 30),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE') or 1800),
+        'pool_pre_ping': True,
+        'connect_args': {'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT') or 10)},
+    }
+
+
+def _binds_leitura(uri):
+    # Engine só de leitura dos relatórios: réplica informada ou, no SQLite em arquivo, o mesmo arquivo em mode=ro
+    url_leitura = os.environ.get('DATABASE_LEITURA_URL')
+    if not url_leitura and uri.startswith('sqlite:///') and ':memory:' not in uri:
+        caminho = uri[len('sqlite:///'):]
+        if caminho.startswith('file:'):
+            return {}
+        url_leitura = f'sqlite:///file:{caminho}?mode=ro&uri=true'
+    if not url_leitura:
+        return {}
+    return {'leitura': dict(_opcoes_engine(url_leitura), url=url_leitura)}
+
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'voce-nunca-saberah'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
-        'sqlite:///' + os.path.join(basedir, 'app.db')
\ No newline at end of file
+        'sqlite:///' + os.path.join(basedir, 'app.db')
+    SQLALCHEMY_ENGINE_OPTIONS = _opcoes_engine(SQLALCHEMY_DATABASE_URI)
+    SQLALCHEMY_BINDS = _binds_leitura(SQLALCHEMY_DATABASE_URI)
+    # SQLite: PRAGMAs aplicados a cada nova conexão (ver app.banco)
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE') or 'WAL'
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS') or 'NORMAL'  # Seguro com WAL; FULL a cada commit
+    SQLITE_CACHE_KB = int(os.environ.get('SQLITE_CACHE_KB') or 65536)
+    SQLITE_MMAP_BYTES = int(os.environ.get('SQLITE_MMAP_BYTES') or 268435456)
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS') or 5000)
+    # Painel de alertas: tempo de reaproveitamento da lista calculada e itens por página
+    ALERTAS_VALIDADE_SEGUNDOS = int(os.environ.get('ALERTAS_VALIDADE_SEGUNDOS') or 300)
+    ALERTAS_POR_PAGINA = int(os.environ.get('ALERTAS_POR_PAGINA') or 10)
+    # Paginação por cursor do /stock
+    ESTOQUE_POR_PAGINA = int(os.environ.get('ESTOQUE_POR_PAGINA') or 50)
+    ESTOQUE_POR_PAGINA_MAXIMO = 200
+    # Máximo de códigos de barras por leitura em lote (/api/scan)
+    SCAN_LOTE_MAXIMO = 500
+    # Checkout: novas tentativas em conflito de lote ou 'database is locked'
+    CHECKOUT_TENTATIVAS = int(os.environ.get('CHECKOUT_TENTATIVAS') or 5)
+    CHECKOUT_ESPERA_BASE = 0.05
+    # Carrinho no servidor: validade das reservas e intervalo da limpeza em segundo plano (0 desliga)
+    RESERVAS_TTL_MINUTOS = int(os.environ.get('RESERVAS_TTL_MINUTOS') or 15)
+    RESERVAS_INTERVALO_LIMPEZA = int(os.environ.get('RESERVAS_INTERVALO_LIMPEZA') or 60)
+    # Importação de vendas offline: vendas por requisição e por transação
+    VENDAS_LOTE_MAXIMO = int(os.environ.get('VENDAS_LOTE_MAXIMO') or 5000)
+    VENDAS_LOTE_TRANSACAO = int(os.environ.get('VENDAS_LOTE_TRANSACAO') or 500)
+    # Validade mínima de um lote recebido (add_quantidade e recebimento de nota), em dias a partir de hoje
+    VALIDADE_MINIMA_DIAS = int(os.environ.get('VALIDADE_MINIMA_DIAS') or 14)
+    # Recebimento de nota: linhas por nota
+    RECEBIMENTO_ITENS_MAXIMO = int(os.environ.get('RECEBIMENTO_ITENS_MAXIMO') or 2000)
+    # Importação do catálogo por CSV: produtos gravados por transação
+    CATALOGO_LOTE_TRANSACAO = int(os.environ.get('CATALOGO_LOTE_TRANSACAO') or 2000)
+    CATALOGO_ERROS_EXIBIDOS = int(os.environ.get('CATALOGO_ERROS_EXIBIDOS') or 200)  # Linhas com erro listadas na tela
+    # Histórico de movimentação do /relatorio: logs por página
+    LOGS_POR_PAGINA = int(os.environ.get('LOGS_POR_PAGINA') or 10)
+    # Cache do relatório de demanda, em um arquivo SQLite compartilhado pelos workers
+    RELATORIO_CACHE_ARQUIVO = os.environ.get('RELATORIO_CACHE_ARQUIVO') or \
+        os.path.join(basedir, 'cache_relatorios.db')
+    RELATORIO_CACHE_SEGUNDOS = int(os.environ.get('RELATORIO_CACHE_SEGUNDOS') or 3600)
+    # Relatórios em segundo plano: threads por worker, período mínimo (dias), tempo sem batimento
+    # até a tarefa ser dada como abandonada e intervalo do batimento de uma tarefa em execução
+    TAREFAS_WORKERS = int(os.environ.get('TAREFAS_WORKERS') or 2)
+    RELATORIO_DIAS_SEGUNDO_PLANO = int(os.environ.get('RELATORIO_DIAS_SEGUNDO_PLANO') or 90)
+    TAREFAS_LIMITE_SEGUNDOS = int(os.environ.get('TAREFAS_LIMITE_SEGUNDOS') or 600)
+    TAREFAS_BATIMENTO_SEGUNDOS = int(os.environ.get('TAREFAS_BATIMENTO_SEGUNDOS') or 30)
+    # Exportação CSV: linhas lidas do banco por lote
+    EXPORTACAO_LOTE = int(os.environ.get('EXPORTACAO_LOTE') or 1000)
+    # Relatório da rede: processos que calculam as farmácias em paralelo (0 = um por CPU)
+    REDE_PROCESSOS = int(os.environ.get('REDE_PROCESSOS') or 0)
+    # Instrumentação do SQL por requisição (app.instrumentacao): 1 liga; desligada não custa nada
+    INSTRUMENTACAO_SQL = int(os.environ.get('INSTRUMENTACAO_SQL') or 0)
+    INSTRUMENTACAO_N1_LIMITE = int(os.environ.get('INSTRUMENTACAO_N1_LIMITE') or 10)  # Repetições da mesma forma que indicam N+1
+    INSTRUMENTACAO_JANELA = int(os.environ.get('INSTRUMENTACAO_JANELA') or 500)  # Requisições guardadas por endpoint
+    # Arquivo frio do histórico: logs com mais de N meses saem de produto_log para arquivos .csv.gz
+    ARQUIVO_LOGS_PASTA = os.environ.get('ARQUIVO_LOGS_PASTA') or os.path.join(basedir, 'arquivo_logs')
+    ARQUIVO_LOGS_MESES = int(os.environ.get('ARQUIVO_LOGS_MESES') or 12)
+    ARQUIVO_LOGS_LOTE = int(os.environ.get('ARQUIVO_LOGS_LOTE') or 1000)  # Logs lidos do banco por lote ao arquivar
+    # Arquivos substituídos num rearquivamento ficam esse tempo para quem ainda lê o manifesto antigo
+    ARQUIVO_LOGS_CARENCIA_SEGUNDOS = int(os.environ.get('ARQUIVO_LOGS_CARENCIA_SEGUNDOS') or 3600)
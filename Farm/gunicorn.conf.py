@@ -0,0 +1,13 @@
+# Configuração lida pelo gunicorn quando sobe a partir deste diretório (gunicorn app:app)
+
+
+def post_worker_init(worker):
+    # Cada worker confere o banco antes de aceitar requisições; um erro aqui impede a subida
+    # do gunicorn ("Worker failed to boot") em vez de aparecer só nas requisições
+    from app import app
+    from app.banco import verificar_banco_na_inicializacao
+    from app.carrinho import iniciar_limpeza_reservas
+    with app.app_context():
+        verificar_banco_na_inicializacao()
+    # Uma thread de limpeza das reservas por worker, só depois de o banco passar na verificação
+    iniciar_limpeza_reservas()
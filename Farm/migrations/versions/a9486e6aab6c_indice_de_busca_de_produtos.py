@@ -0,0 +1,36 @@
+"""indice de busca de produtos
+
+Revision ID: a9486e6aab6c
+Revises: ec0fb795e03e
+Create Date: 2026-10-18 07:03:04.834325
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9486e6aab6c'
+down_revision = 'ec0fb795e03e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Índice FTS5 só existe no SQLite; nos demais bancos a busca usa ILIKE
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS produto_busca USING fts5("
+        "nome, genero, grupo, codigo_barras, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+    op.execute(
+        'INSERT INTO produto_busca (rowid, nome, genero, grupo, codigo_barras) '
+        'SELECT id, nome, genero, grupo, codigo_barras FROM produto'
+    )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute('DROP TABLE IF EXISTS produto_busca')
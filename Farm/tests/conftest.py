@@ -0,0 +1,186 @@
+import html
+import os
+import re
+import tempfile
+import uuid
+from datetime import datetime, timedelta
+
+# A configuração é lida na importação do app: o banco de teste precisa estar no ambiente antes
+_pasta = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_pasta, 'teste.db')
+os.environ['RELATORIO_CACHE_ARQUIVO'] = os.path.join(_pasta, 'cache.db')
+os.environ['ARQUIVO_LOGS_PASTA'] = os.path.join(_pasta, 'arquivo_logs')
+os.environ['RESERVAS_INTERVALO_LIMPEZA'] = '0'
+# Relatórios calculados na própria requisição, para que as consultas deles também sejam verificadas
+os.environ['TAREFAS_WORKERS'] = '0'
+os.environ['REDE_PROCESSOS'] = '1'
+
+import flask_migrate
+import flask_wtf.csrf
+import pytest
+from flask import g
+import sqlalchemy as sa
+from app import app as flask_app, db
+from app.busca import indexar_produtos
+from app.models import Estoque, Fabricante, Fornecedor, Farmacia, Produto, ProdutoLog, User, Validade
+from app.saldos import sincronizar_saldos
+
+PRODUTOS = 5
+# Histórico do /relatorio: quantidade e código de barras de cada log, e o total do filtro
+_QUANTIDADE_LOG = re.compile(r'<td>(-?\d+)</td>\s*<td>\d{13}</td>')
+_TOTAL_LOGS = re.compile(r'(\d+) registro\(s\)')
+
+
+def _limpar_g(erro):
+    g.pop('_login_user', None)
+    g.pop('banco_leitura', None)
+
+
+@pytest.fixture(scope='session')
+def app():
+    flask_app.config.update(TESTING=True)
+    # Os templates usam o campo csrf_token; só a validação do token é desligada
+    with pytest.MonkeyPatch.context() as monkeypatch, flask_app.app_context():
+        monkeypatch.setattr(flask_wtf.csrf, 'validate_csrf', lambda *args, **kwargs: None)
+        flask_migrate.upgrade()
+        farmacia = Farmacia(nome='Farmácia Teste', endereco='Rua A', cep='12345-678', cnpj='1' * 14)
+        db.session.add_all([farmacia, Fabricante(id=1), Fornecedor(id=1)])
+        db.session.flush()
+        user = User(username='teste', email='teste@teste.com', farmacia_id=farmacia.id, administrador=True)
+        user.set_password('teste')
+        db.session.add(user)
+        db.session.commit()
+        # As requisições reusam este contexto da aplicação (e o g dele): o usuário carregado e a
+        # escolha do banco de leitura não podem passar de uma requisição (ou cliente) para outra
+        flask_app.teardown_request(_limpar_g)
+        yield flask_app
+        flask_app.teardown_request_funcs[None].remove(_limpar_g)
+
+
+@pytest.fixture(scope='session')
+def cliente(app):
+    """Cliente logado, com produtos, lotes, uma venda e uma tarefa de relatório já registrados."""
+    cliente = app.test_client()
+    cliente.post('/login', data={'username': 'teste', 'password': 'teste'})
+    validade = (datetime.now() + timedelta(days=60)).strftime('%Y-%m-%d')
+    for i in range(PRODUTOS):
+        cliente.post('/add_produto', data=dict(
+            nome=f'Produto {i}', genero='Analgésico', tipo='Generico', grupo='Geral', fabricante_id=1,
+            quantidade_embalagem=10, fornecedor_id=1, preco_compra=1.0, preco_venda=2.0,
+            codigo_barras=f'7890000000{i:03d}'
+        ))
+        cliente.post(f'/add_quantidade/{i + 1}', data=dict(quantidade=10, data_validade=validade))
+    cliente.post('/vendas', data=dict(produto_id=1, quantidade_carrinho=3))
+    cliente.post('/vendas', data=dict(finalizar_compra_action=1))
+    with app.app_context():
+        farmacia_id = db.session.scalar(sa.select(User.farmacia_id).where(User.username == 'teste'))
+        assert db.session.scalar(sa.select(sa.func.count()).select_from(Estoque).where(Estoque.farmacia_id == farmacia_id)) == PRODUTOS
+    return cliente
+
+
+@pytest.fixture
+def nova_farmacia(app, cliente):
+    """Cria uma farmácia isolada com `produtos` produtos (já no índice de busca), sem lotes e com
+    `saldo` no Estoque; devolve (farmacia_id, [produto_id]).
+
+    Depende de `cliente` para que os ids fixos usados em test_planos_de_consulta sejam os dele.
+    """
+    def criar(produtos=1, saldo=0):
+        farmacia = Farmacia(nome=f'Farmácia {uuid.uuid4().hex[:12]}', endereco='Rua B', cep='12345-678', cnpj='2' * 14)
+        db.session.add(farmacia)
+        db.session.flush()
+        criados = []
+        for i in range(produtos):
+            produto = Produto(
+                nome=f'Isolado {i}', genero='Analgésico', tipo='Generico', grupo='Geral', fabricante_id=1,
+                quantidade_embalagem=10, fornecedor_id=1, preco_compra=1.0, preco_venda=2.0,
+                codigo_barras=f'{farmacia.id:06d}{i:07d}', farmacia_id=farmacia.id
+            )
+            db.session.add(produto)
+            db.session.flush()
+            db.session.add(Estoque(farmacia_id=farmacia.id, produto_id=produto.id, quantidade=saldo))
+            criados.append(produto)
+        indexar_produtos(criados)
+        db.session.commit()
+        return farmacia.id, [produto.id for produto in criados]
+    return criar
+
+
+@pytest.fixture
+def entrar(app):
+    """Cliente logado como um usuário novo da farmácia `farmacia_id`."""
+    def criar(farmacia_id):
+        username = f'usuario_{uuid.uuid4().hex[:12]}'
+        user = User(username=username, email=f'{username}@teste.com', farmacia_id=farmacia_id)
+        user.set_password('teste')
+        db.session.add(user)
+        db.session.commit()
+        cliente = app.test_client()
+        cliente.post('/login', data={'username': username, 'password': 'teste'})
+        return cliente
+    return criar
+
+
+@pytest.fixture
+def lotes(app):
+    """Grava lotes [(quantidade, dias até a validade)] de um produto e sincroniza o saldo do Estoque."""
+    def gravar(produto_id, lotes):
+        agora = datetime.now()
+        db.session.add_all([
+            Validade(produto_id=produto_id, quantidade=quantidade, data_validade=agora + timedelta(days=dias))
+            for quantidade, dias in lotes
+        ])
+        db.session.flush()
+        sincronizar_saldos([produto_id])
+        db.session.commit()
+    return gravar
+
+
+@pytest.fixture
+def estoque(app):
+    """Estado de um produto depois de uma operação: (saldo do Estoque, quantidades dos lotes por
+    validade, [(operacao, quantidade)] dos logs)."""
+    def ler(produto_id):
+        return (
+            db.session.scalar(sa.select(Estoque.quantidade).where(Estoque.produto_id == produto_id)),
+            db.session.scalars(
+                sa.select(Validade.quantidade).where(Validade.produto_id == produto_id)
+                .order_by(Validade.data_validade, Validade.id)
+            ).all(),
+            db.session.execute(
+                sa.select(ProdutoLog.operacao, ProdutoLog.quantidade).where(ProdutoLog.produto_id == produto_id)
+                .order_by(ProdutoLog.id)
+            ).all(),
+        )
+    return ler
+
+
+@pytest.fixture
+def ler_relatorio(app):
+    """Lê uma página do histórico do /relatorio: (quantidades dos logs, total, {'Anterior'|'Próximo': url})."""
+    def ler(cliente, url):
+        pagina = cliente.get(url).get_data(as_text=True)
+        links = {}
+        for texto in ('Anterior', 'Próximo'):
+            encontrado = re.search(r'href="([^"#]+)">' + texto + '<', pagina)
+            if encontrado:
+                links[texto] = html.unescape(encontrado.group(1))
+        return _QUANTIDADE_LOG.findall(pagina), int(_TOTAL_LOGS.search(pagina).group(1)), links
+    return ler
+
+
+@pytest.fixture
+def percorrer_relatorio(ler_relatorio):
+    """(total, quantidades página a página para frente, para trás a partir da última) do /relatorio."""
+    def percorrer(cliente, parametros=''):
+        quantidades, total, links = ler_relatorio(cliente, '/relatorio' + parametros)
+        frente = [quantidades]
+        while 'Próximo' in links:
+            quantidades, _, links = ler_relatorio(cliente, links['Próximo'])
+            frente.append(quantidades)
+        tras = [quantidades]
+        while 'Anterior' in links:
+            quantidades, _, links = ler_relatorio(cliente, links['Anterior'])
+            tras.append(quantidades)
+        return total, frente, tras
+    return percorrer
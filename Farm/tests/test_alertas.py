@@ -0,0 +1,71 @@
+"""Recálculo dos alertas do painel (app.alertas) e versão dos dados do cache de relatórios."""
+import sqlite3
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import sqlalchemy as sa
+from app import db
+from app import alertas as modulo_alertas
+from app.alertas import atualizar_alertas, invalidar_alertas
+from app.cache_relatorios import registrar_alteracao_dados
+from app.models import Alerta, Farmacia
+
+
+def test_invalidar_alertas_nao_muda_a_versao_dos_dados(nova_farmacia):
+    farmacia_id, _ = nova_farmacia()
+    farmacia = db.session.get(Farmacia, farmacia_id)
+    atualizar_alertas(farmacia)
+    versao = farmacia.versao_dados
+
+    invalidar_alertas(farmacia_id)
+    db.session.commit()
+    assert farmacia.alertas_atualizados_em is None
+    assert farmacia.versao_dados == versao
+
+    registrar_alteracao_dados(farmacia_id)
+    db.session.commit()
+    assert farmacia.versao_dados == versao + 1
+
+
+def test_so_um_worker_recalcula_os_alertas(nova_farmacia):
+    farmacia_id, _ = nova_farmacia()
+    farmacia = db.session.get(Farmacia, farmacia_id)
+    atualizar_alertas(farmacia)
+    # Marca a lista gravada: um novo recálculo a apagaria
+    assert db.session.execute(
+        sa.update(Alerta).where(Alerta.farmacia_id == farmacia_id).values(mensagem='gravada')
+    ).rowcount
+
+    # Este worker leu a farmácia com os alertas vencidos; outro recalculou antes dele
+    vencido = datetime.now() - timedelta(days=1)
+    lida = SimpleNamespace(id=farmacia_id, alertas_atualizados_em=vencido)
+    db.session.execute(sa.update(Farmacia).where(Farmacia.id == farmacia_id).values(alertas_atualizados_em=datetime.now()))
+    db.session.commit()
+
+    atualizar_alertas(lida)
+    assert set(db.session.scalars(sa.select(Alerta.mensagem).where(Alerta.farmacia_id == farmacia_id))) == {'gravada'}
+
+
+def test_calculo_nao_segura_o_lock_de_escrita(nova_farmacia, monkeypatch):
+    farmacia_id, _ = nova_farmacia()
+    farmacia = db.session.get(Farmacia, farmacia_id)
+    invalidar_alertas(farmacia_id)
+    db.session.commit()
+    calcular_alertas = modulo_alertas.calcular_alertas
+    caixas = []
+
+    def calcular_com_caixa_gravando(farmacia_id):
+        # Um caixa (outra conexão, sem esperar) consegue gravar durante o cálculo
+        conexao = sqlite3.connect(db.engine.url.database, timeout=0)
+        try:
+            conexao.execute('BEGIN IMMEDIATE')
+            conexao.rollback()
+            caixas.append('gravou')
+        finally:
+            conexao.close()
+        return calcular_alertas(farmacia_id)
+
+    monkeypatch.setattr(modulo_alertas, 'calcular_alertas', calcular_com_caixa_gravando)
+    atualizar_alertas(farmacia)
+
+    assert caixas == ['gravou']
+    assert farmacia.alertas_atualizados_em is not None
@@ -0,0 +1,86 @@
+"""Leitura de códigos de barras no caixa (/api/scan): busca exata por farmácia, um ou vários códigos."""
+import pytest
+import sqlalchemy as sa
+from app import db
+from app.models import Produto
+
+
+@pytest.fixture
+def balcao(nova_farmacia, entrar, lotes):
+    """Farmácia com dois produtos (o primeiro com 8 unidades) e o caixa dela logado."""
+    farmacia_id, produto_ids = nova_farmacia(2)
+    lotes(produto_ids[0], [(5, 30), (3, 60)])
+    codigos = [db.session.get(Produto, produto_id).codigo_barras for produto_id in produto_ids]
+    return produto_ids, codigos, entrar(farmacia_id)
+
+
+def test_um_codigo(balcao):
+    (produto_id, _), (codigo, _), navegador = balcao
+    resposta = navegador.get(f'/api/scan/{codigo}')
+    assert resposta.status_code == 200
+    assert resposta.get_json() == {
+        'codigo_barras': codigo, 'produto_id': produto_id, 'nome': 'Isolado 0', 'preco_venda': 2.0, 'quantidade': 8
+    }
+    resposta = navegador.get('/api/scan/0000000000000')
+    assert resposta.status_code == 404
+    assert resposta.get_json()['codigo_barras'] == '0000000000000'
+
+
+def test_codigo_de_outra_farmacia_nao_e_encontrado(balcao, nova_farmacia, entrar):
+    _, (codigo, _), _ = balcao
+    outra, _ = nova_farmacia(0)
+    assert entrar(outra).get(f'/api/scan/{codigo}').status_code == 404
+
+
+def test_lote_de_codigos_numa_consulta(balcao):
+    (primeiro, segundo), (codigo, outro), navegador = balcao
+    consultas = []
+
+    def registrar(conexao, cursor, comando, parametros, contexto, executemany):
+        if 'FROM produto' in comando:
+            consultas.append(comando)
+    for engine in db.engines.values():
+        sa.event.listen(engine, 'before_cursor_execute', registrar)
+    try:
+        resposta = navegador.post('/api/scan', json={'codigos': [outro, 'inexistente', codigo, outro]})
+    finally:
+        for engine in db.engines.values():
+            sa.event.remove(engine, 'before_cursor_execute', registrar)
+
+    assert resposta.status_code == 200
+    dados = resposta.get_json()
+    # Na ordem enviada, repetidos inclusive
+    assert [produto['produto_id'] for produto in dados['produtos']] == [segundo, primeiro, segundo]
+    assert [produto['quantidade'] for produto in dados['produtos']] == [0, 8, 0]
+    assert dados['nao_encontrados'] == ['inexistente']
+    assert len(consultas) == 1
+    assert 'IN (' in consultas[0]
+
+
+@pytest.mark.parametrize('corpo', [None, {'codigos': '789'}, {'codigos': [789]}, {'codigo': ['789']}])
+def test_lote_invalido(balcao, corpo):
+    _, _, navegador = balcao
+    assert navegador.post('/api/scan', json=corpo).status_code == 400
+
+
+def test_lote_acima_do_maximo(balcao, monkeypatch):
+    _, (codigo, _), navegador = balcao
+    monkeypatch.setitem(navegador.application.config, 'SCAN_LOTE_MAXIMO', 2)
+    assert navegador.post('/api/scan', json={'codigos': [codigo] * 3}).status_code == 400
+    assert navegador.post('/api/scan', json={'codigos': [codigo] * 2}).status_code == 200
+
+
+def test_codigo_unico_por_farmacia(balcao, nova_farmacia):
+    (produto_id, _), (codigo, _), _ = balcao
+    produto = db.session.get(Produto, produto_id)
+    copia = {coluna: getattr(produto, coluna) for coluna in (
+        'genero', 'tipo', 'grupo', 'fabricante_id', 'quantidade_embalagem', 'fornecedor_id', 'preco_compra', 'preco_venda'
+    )}
+    db.session.add(Produto(nome='Repetido', codigo_barras=codigo, farmacia_id=produto.farmacia_id, **copia))
+    with pytest.raises(sa.exc.IntegrityError):
+        db.session.commit()
+    db.session.rollback()
+    # Em outra farmácia o mesmo código é outro produto
+    outra, _ = nova_farmacia(0)
+    db.session.add(Produto(nome='Repetido', codigo_barras=codigo, farmacia_id=outra, **copia))
+    db.session.commit()
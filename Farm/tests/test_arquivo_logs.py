@@ -0,0 +1,113 @@
+"""Arquivo frio do histórico (app.arquivo_logs): manifesto, sha256 e página que junta arquivo e tabela."""
+import os
+from datetime import datetime, timedelta
+import pytest
+import sqlalchemy as sa
+from app import app, db
+from app import arquivo_logs
+from app.arquivo_logs import arquivar_logs, limpar_arquivos
+from app.cache_relatorios import registrar_alteracao_dados
+from app.models import ArquivoLog, ProdutoLog
+
+LIMITE = datetime(2024, 3, 1)
+
+
+@pytest.fixture
+def historico(nova_farmacia, entrar):
+    """Farmácia com 25 logs em jan-fev/2024 (arquiváveis) e 12 recentes; quantidade única por log."""
+    farmacia_id, (produto_id,) = nova_farmacia()
+    agora = datetime.now()
+    antigos = [datetime(2024, 1, 3) + timedelta(days=2 * i, hours=i) for i in range(25)]
+    recentes = [agora - timedelta(minutes=i) for i in range(12)]
+    db.session.add_all([
+        ProdutoLog(produto_id=produto_id, farmacia_id=farmacia_id, quantidade=quantidade, timestamp=timestamp,
+                   operacao='removido' if quantidade % 3 else 'adicionado')
+        for quantidade, timestamp in enumerate(antigos + recentes, start=1)
+    ])
+    db.session.commit()
+    yield farmacia_id, produto_id, entrar(farmacia_id)
+    # Os arquivos desta farmácia não valem para os outros testes
+    for entrada in db.session.scalars(sa.select(ArquivoLog).where(ArquivoLog.farmacia_id == farmacia_id)):
+        os.remove(os.path.join(app.config['ARQUIVO_LOGS_PASTA'], entrada.caminho))
+        db.session.delete(entrada)
+    db.session.commit()
+
+
+def _vivos(farmacia_id):
+    return db.session.scalar(sa.select(sa.func.count()).select_from(ProdutoLog).where(ProdutoLog.farmacia_id == farmacia_id))
+
+
+@pytest.mark.parametrize('parametros', ['', '?operacao=removido', '?log_de=2024-01-15&log_ate=2024-02-10'])
+def test_pagina_igual_antes_e_depois_de_arquivar(historico, percorrer_relatorio, parametros):
+    farmacia_id, _, cliente = historico
+    antes = percorrer_relatorio(cliente, parametros)
+    assert antes[0] == sum(len(pagina) for pagina in antes[1])
+
+    entradas = arquivar_logs(LIMITE)
+    # O total por filtro fica no cache até a próxima movimentação; aqui ele precisa ser recalculado
+    registrar_alteracao_dados(farmacia_id)
+    db.session.commit()
+
+    assert {(entrada.farmacia_id, entrada.mes.month, entrada.linhas) for entrada in entradas} >= {
+        (farmacia_id, 1, 15), (farmacia_id, 2, 10)
+    }
+    assert _vivos(farmacia_id) == 12
+    assert percorrer_relatorio(cliente, parametros) == antes
+
+
+def test_primeira_pagina_cheia_nao_abre_o_arquivo(historico, ler_relatorio, monkeypatch):
+    _, _, cliente = historico
+    arquivar_logs(LIMITE)
+    abertos = []
+    linhas_arquivo = arquivo_logs._linhas_arquivo
+    monkeypatch.setattr(arquivo_logs, '_linhas_arquivo', lambda caminho: abertos.append(caminho) or linhas_arquivo(caminho))
+
+    # Os 12 logs recentes enchem a primeira página (10 por página), toda mais nova que o arquivo
+    quantidades, _, links = ler_relatorio(cliente, '/relatorio')
+    assert quantidades == [str(quantidade) for quantidade in range(26, 36)]
+    assert abertos == []
+
+    # A segunda página cruza a fronteira: os 2 recentes restantes e os mais novos do arquivo
+    quantidades, _, _ = ler_relatorio(cliente, links['Próximo'])
+    assert quantidades == ['36', '37'] + [str(quantidade) for quantidade in range(25, 17, -1)]
+    assert abertos
+
+
+def test_rearquivar_junta_o_retroativo_e_limpar_respeita_a_carencia(historico, percorrer_relatorio):
+    farmacia_id, produto_id, cliente = historico
+    arquivar_logs(LIMITE)
+    janeiro = db.session.scalar(sa.select(ArquivoLog).where(ArquivoLog.farmacia_id == farmacia_id, ArquivoLog.mes == datetime(2024, 1, 1).date()))
+    anterior = janeiro.caminho
+    # Venda offline de janeiro/2024 recebida depois do arquivamento
+    db.session.add(ProdutoLog(produto_id=produto_id, farmacia_id=farmacia_id, quantidade=100, operacao='removido',
+                              timestamp=datetime(2024, 1, 20, 10)))
+    db.session.commit()
+
+    arquivar_logs(LIMITE)
+    db.session.refresh(janeiro)
+    assert janeiro.caminho != anterior and janeiro.linhas == 16
+    pasta = app.config['ARQUIVO_LOGS_PASTA']
+    # O arquivo substituído fica durante a carência para quem ainda lê o manifesto antigo
+    assert os.path.exists(os.path.join(pasta, anterior))
+    assert limpar_arquivos(carencia=0) == [anterior]
+    assert not os.path.exists(os.path.join(pasta, anterior))
+
+    registrar_alteracao_dados(farmacia_id)
+    db.session.commit()
+    total, frente, _ = percorrer_relatorio(cliente, '?log_de=2024-01-19&log_ate=2024-01-21')
+    assert (total, frente) == (3, [['10', '100', '9']])
+
+
+def test_logs_verificar_falha_com_arquivo_alterado(historico):
+    farmacia_id, _, _ = historico
+    arquivar_logs(LIMITE)
+    runner = app.test_cli_runner()
+    assert runner.invoke(args=['logs', 'verificar']).exit_code == 0
+
+    caminho = db.session.scalar(sa.select(ArquivoLog.caminho).where(ArquivoLog.farmacia_id == farmacia_id).limit(1))
+    with open(os.path.join(app.config['ARQUIVO_LOGS_PASTA'], caminho), 'ab') as arquivo:
+        arquivo.write(b'corrompido')
+
+    resultado = runner.invoke(args=['logs', 'verificar'])
+    assert resultado.exit_code != 0
+    assert f'({caminho}): sha256 diferente do manifesto' in resultado.output
@@ -0,0 +1,77 @@
+"""Perfil do banco (app.banco e config): PRAGMAs do SQLite em cada conexão, pool e verificação na subida."""
+import sqlite3
+import pytest
+import sqlalchemy as sa
+from app import app, db
+from app.banco import _configurar_sqlite, configuracao_efetiva, verificar_banco, verificar_banco_na_inicializacao
+from app.roteamento import BIND_LEITURA
+from config import _binds_leitura, _opcoes_engine
+
+pytestmark = pytest.mark.usefixtures('app')
+
+
+def test_pragmas_aplicados_em_cada_conexao():
+    configuracao = configuracao_efetiva()
+    assert configuracao['journal_mode'] == 'wal'
+    assert configuracao['synchronous'] == 'NORMAL'
+    assert configuracao['busy_timeout'] == app.config['SQLITE_BUSY_TIMEOUT_MS']
+    assert configuracao['cache_size'] == -app.config['SQLITE_CACHE_KB']
+    assert (configuracao['pool'], configuracao['pool_size'], configuracao['max_overflow']) == ('QueuePool', 5, 10)
+    # Uma conexão nova do pool recebe os mesmos PRAGMAs
+    with db.engine.connect() as conexao:
+        conexao.invalidate()
+    with db.engine.connect() as conexao:
+        assert conexao.exec_driver_sql('PRAGMA busy_timeout').scalar() == app.config['SQLITE_BUSY_TIMEOUT_MS']
+
+
+def test_engine_de_leitura_nao_grava():
+    with db.engines[BIND_LEITURA].connect() as conexao:
+        assert conexao.exec_driver_sql('PRAGMA journal_mode').scalar() == 'wal'
+        assert conexao.exec_driver_sql('SELECT count(*) FROM farmacia').scalar() > 0
+        with pytest.raises(sa.exc.OperationalError, match='readonly'):
+            conexao.exec_driver_sql("UPDATE farmacia SET nome = nome")
+
+
+def test_opcoes_por_banco(monkeypatch):
+    monkeypatch.setenv('DB_POOL_SIZE', '3')
+    arquivo = _opcoes_engine('sqlite:////tmp/estoque.db')
+    assert arquivo['pool_size'] == 3
+    assert arquivo['connect_args'] == {'timeout': 5.0}
+    assert _opcoes_engine('sqlite:///:memory:') == {}
+    servidor = _opcoes_engine('postgresql://usuario@servidor/estoque')
+    assert servidor['pool_pre_ping'] and servidor['pool_size'] == 3
+    assert 'connect_timeout' in servidor['connect_args']
+
+
+def test_engine_de_leitura_por_banco(monkeypatch):
+    monkeypatch.delenv('DATABASE_LEITURA_URL', raising=False)
+    assert _binds_leitura('sqlite:////tmp/estoque.db')['leitura']['url'] == 'sqlite:///file:/tmp/estoque.db?mode=ro&uri=true'
+    assert _binds_leitura('sqlite:///:memory:') == {}
+    # Sem réplica informada, o PostgreSQL lê do próprio primário
+    assert _binds_leitura('postgresql://usuario@servidor/estoque') == {}
+    monkeypatch.setenv('DATABASE_LEITURA_URL', 'postgresql://usuario@replica/estoque')
+    assert _binds_leitura('postgresql://usuario@servidor/estoque')['leitura']['url'] == 'postgresql://usuario@replica/estoque'
+
+
+def test_perfil_diferente_impede_a_subida(monkeypatch):
+    assert verificar_banco()[1] == []
+    verificar_banco_na_inicializacao()
+    assert 'Configuração conforme o perfil.' in app.test_cli_runner().invoke(args=['banco', 'verificar']).output
+
+    # O banco continua em WAL; o perfil pede outro modo
+    monkeypatch.setitem(app.config, 'SQLITE_JOURNAL_MODE', 'DELETE')
+    assert verificar_banco()[1] == ['journal_mode wal (pedido: DELETE)']
+    with pytest.raises(RuntimeError, match='journal_mode wal'):
+        verificar_banco_na_inicializacao()
+    assert 'Aviso: journal_mode wal (pedido: DELETE)' in app.test_cli_runner().invoke(args=['banco', 'verificar']).output
+
+
+def test_conexao_que_nao_e_sqlite_nao_recebe_pragmas():
+    # O listener vale para todos os engines; só conexões sqlite3 recebem os PRAGMAs
+    class Conexao:
+        def cursor(self):
+            raise AssertionError('não deveria executar nada')
+    _configurar_sqlite(Conexao(), None)
+    conexao = sqlite3.connect(':memory:')
+    _configurar_sqlite(conexao, None)
+    assert conexao.execute('PRAGMA busy_timeout').fetchone()[0] == app.config['SQLITE_BUSY_TIMEOUT_MS']
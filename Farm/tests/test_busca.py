@@ -0,0 +1,65 @@
+"""Índice de busca de produtos (app.busca): mantido pelas views de produto e consultado por prefixo."""
+import sqlalchemy as sa
+from app import db
+from app import busca
+from app.busca import filtro_produtos, fts_disponivel
+from app.models import Produto
+
+
+def _formulario(nome, codigo_barras):
+    return {
+        'nome': nome, 'genero': 'Analgésico', 'tipo': 'Generico', 'numeracao_original': '0', 'grupo': 'Geral',
+        'fabricante_id': '1', 'quantidade_embalagem': '10', 'fornecedor_id': '1',
+        'preco_compra': '1.5', 'preco_venda': '3.0', 'codigo_barras': codigo_barras
+    }
+
+
+def _encontrados(farmacia_id, **termos):
+    return set(db.session.scalars(
+        sa.select(Produto.nome).where(Produto.farmacia_id == farmacia_id, *filtro_produtos(**termos))
+    ))
+
+
+def _indexado(produto_id):
+    return db.session.execute(
+        sa.text('SELECT nome FROM produto_busca WHERE rowid = :id'), {'id': produto_id}
+    ).scalar()
+
+
+def test_views_mantem_o_indice(nova_farmacia, entrar):
+    farmacia_id, _ = nova_farmacia(produtos=0)
+    navegador = entrar(farmacia_id)
+    assert fts_disponivel()
+
+    for nome, codigo_barras in (('Dipirona Sódica', '7890000000011'), ('Ácido Acetilsalicílico', '7890000000028')):
+        assert navegador.post('/add_produto', data=_formulario(nome, codigo_barras)).status_code == 302
+    dipirona = db.session.scalar(sa.select(Produto.id).where(Produto.farmacia_id == farmacia_id, Produto.nome == 'Dipirona Sódica'))
+
+    # Prefixo e acentos: o ILIKE não acharia 'Ácido' por 'acido'
+    assert _encontrados(farmacia_id, nome='dipiro') == {'Dipirona Sódica'}
+    assert _encontrados(farmacia_id, nome='acido') == {'Ácido Acetilsalicílico'}
+    assert _encontrados(farmacia_id, nome='acido acetil') == {'Ácido Acetilsalicílico'}
+    assert 'Dipirona Sódica' in navegador.get('/stock?nome=dipiro').get_data(as_text=True)
+
+    navegador.post(f'/edit_produto/{dipirona}', data=_formulario('Paracetamol', '7890000000011'))
+    assert _indexado(dipirona) == 'Paracetamol'
+    assert _encontrados(farmacia_id, nome='dipiro') == set()
+    assert _encontrados(farmacia_id, nome='paraceta') == {'Paracetamol'}
+
+    navegador.get(f'/delete_produto/{dipirona}')
+    assert _indexado(dipirona) is None
+    assert _encontrados(farmacia_id, nome='paraceta') == set()
+    assert _encontrados(farmacia_id, nome='acido') == {'Ácido Acetilsalicílico'}
+
+
+def test_indice_criado_depois_passa_a_ser_usado(monkeypatch):
+    monkeypatch.setattr(busca, '_disponivel', set())
+    # Antes da migração que cria o índice
+    db.session.execute(sa.text('ALTER TABLE produto_busca RENAME TO produto_busca_antes'))
+    db.session.commit()
+    try:
+        assert not fts_disponivel()
+    finally:
+        db.session.execute(sa.text('ALTER TABLE produto_busca_antes RENAME TO produto_busca'))
+        db.session.commit()
+    assert fts_disponivel()
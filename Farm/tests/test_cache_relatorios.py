@@ -0,0 +1,73 @@
+"""Cache de relatórios compartilhado entre os workers (app.cache_relatorios), invalidado pela versão dos dados."""
+from datetime import date, timedelta
+import pytest
+from app import app, db
+from app import routes
+from app.cache_relatorios import em_cache, registrar_alteracao_dados
+from app.models import Farmacia
+
+
+@pytest.fixture
+def calculos(monkeypatch):
+    """Conta as chamadas de calcular_demandas feitas pelo /relatorio."""
+    chamadas = []
+    calcular = routes.calcular_demandas
+
+    def contando(*args, **kwargs):
+        chamadas.append(args)
+        return calcular(*args, **kwargs)
+    monkeypatch.setattr(routes, 'calcular_demandas', contando)
+    return chamadas
+
+
+def test_em_cache_por_parametros_e_versao(nova_farmacia):
+    farmacia_id, _ = nova_farmacia(0)
+    farmacia = db.session.get(Farmacia, farmacia_id)
+    calculados = []
+
+    def calcular(valor):
+        return lambda: calculados.append(valor) or {'valor': valor}
+
+    assert em_cache(farmacia, 'teste', {'periodo': 'mes'}, calcular(1)) == {'valor': 1}
+    assert em_cache(farmacia, 'teste', {'periodo': 'mes'}, calcular(2)) == {'valor': 1}
+    assert em_cache(farmacia, 'teste', {'periodo': 'ano'}, calcular(3)) == {'valor': 3}
+    # Outra farmácia com os mesmos parâmetros não enxerga a entrada
+    outra = db.session.get(Farmacia, nova_farmacia(0)[0])
+    assert em_cache(outra, 'teste', {'periodo': 'mes'}, calcular(4)) == {'valor': 4}
+
+    registrar_alteracao_dados(farmacia_id)
+    db.session.commit()
+    assert em_cache(farmacia, 'teste', {'periodo': 'mes'}, calcular(5)) == {'valor': 5}
+    assert calculados == [1, 3, 4, 5]
+
+
+def test_entrada_vencida_e_recalculada(nova_farmacia, monkeypatch):
+    farmacia = db.session.get(Farmacia, nova_farmacia(0)[0])
+    em_cache(farmacia, 'teste', {}, lambda: 1)
+    monkeypatch.setitem(app.config, 'RELATORIO_CACHE_SEGUNDOS', 0)
+    assert em_cache(farmacia, 'teste', {}, lambda: 2) == 2
+
+
+def test_cache_inacessivel_calcula_na_hora(nova_farmacia, monkeypatch, tmp_path):
+    farmacia = db.session.get(Farmacia, nova_farmacia(0)[0])
+    monkeypatch.setitem(app.config, 'RELATORIO_CACHE_ARQUIVO', str(tmp_path / 'nao' / 'existe.db'))
+    assert em_cache(farmacia, 'teste', {}, lambda: 1) == 1
+    assert em_cache(farmacia, 'teste', {}, lambda: 2) == 2
+
+
+def test_relatorio_reaproveita_ate_o_estoque_mudar(nova_farmacia, entrar, lotes, calculos):
+    farmacia_id, (produto_id,) = nova_farmacia()
+    lotes(produto_id, [(10, 60)])
+    navegador = entrar(farmacia_id)
+
+    navegador.get('/relatorio?periodo=mes')
+    # Mesma tela, outra página do histórico: a demanda vem do cache
+    navegador.get('/relatorio?periodo=mes&operacao=adicionado')
+    assert len(calculos) == 1
+    navegador.get('/relatorio?periodo=semana')
+    assert len(calculos) == 2
+
+    validade = (date.today() + timedelta(days=90)).isoformat()
+    navegador.post(f'/add_quantidade/{produto_id}', data={'quantidade': 4, 'data_validade': validade})
+    navegador.get('/relatorio?periodo=mes')
+    assert len(calculos) == 3
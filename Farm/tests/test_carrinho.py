@@ -0,0 +1,117 @@
+"""Reservas de estoque do carrinho do caixa (app.carrinho): disputa entre caixas e expiração."""
+import threading
+from datetime import timedelta
+import click
+import pytest
+import sqlalchemy as sa
+from app import app, db
+from app import carrinho
+from app.carrinho import itens_carrinho, liberar_reservas_expiradas, reservar
+from app.cli import servidor_de_desenvolvimento
+from app.models import ItemCarrinho, User
+
+
+def _preparar(nova_farmacia, saldo):
+    farmacia_id, (produto_id,) = nova_farmacia(saldo=saldo)
+    user_id = db.session.scalar(sa.select(User.id).where(User.username == 'teste'))
+    return farmacia_id, produto_id, user_id
+
+
+def _reservado(produto_id):
+    return db.session.scalar(
+        sa.select(sa.func.coalesce(sa.func.sum(ItemCarrinho.quantidade), 0)).where(ItemCarrinho.produto_id == produto_id)
+    )
+
+
+def test_reserva_desconta_os_outros_caixas(nova_farmacia):
+    farmacia_id, produto_id, user_id = _preparar(nova_farmacia, 10)
+
+    assert reservar(farmacia_id, user_id, 'a', produto_id, 6) == (True, 10)
+    assert reservar(farmacia_id, user_id, 'b', produto_id, 5) == (False, 4)
+    assert reservar(farmacia_id, user_id, 'b', produto_id, 4) == (True, 4)
+    # O próprio caixa pode trocar a quantidade dentro do que os outros deixaram
+    assert reservar(farmacia_id, user_id, 'a', produto_id, 7) == (False, 6)
+    assert reservar(farmacia_id, user_id, 'a', produto_id, 5) == (True, 6)
+    assert _reservado(produto_id) == 9
+
+
+def test_caixas_simultaneos_nao_reservam_alem_do_saldo(nova_farmacia):
+    farmacia_id, produto_id, user_id = _preparar(nova_farmacia, 10)
+    resultados = []
+
+    def caixa(numero):
+        with app.app_context():
+            resultados.append(reservar(farmacia_id, user_id, f'caixa {numero}', produto_id, 3)[0])
+
+    threads = [threading.Thread(target=caixa, args=(numero,)) for numero in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert resultados.count(True) == 3
+    assert _reservado(produto_id) == 9
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    """Para o relógio das reservas; `relogio(minutos)` o avança."""
+    agora = carrinho._agora()
+
+    def avancar(minutos):
+        monkeypatch.setattr(carrinho, '_agora', lambda: agora + timedelta(minutes=minutos))
+    avancar(0)
+    return avancar
+
+
+def test_reserva_expirada_volta_para_os_outros_caixas(nova_farmacia, relogio):
+    farmacia_id, produto_id, user_id = _preparar(nova_farmacia, 10)
+    ttl = app.config['RESERVAS_TTL_MINUTOS']
+    assert reservar(farmacia_id, user_id, 'a', produto_id, 6) == (True, 10)
+
+    relogio(ttl - 1)
+    assert reservar(farmacia_id, user_id, 'b', produto_id, 5) == (False, 4)
+
+    relogio(ttl + 1)
+    # Antes mesmo da limpeza, o item vencido some do carrinho e não conta contra os outros
+    assert itens_carrinho(user_id, 'a') == {}
+    assert reservar(farmacia_id, user_id, 'b', produto_id, 10) == (True, 10)
+    liberar_reservas_expiradas()
+    assert db.session.execute(
+        sa.select(ItemCarrinho.caixa, ItemCarrinho.quantidade).where(ItemCarrinho.produto_id == produto_id)
+    ).all() == [('b', 10)]
+
+
+def test_atividade_no_carrinho_renova_todos_os_itens(nova_farmacia, relogio):
+    farmacia_id, (primeiro, segundo) = nova_farmacia(2, saldo=5)
+    user_id = db.session.scalar(sa.select(User.id).where(User.username == 'teste'))
+    ttl = app.config['RESERVAS_TTL_MINUTOS']
+    reservar(farmacia_id, user_id, 'a', primeiro, 2)
+
+    relogio(ttl - 1)
+    reservar(farmacia_id, user_id, 'a', segundo, 3)
+
+    # O primeiro item venceria agora, mas a reserva do segundo renovou o carrinho inteiro
+    relogio(ttl + 1)
+    assert itens_carrinho(user_id, 'a') == {primeiro: 2, segundo: 3}
+    relogio(2 * ttl)
+    assert itens_carrinho(user_id, 'a') == {}
+
+
+@pytest.mark.parametrize('comando, recarregar, filho, esperado', [
+    ('run', False, False, True),
+    # Com o reloader, só o processo filho atende as requisições
+    ('run', True, False, False),
+    ('run', True, True, True),
+    # Outros comandos (e a importação pelo gunicorn) não iniciam a limpeza aqui
+    ('shell', False, False, False),
+])
+def test_limpeza_so_no_processo_do_servidor(monkeypatch, comando, recarregar, filho, esperado):
+    if filho:
+        monkeypatch.setenv('WERKZEUG_RUN_MAIN', 'true')
+    else:
+        monkeypatch.delenv('WERKZEUG_RUN_MAIN', raising=False)
+    with click.Context(click.Command(comando), info_name=comando) as contexto:
+        contexto.params = {'reload': recarregar}
+        assert servidor_de_desenvolvimento() is esperado
+    assert servidor_de_desenvolvimento() is False
@@ -0,0 +1,105 @@
+"""Baixa FEFO do carrinho (app.checkout.finalizar_venda): concorrência entre caixas e novas tentativas."""
+import threading
+import pytest
+import sqlalchemy as sa
+from app import app, db
+from app import checkout
+from app.checkout import LoteAlterado, finalizar_venda
+from app.models import Validade
+
+
+def test_baixa_pelos_lotes_que_vencem_primeiro(nova_farmacia, lotes, estoque):
+    farmacia_id, (produto_id,) = nova_farmacia()
+    # Gravados fora da ordem de validade: 5 em 60 dias, 3 em 10 dias, 4 em 30 dias
+    lotes(produto_id, [(5, 60), (3, 10), (4, 30)])
+
+    assert finalizar_venda(farmacia_id, {produto_id: 6}) == []
+
+    # O lote de 10 dias acaba (e é apagado), o de 30 dias cede 3 e o de 60 fica intacto
+    assert estoque(produto_id) == (6, [1, 5], [('removido', 6)])
+
+
+def test_falta_em_um_item_nao_baixa_nenhum(nova_farmacia, lotes, estoque):
+    farmacia_id, (com_saldo, sem_saldo) = nova_farmacia(2)
+    lotes(com_saldo, [(3, 10), (4, 30)])
+    lotes(sem_saldo, [(5, 10)])
+
+    faltas = finalizar_venda(farmacia_id, {com_saldo: 5, sem_saldo: 8})
+
+    assert [(falta.produto_id, falta.solicitado, falta.disponivel) for falta in faltas] == [(sem_saldo, 8, 5)]
+    assert estoque(com_saldo) == (7, [3, 4], [])
+    assert estoque(sem_saldo) == (5, [5], [])
+
+
+def test_caixas_simultaneos_nao_vendem_alem_dos_lotes(nova_farmacia, lotes, estoque):
+    farmacia_id, (produto_id,) = nova_farmacia()
+    lotes(produto_id, [(4, 10), (6, 30)])
+    faltas = []
+
+    def caixa():
+        with app.app_context():
+            faltas.append(finalizar_venda(farmacia_id, {produto_id: 3}))
+
+    threads = [threading.Thread(target=caixa) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert [bool(falta) for falta in faltas].count(False) == 3
+    assert estoque(produto_id) == (1, [1], [('removido', 3)] * 3)
+
+
+@pytest.fixture
+def leituras(monkeypatch):
+    """Conta as leituras de lotes do checkout, uma por tentativa, sem espera entre elas."""
+    monkeypatch.setitem(app.config, 'CHECKOUT_ESPERA_BASE', 0)
+    ler_lotes = checkout._lotes_disponiveis
+    feitas = []
+
+    def interceptar(depois_de_ler=lambda lotes: None):
+        def ler(produto_ids):
+            lotes = ler_lotes(produto_ids)
+            feitas.append(produto_ids)
+            depois_de_ler(lotes)
+            return lotes
+        monkeypatch.setattr(checkout, '_lotes_disponiveis', ler)
+        return feitas
+    return interceptar
+
+
+def test_lote_baixado_por_outro_caixa_refaz_a_venda(nova_farmacia, lotes, estoque, leituras):
+    farmacia_id, (produto_id,) = nova_farmacia()
+    lotes(produto_id, [(3, 10), (5, 30)])
+
+    def outro_caixa(lotes_lidos):
+        # Na primeira tentativa, outro caixa esvazia o lote que vence primeiro logo depois da leitura
+        if len(feitas) == 1:
+            (primeiro, _), _ = lotes_lidos[produto_id]
+            with db.engine.begin() as conexao:
+                conexao.execute(sa.update(Validade).where(Validade.id == primeiro).values(quantidade=0))
+    feitas = leituras(outro_caixa)
+
+    assert finalizar_venda(farmacia_id, {produto_id: 4}) == []
+
+    # A nova tentativa relê os lotes e tira tudo do segundo
+    assert len(feitas) == 2
+    assert estoque(produto_id) == (1, [1], [('removido', 4)])
+
+
+def test_conflito_persistente_desiste_sem_baixar_nada(nova_farmacia, lotes, estoque, leituras, monkeypatch):
+    farmacia_id, (produto_id,) = nova_farmacia()
+    lotes(produto_id, [(5, 10)])
+    monkeypatch.setitem(app.config, 'CHECKOUT_TENTATIVAS', 3)
+
+    def leitura_desatualizada(lotes_lidos):
+        # Toda leitura enxerga mais do que o lote tem quando chega o UPDATE
+        for lote in lotes_lidos[produto_id]:
+            lote[1] += 5
+    feitas = leituras(leitura_desatualizada)
+
+    with pytest.raises(LoteAlterado):
+        finalizar_venda(farmacia_id, {produto_id: 8})
+
+    assert len(feitas) == 3
+    assert estoque(produto_id) == (5, [5], [])
@@ -0,0 +1,86 @@
+"""Exportações CSV em streaming (app.exportacao): histórico de movimentação e demanda."""
+import csv
+import io
+from datetime import datetime, timedelta
+import pytest
+import sqlalchemy as sa
+from app import app, db
+from app.models import Produto
+from app.resumo import registrar_logs
+
+INSTANTE = datetime(2026, 1, 10, 15)
+
+
+@pytest.fixture
+def exportacao(nova_farmacia, entrar):
+    """Farmácia com 5 logs de dois produtos, um deles excluído agora (o que grava um sexto log), e o cliente dela."""
+    # O excluído é o de id menor: o SQLite reaproveitaria o maior id para o próximo produto criado
+    farmacia_id, (excluido, mantido) = nova_farmacia(2)
+    registrar_logs(farmacia_id, [
+        {'produto_id': produto_id, 'quantidade': quantidade, 'operacao': operacao, 'timestamp': INSTANTE + timedelta(hours=horas)}
+        for produto_id, quantidade, operacao, horas in (
+            (mantido, 10, 'adicionado', 0), (excluido, 4, 'adicionado', 1), (mantido, 3, 'removido', 2),
+            (excluido, 1, 'removido', 3), (mantido, 2, 'removido', 4)
+        )
+    ])
+    db.session.commit()
+    navegador = entrar(farmacia_id)
+    navegador.get(f'/delete_produto/{excluido}')
+    return farmacia_id, db.session.get(Produto, mantido).codigo_barras, navegador
+
+
+def _linhas(resposta):
+    texto = resposta.get_data(as_text=True)
+    assert texto.startswith('﻿')
+    return list(csv.reader(io.StringIO(texto[1:])))
+
+
+def test_logs_em_ordem_cronologica_com_horario_local(exportacao):
+    _, codigo, navegador = exportacao
+    resposta = navegador.get('/relatorio/exportar/logs.csv')
+    assert resposta.mimetype == 'text/csv'
+    assert 'attachment; filename="logs_' in resposta.headers['Content-Disposition']
+    linhas = _linhas(resposta)
+    assert linhas[0] == ['Data', 'Produto', 'Código de Barras', 'Operação', 'Quantidade']
+    assert linhas[1:-1] == [
+        ['2026-01-10 12:00:00', 'Isolado 1', codigo, 'adicionado', '10'],
+        ['2026-01-10 13:00:00', 'Produto Excluído', 'N/A', 'adicionado', '4'],
+        ['2026-01-10 14:00:00', 'Isolado 1', codigo, 'removido', '3'],
+        ['2026-01-10 15:00:00', 'Produto Excluído', 'N/A', 'removido', '1'],
+        ['2026-01-10 16:00:00', 'Isolado 1', codigo, 'removido', '2'],
+    ]
+    # A exclusão fica registrada no fim, com a quantidade que o produto tinha
+    assert linhas[-1][1:] == ['Produto Excluído', 'N/A', 'removido', '0']
+
+
+@pytest.mark.parametrize('parametros, quantidades', [
+    ('operacao=removido', ['3', '1', '2', '0']),
+    ('operacao=removido&produto=isolado', ['3', '2']),
+    ('log_de=2026-01-10&log_ate=2026-01-10', ['10', '4', '3', '1', '2']),
+    ('log_de=2026-01-11&log_ate=2026-01-31', []),
+])
+def test_logs_filtrados(exportacao, parametros, quantidades):
+    _, _, navegador = exportacao
+    linhas = _linhas(navegador.get(f'/relatorio/exportar/logs.csv?{parametros}'))
+    assert [linha[4] for linha in linhas[1:]] == quantidades
+
+
+def test_logs_saem_em_pedacos_do_tamanho_do_lote(exportacao, monkeypatch):
+    _, _, navegador = exportacao
+    monkeypatch.setitem(app.config, 'EXPORTACAO_LOTE', 2)
+    resposta = navegador.get('/relatorio/exportar/logs.csv', buffered=False)
+    pedacos = [pedaco for pedaco in resposta.response if pedaco]
+    resposta.close()
+    # Cabeçalho com o primeiro lote, depois um pedaço por lote de 2 logs
+    assert [pedaco.decode().count('\n') for pedaco in pedacos] == [3, 2, 2]
+
+
+def test_demanda_igual_ao_relatorio(exportacao, lotes):
+    farmacia_id, codigo, navegador = exportacao
+    produto_id = db.session.scalar(sa.select(Produto.id).where(Produto.codigo_barras == codigo, Produto.farmacia_id == farmacia_id))
+    lotes(produto_id, [(5, 60)])
+    inicio = INSTANTE.date()
+    linhas = _linhas(navegador.get(f'/relatorio/exportar/demanda.csv?periodo=personalizado&data_inicio={inicio}&data_fim={inicio}'))
+    assert linhas[0][:3] == ['Produto', 'Preço de Venda', 'Demanda Média Diária']
+    # Só o produto que ficou: 5 unidades removidas num dia
+    assert [(linha[0], linha[2], linha[8]) for linha in linhas[1:]] == [('Isolado 1', '5.0', '5')]
@@ -0,0 +1,129 @@
+"""Importação do catálogo por CSV (app.importacao_catalogo): atualizações e lotes com erros parciais."""
+import pytest
+import sqlalchemy as sa
+from app import app, db
+from app import importacao_catalogo
+from app.importacao_catalogo import COLUNAS, _decimal, importar_catalogo, ler_csv
+from app.models import Produto
+
+
+def _linha(codigo_barras, **valores):
+    linha = dict(
+        nome='Importado', genero='Analgésico', tipo='Generico', grupo='Geral', fabricante_id='1',
+        quantidade_embalagem='10', fornecedor_id='1', preco_compra='1,00', preco_venda='2,00', codigo_barras=codigo_barras
+    )
+    linha.update(valores)
+    return linha
+
+
+@pytest.mark.parametrize('valor, esperado', [
+    ('12,50', 12.5), ('12.50', 12.5), ('1.234,56', 1234.56), ('1.234.567,8', 1234567.8),
+    ('1.234.567', 1234567), ('1,234.56', 1234.56), ('3', 3),
+])
+def test_decimal_aceita_o_formato_brasileiro(valor, esperado):
+    assert _decimal(valor) == esperado
+
+
+def _csv(*linhas):
+    return '\n'.join([';'.join(COLUNAS)] + [';'.join(linha.get(coluna, '') for coluna in COLUNAS) for linha in linhas]).encode()
+
+
+def _catalogo(farmacia_id):
+    return dict(db.session.execute(
+        sa.select(Produto.codigo_barras, Produto.preco_venda).where(Produto.farmacia_id == farmacia_id)
+    ).all())
+
+
+def test_produto_atualizado_ganha_log_de_edicao(nova_farmacia, estoque):
+    farmacia_id, (produto_id,) = nova_farmacia(saldo=7)
+    codigo_barras = db.session.get(Produto, produto_id).codigo_barras
+
+    resultado = importar_catalogo(farmacia_id, [(2, _linha(codigo_barras, preco_venda='1.234,56'))])
+
+    assert (resultado.atualizados, resultado.inseridos, resultado.erros) == (1, 0, [])
+    assert db.session.scalar(sa.select(Produto.preco_venda).where(Produto.id == produto_id)) == 1234.56
+    assert estoque(produto_id) == (7, [], [('editado', 7)])
+
+
+def test_linhas_invalidas_nao_barram_as_validas(nova_farmacia, monkeypatch):
+    monkeypatch.setitem(app.config, 'CATALOGO_LOTE_TRANSACAO', 2)
+    farmacia_id, (produto_id,) = nova_farmacia()
+    existente = db.session.get(Produto, produto_id).codigo_barras
+    novos = [f'{farmacia_id:06d}{numero:07d}' for numero in range(101, 105)]
+    dados = _csv(
+        _linha(novos[0]),
+        _linha(novos[1], tipo='Similar', preco_venda='0'),
+        _linha(existente, preco_venda='3,50'),
+        _linha(novos[0], preco_venda='9,99'),
+        _linha('123', quantidade_embalagem='dez'),
+        _linha(novos[2], nome=''),
+        _linha(novos[3]),
+    )
+
+    resultado = importar_catalogo(farmacia_id, ler_csv(dados))
+
+    # Erros pelo número da linha no arquivo (o cabeçalho é a linha 1)
+    assert resultado.erros == [
+        (3, ['tipo: use Generico, Original ou Outros', 'preco_venda: deve ser maior que zero']),
+        (5, ['codigo_barras: repetido (linha 2)']),
+        (6, ['quantidade_embalagem: número inválido', 'codigo_barras: deve ter 12 ou 13 caracteres']),
+        (7, ['nome: obrigatório']),
+    ]
+    assert (resultado.inseridos, resultado.atualizados) == (2, 1)
+    assert _catalogo(farmacia_id) == {existente: 3.5, novos[0]: 2.0, novos[3]: 2.0}
+
+
+def test_falha_em_um_bloco_mantem_os_anteriores_e_a_reimportacao_completa(nova_farmacia, monkeypatch):
+    monkeypatch.setitem(app.config, 'CATALOGO_LOTE_TRANSACAO', 2)
+    farmacia_id, (produto_id,) = nova_farmacia()
+    existente = db.session.get(Produto, produto_id).codigo_barras
+    codigos = [f'{farmacia_id:06d}{numero:07d}' for numero in range(201, 205)]
+    linhas = ler_csv(_csv(*[_linha(codigo_barras) for codigo_barras in codigos]))
+    aplicar_bloco = importacao_catalogo._aplicar_bloco
+    blocos = []
+
+    def falhar_no_segundo_bloco(farmacia_id, bloco, resultado):
+        blocos.append(bloco)
+        if len(blocos) == 2:
+            raise sa.exc.OperationalError('INSERT INTO produto', {}, Exception('disk I/O error'))
+        return aplicar_bloco(farmacia_id, bloco, resultado)
+
+    monkeypatch.setattr(importacao_catalogo, '_aplicar_bloco', falhar_no_segundo_bloco)
+    with pytest.raises(sa.exc.OperationalError):
+        importar_catalogo(farmacia_id, linhas)
+
+    # O primeiro bloco já estava gravado; do segundo não ficou nada
+    assert sorted(_catalogo(farmacia_id)) == [existente] + codigos[:2]
+
+    monkeypatch.setattr(importacao_catalogo, '_aplicar_bloco', aplicar_bloco)
+    resultado = importar_catalogo(farmacia_id, linhas)
+
+    assert (resultado.atualizados, resultado.inseridos, resultado.erros) == (2, 2, [])
+    assert sorted(_catalogo(farmacia_id)) == [existente] + codigos
+
+
+def test_codigo_inserido_por_outra_importacao_vira_atualizacao(nova_farmacia, monkeypatch):
+    farmacia_id, _ = nova_farmacia()
+    codigo_barras = f'{farmacia_id:06d}9999999'
+    ler_existentes = importacao_catalogo._existentes
+
+    def concorrente(farmacia_id, codigos_barras):
+        # Outra importação grava o mesmo código logo depois desta ler os existentes
+        existentes = ler_existentes(farmacia_id, codigos_barras)
+        monkeypatch.setattr(importacao_catalogo, '_existentes', ler_existentes)
+        with db.engine.begin() as conexao:
+            conexao.execute(sa.insert(Produto), dict(
+                nome='Concorrente', genero='Analgésico', tipo='Generico', grupo='Geral', fabricante_id=1,
+                quantidade_embalagem=10, fornecedor_id=1, preco_compra=1.0, preco_venda=2.0,
+                codigo_barras=codigo_barras, farmacia_id=farmacia_id
+            ))
+        return existentes
+
+    monkeypatch.setattr(importacao_catalogo, '_existentes', concorrente)
+    resultado = importar_catalogo(farmacia_id, [(2, _linha(codigo_barras))])
+
+    assert (resultado.atualizados, resultado.inseridos) == (1, 0)
+    nomes = db.session.scalars(
+        sa.select(Produto.nome).where(Produto.farmacia_id == farmacia_id, Produto.codigo_barras == codigo_barras)
+    ).all()
+    assert nomes == ['Importado']
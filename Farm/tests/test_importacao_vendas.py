@@ -0,0 +1,107 @@
+"""Vendas offline recebidas em lote (app.importacao_vendas): reenvio e lotes com erros parciais."""
+import pytest
+import sqlalchemy as sa
+from app import app, db
+from app import importacao_vendas
+from app.importacao_vendas import importar_vendas
+from app.models import Produto, VendaImportada
+
+
+def _venda(chave, minuto, *itens):
+    return {'chave': chave, 'timestamp': f'2026-01-10T09:{minuto:02d}:00-03:00', 'itens': list(itens)}
+
+
+def _estado(farmacia_id, produto_ids, estoque):
+    # Tudo o que uma venda aplicada altera: lotes, saldos, logs e vendas registradas
+    return [estoque(produto_id) for produto_id in produto_ids], db.session.execute(
+        sa.select(VendaImportada.chave, VendaImportada.status).where(VendaImportada.farmacia_id == farmacia_id)
+        .order_by(VendaImportada.chave)
+    ).all()
+
+
+def test_reenvio_do_mesmo_lote_nao_altera_nada(nova_farmacia, lotes, estoque):
+    farmacia_id, (primeiro, segundo) = nova_farmacia(2)
+    lotes(primeiro, [(4, 10), (6, 30)])
+    lotes(segundo, [(2, 10)])
+    codigo_barras = db.session.scalar(sa.select(Produto.codigo_barras).where(Produto.id == segundo))
+    vendas = [
+        _venda('caixa1-1', 0, {'produto_id': primeiro, 'quantidade': 5}),
+        _venda('caixa1-2', 5, {'codigo_barras': codigo_barras, 'quantidade': 2}, {'produto_id': primeiro, 'quantidade': 1}),
+        # Sem estoque: fica registrada e também não é reaplicada
+        _venda('caixa1-3', 10, {'produto_id': segundo, 'quantidade': 1}),
+    ]
+
+    primeira = importar_vendas(farmacia_id, vendas)
+    assert [resultado['status'] for resultado in primeira] == ['registrada', 'registrada', 'sem_estoque']
+    depois_da_primeira = _estado(farmacia_id, [primeiro, segundo], estoque)
+    assert [saldo for saldo, _, _ in depois_da_primeira[0]] == [4, 0]
+
+    reenvio = importar_vendas(farmacia_id, vendas)
+
+    assert [resultado['status'] for resultado in reenvio] == ['duplicada'] * 3
+    assert [resultado['faltas'] for resultado in reenvio] == [resultado['faltas'] for resultado in primeira]
+    assert _estado(farmacia_id, [primeiro, segundo], estoque) == depois_da_primeira
+
+
+def test_vendas_invalidas_nao_barram_as_validas(nova_farmacia, lotes, estoque, monkeypatch):
+    monkeypatch.setitem(app.config, 'VENDAS_LOTE_TRANSACAO', 2)
+    farmacia_id, (produto_id,) = nova_farmacia()
+    lotes(produto_id, [(10, 30)])
+    item = {'produto_id': produto_id, 'quantidade': 1}
+    vendas = [
+        _venda('a', 20, item),
+        {'chave': 'b', 'timestamp': 'ontem', 'itens': [item]},
+        _venda('c', 5, {'codigo_barras': '0000000000000', 'quantidade': 1}),
+        _venda('a', 25, item),
+        _venda('d', 10, {'produto_id': produto_id, 'quantidade': 0}),
+        'não é uma venda',
+        _venda('e', 0, dict(item, quantidade=3)),
+        _venda('f', 15, dict(item, quantidade=4)),
+    ]
+
+    resultados = importar_vendas(farmacia_id, vendas)
+
+    # Um resultado por posição do lote enviado, com o motivo de cada recusa
+    assert [(resultado['chave'], resultado['status'], resultado.get('erro')) for resultado in resultados] == [
+        ('a', 'registrada', None),
+        ('b', 'invalida', 'timestamp inválido (use ISO 8601)'),
+        ('c', 'invalida', 'produto não encontrado: 0000000000000'),
+        ('a', 'invalida', 'chave repetida no lote'),
+        ('d', 'invalida', 'quantidade deve ser um inteiro maior que zero'),
+        (None, 'invalida', 'venda deve ser um objeto'),
+        ('e', 'registrada', None),
+        ('f', 'registrada', None),
+    ]
+    # As válidas, em três blocos, baixadas em ordem de horário: e (3), f (4) e a (1)
+    assert estoque(produto_id) == (2, [2], [('removido', 3), ('removido', 4), ('removido', 1)])
+
+
+def test_falha_em_um_bloco_mantem_os_anteriores_e_o_reenvio_completa(nova_farmacia, lotes, estoque, monkeypatch):
+    monkeypatch.setitem(app.config, 'VENDAS_LOTE_TRANSACAO', 2)
+    monkeypatch.setitem(app.config, 'CHECKOUT_ESPERA_BASE', 0)
+    farmacia_id, (produto_id,) = nova_farmacia()
+    lotes(produto_id, [(10, 30)])
+    vendas = [_venda(f'v{minuto}', minuto, {'produto_id': produto_id, 'quantidade': 1}) for minuto in range(4)]
+    baixar_vendas = importacao_vendas.baixar_vendas
+    blocos = []
+
+    def falhar_no_segundo_bloco(farmacia_id, vendas):
+        blocos.append(len(vendas))
+        if len(blocos) == 2:
+            raise sa.exc.OperationalError('UPDATE validade', {}, Exception('disk I/O error'))
+        return baixar_vendas(farmacia_id, vendas)
+
+    monkeypatch.setattr(importacao_vendas, 'baixar_vendas', falhar_no_segundo_bloco)
+    with pytest.raises(sa.exc.OperationalError):
+        importar_vendas(farmacia_id, vendas)
+
+    # O primeiro bloco já estava gravado; do segundo não ficou nada
+    assert _estado(farmacia_id, [produto_id], estoque) == (
+        [(8, [8], [('removido', 1)] * 2)], [('v0', 'registrada'), ('v1', 'registrada')]
+    )
+
+    monkeypatch.setattr(importacao_vendas, 'baixar_vendas', baixar_vendas)
+    reenvio = importar_vendas(farmacia_id, vendas)
+
+    assert [resultado['status'] for resultado in reenvio] == ['duplicada', 'duplicada', 'registrada', 'registrada']
+    assert estoque(produto_id) == (6, [6], [('removido', 1)] * 4)
@@ -0,0 +1,92 @@
+"""Histórico de movimentação do /relatorio: só da farmácia, paginado por cursor (timestamp, id) e filtrado no SQL."""
+import base64
+from datetime import datetime, timedelta
+import pytest
+import sqlalchemy as sa
+from app import app, db
+from app.busca import indexar_produtos
+from app.cache_relatorios import registrar_alteracao_dados
+from app.models import Produto, ProdutoLog
+from app.paginacao import codificar_cursor, decodificar_cursor
+
+
+@pytest.fixture
+def movimento(nova_farmacia, entrar, monkeypatch):
+    """Farmácia com 7 logs no mesmo instante (empate no timestamp) e 4 de outro produto, 3 por página."""
+    monkeypatch.setitem(app.config, 'LOGS_POR_PAGINA', 3)
+    farmacia_id, (dipirona, paracetamol) = nova_farmacia(2)
+    for produto_id, nome in ((dipirona, 'Dipirona'), (paracetamol, 'Paracetamol')):
+        produto = db.session.get(Produto, produto_id)
+        produto.nome = nome
+        indexar_produtos([produto])
+    instante = datetime.now() - timedelta(hours=1)
+    db.session.add_all(
+        [ProdutoLog(produto_id=dipirona, farmacia_id=farmacia_id, quantidade=quantidade, operacao='removido', timestamp=instante)
+         for quantidade in range(1, 8)]
+        + [ProdutoLog(produto_id=paracetamol, farmacia_id=farmacia_id, quantidade=quantidade, timestamp=instante - timedelta(days=dias),
+                      operacao='adicionado' if dias % 2 else 'removido')
+           for quantidade, dias in ((10, 1), (20, 2), (30, 3), (40, 4))]
+    )
+    db.session.commit()
+    return farmacia_id, entrar(farmacia_id)
+
+
+def test_paginas_nos_dois_sentidos_com_timestamps_iguais(movimento, percorrer_relatorio):
+    _, navegador = movimento
+    total, frente, tras = percorrer_relatorio(navegador)
+    # Mais novos primeiro; no empate, o id maior (o gravado por último) vem antes
+    assert frente == [['7', '6', '5'], ['4', '3', '2'], ['1', '10', '20'], ['30', '40']]
+    assert total == 11
+    assert tras == frente[::-1]
+
+
+@pytest.mark.parametrize('parametros, total, quantidades', [
+    ('?operacao=adicionado', 2, ['10', '30']),
+    ('?produto=paraceta', 4, ['10', '20', '30', '40']),
+    ('?produto=paraceta&operacao=removido', 2, ['20', '40']),
+])
+def test_filtros(movimento, percorrer_relatorio, parametros, total, quantidades):
+    _, navegador = movimento
+    resultado = percorrer_relatorio(navegador, parametros)
+    assert (resultado[0], sum(resultado[1], [])) == (total, quantidades)
+
+
+def test_filtro_por_data_local(movimento, percorrer_relatorio):
+    _, navegador = movimento
+    # Datas do filtro são dias locais (GMT-3), os logs ficam em UTC
+    dia = (datetime.now() - timedelta(hours=1, days=2) - timedelta(hours=3)).date()
+    total, frente, _ = percorrer_relatorio(navegador, f'?log_de={dia}&log_ate={dia}')
+    assert (total, frente) == (1, [['20']])
+
+
+def test_outra_farmacia_nao_aparece(movimento, nova_farmacia, entrar, percorrer_relatorio):
+    outra, (produto_id,) = nova_farmacia()
+    db.session.add(ProdutoLog(produto_id=produto_id, farmacia_id=outra, quantidade=99, operacao='removido', timestamp=datetime.now()))
+    db.session.commit()
+    assert percorrer_relatorio(entrar(outra)) == (1, [['99']], [['99']])
+    _, navegador = movimento
+    assert percorrer_relatorio(navegador)[0] == 11
+
+
+def test_total_fica_no_cache_ate_a_movimentacao(movimento, ler_relatorio):
+    farmacia_id, navegador = movimento
+    assert ler_relatorio(navegador, '/relatorio')[1] == 11
+    produto_id = db.session.scalar(sa.select(ProdutoLog.produto_id).where(ProdutoLog.farmacia_id == farmacia_id).limit(1))
+    db.session.add(ProdutoLog(produto_id=produto_id, farmacia_id=farmacia_id, quantidade=8, operacao='removido', timestamp=datetime.now()))
+    db.session.commit()
+    # A página mostra o log novo; o total só muda quando a versão dos dados muda
+    quantidades, total, _ = ler_relatorio(navegador, '/relatorio')
+    assert (quantidades[0], total) == ('8', 11)
+    registrar_alteracao_dados(farmacia_id)
+    db.session.commit()
+    assert ler_relatorio(navegador, '/relatorio')[1] == 12
+
+
+@pytest.mark.parametrize('cursor', ['', 'lixo', codificar_cursor([1])[:-2], base64.urlsafe_b64encode(b'{"a": 1}').decode()])
+def test_cursor_invalido_volta_para_o_inicio(cursor):
+    assert decodificar_cursor(cursor) is None
+
+
+def test_cursor_preserva_datas():
+    valores = [datetime(2026, 1, 2, 3, 4, 5, 6), 42]
+    assert decodificar_cursor(codificar_cursor(valores)) == valores
@@ -0,0 +1,162 @@
+"""Plano (EXPLAIN QUERY PLAN) de todas as consultas emitidas pelas rotas.
+
+Cada requisição é feita com o SQL capturado; depois, cada SELECT, UPDATE e DELETE é explicado
+com os mesmos parâmetros e o teste falha se alguma tabela for percorrida por inteiro.
+"""
+import io
+import re
+import uuid
+from datetime import datetime, timedelta
+import pytest
+import sqlalchemy as sa
+from app import db
+from app.models import TarefaRelatorio
+
+# Tabelas de cadastro pequenas, lidas por inteiro de propósito
+TABELAS_PEQUENAS = {'alembic_version', 'farmacia', 'fabricante', 'fornecedor'}
+
+HOJE = datetime.now().strftime('%Y-%m-%d')
+VALIDADE = (datetime.now() + timedelta(days=90)).strftime('%Y-%m-%d')
+
+ROTAS = [
+    ('GET', '/index', None),
+    ('GET', '/index?page=2', None),
+    ('GET', '/manage_farmacia', None),
+    ('POST', '/manage_farmacia', {'nome': 'Farmácia Teste', 'cep': '12345-678', 'cnpj': '1' * 14}),
+    ('GET', '/stock', None),
+    ('GET', '/stock?nome=Produto&ordem=quantidade&direcao=desc', None),
+    ('GET', '/stock?ordem=validade_proxima&por_pagina=2', None),
+    ('GET', '/stock?ordem=preco_venda&tipo=Generico&fabricante_id=1', None),
+    ('GET', '/stock?codigo_barras=7890000000001', None),
+    ('GET', '/add_produto', None),
+    ('POST', '/add_produto', {
+        'nome': 'Produto Novo', 'genero': 'Analgésico', 'tipo': 'Generico', 'grupo': 'Geral', 'fabricante_id': 1,
+        'quantidade_embalagem': 10, 'fornecedor_id': 1, 'preco_compra': 1.0, 'preco_venda': 2.0,
+        'codigo_barras': '7890000000999'
+    }),
+    ('GET', '/importar_produtos', None),
+    ('POST', '/importar_produtos', {'arquivo': (io.BytesIO(
+        b'nome;genero;tipo;numeracao_original;grupo;fabricante_id;quantidade_embalagem;fornecedor_id;preco_compra;preco_venda;codigo_barras\n'
+        b'Produto Importado;Analg\xc3\xa9sico;Generico;;Geral;2;10;2;1,00;2,00;7890000000777\n'
+        b'Produto 2;Analg\xc3\xa9sico;Generico;;Geral;1;10;1;1,00;2,00;7890000000002\n'
+    ), 'catalogo.csv')}),
+    ('GET', '/edit_produto/2', None),
+    ('POST', '/edit_produto/2', {
+        'nome': 'Produto 1', 'genero': 'Analgésico', 'tipo': 'Generico', 'grupo': 'Geral', 'fabricante_id': 1,
+        'quantidade_embalagem': 10, 'fornecedor_id': 1, 'preco_compra': 1.0, 'preco_venda': 2.5,
+        'codigo_barras': '7890000000001'
+    }),
+    ('GET', '/edit_validade/2', None),
+    ('POST', '/edit_validade/2', {'quantidade': 8, 'data_validade': VALIDADE}),
+    ('GET', '/add_quantidade/3', None),
+    ('POST', '/add_quantidade/3', {'quantidade': 5, 'data_validade': VALIDADE}),
+    ('GET', '/recebimento', None),
+    ('POST', '/recebimento', {'itens': f'7890000000001;6;{VALIDADE}\n3;4;{VALIDADE}\n7890000000001;2;{VALIDADE}'}),
+    ('POST', '/api/recebimento', {'itens': [{'codigo_barras': '7890000000002', 'quantidade': 3, 'data_validade': VALIDADE}]}),
+    ('GET', '/view_produto/1', None),
+    ('GET', '/vendas', None),
+    ('GET', '/vendas?nome=Produto', None),
+    ('GET', '/vendas?codigo_barras=7890000000002', None),
+    ('POST', '/vendas', {'produto_id': 2, 'quantidade_carrinho': 1}),
+    ('POST', '/vendas', {'produto_id': 2, 'remove_from_cart_action': 1}),
+    ('POST', '/vendas', {'produto_id': 3, 'quantidade_carrinho': 1}),
+    ('POST', '/vendas', {'finalizar_compra_action': 1}),
+    ('GET', '/relatorio', None),
+    ('GET', '/relatorio?periodo=ano&operacao=removido&produto=Produto', None),
+    (
+        'GET', f'/relatorio?data_inicio=2020-01-01&data_fim={HOJE}&log_de=2020-01-01&log_ate={HOJE}'
+        '&cursor=&sentido=anterior', None
+    ),
+    ('GET', '/relatorio/exportar/logs.csv?operacao=adicionado', None),
+    ('GET', '/relatorio/exportar/demanda.csv?periodo=mes', None),
+    ('GET', '/relatorio/rede?periodo=mes', None),
+    ('GET', '/relatorio/rede/exportar.csv?periodo=mes', None),
+    ('GET', '/instrumentacao', None),
+    ('GET', '/relatorio/tarefas/{tarefa}', None),
+    ('GET', '/relatorio/tarefas/{tarefa}/resultado', None),
+    ('GET', '/api/scan/7890000000001', None),
+    ('POST', '/api/scan', {'codigos': ['7890000000001', '7890000000404']}),
+    ('POST', '/api/vendas/lote', {'vendas': [
+        {'chave': 'teste-1', 'timestamp': f'{HOJE}T10:00:00', 'itens': [{'codigo_barras': '7890000000003', 'quantidade': 1}]}
+    ]}),
+    ('GET', '/delete_produto/5', None),
+    ('GET', '/logout', None),
+    ('GET', '/login', None),
+    ('POST', '/login', {'username': 'teste', 'password': 'teste'}),
+    ('GET', '/register', None),
+]
+
+
+@pytest.fixture(scope='module')
+def tarefa(app, cliente):
+    # Com TAREFAS_WORKERS=0 nenhuma tarefa é criada pelas rotas; esta só serve às rotas de consulta
+    with app.app_context():
+        tarefa = TarefaRelatorio(
+            id=uuid.uuid4().hex, farmacia_id=1, tipo='demanda', chave=uuid.uuid4().hex, status='concluida',
+            progresso=100, resultado='[]', criada_em=datetime.now(), concluida_em=datetime.now(),
+            parametros='{"data_inicio": "2020-01-01T00:00:00", "data_fim": "2020-01-31T00:00:00"}'
+        )
+        db.session.add(tarefa)
+        db.session.commit()
+        return tarefa.id
+
+
+def _capturar(app, cliente, metodo, url, dados):
+    comandos = []
+
+    def registrar(conexao, cursor, comando, parametros, contexto, executemany):
+        if not executemany:
+            comandos.append((comando, parametros))
+
+    with app.app_context():
+        motor = db.engine
+        # Inclui o engine de leitura (app.roteamento), usado pelas telas de consulta
+        engines = list(db.engines.values())
+    for engine in engines:
+        sa.event.listen(engine, 'before_cursor_execute', registrar)
+    try:
+        if metodo == 'GET':
+            resposta = cliente.get(url)
+            resposta.get_data()  # Consome as respostas em streaming (exportações CSV)
+        elif url.startswith('/api/'):
+            resposta = cliente.post(url, json=dados)
+        else:
+            resposta = cliente.post(url, data=dados)
+    finally:
+        for engine in engines:
+            sa.event.remove(engine, 'before_cursor_execute', registrar)
+    assert resposta.status_code < 400, (url, resposta.status_code)
+    return motor, comandos
+
+
+def _varreduras(conexao, comando, parametros):
+    # Linhas do plano que percorrem uma tabela inteira, sem busca por índice
+    plano = conexao.exec_driver_sql('EXPLAIN QUERY PLAN ' + comando, parametros).all()
+    varreduras = []
+    for *_, detalhe in plano:
+        encontrado = re.match(r'SCAN (\w+)', detalhe)
+        if not encontrado or 'VIRTUAL TABLE' in detalhe:
+            continue
+        tabela = encontrado.group(1)
+        if tabela in TABELAS_PEQUENAS:
+            continue
+        # Subconsultas e CTEs materializadas aparecem como SCAN do próprio nome; só tabelas reais contam
+        if not conexao.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (tabela,)
+        ).first():
+            continue
+        varreduras.append(detalhe)
+    return varreduras
+
+
+@pytest.mark.parametrize('metodo, url, dados', ROTAS, ids=[f'{metodo} {url}' for metodo, url, _ in ROTAS])
+def test_consultas_da_rota_usam_indices(app, cliente, tarefa, metodo, url, dados):
+    motor, comandos = _capturar(app, cliente, metodo, url.format(tarefa=tarefa), dados)
+    problemas = []
+    with motor.connect() as conexao:
+        for comando, parametros in comandos:
+            if not re.match(r'\s*(SELECT|UPDATE|DELETE|WITH)\b', comando, re.IGNORECASE):
+                continue
+            for detalhe in _varreduras(conexao, comando, parametros):
+                problemas.append(f'{detalhe}\n    em: {" ".join(comando.split())[:300]}')
+    assert not problemas, 'Consultas com varredura completa:\n' + '\n'.join(problemas)
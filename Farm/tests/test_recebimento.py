@@ -0,0 +1,113 @@
+"""Recebimento de nota de fornecedor (app.recebimento): todos os lotes numa transação, ou nenhum."""
+from datetime import date, timedelta
+import pytest
+import sqlalchemy as sa
+from app import app, db
+from app.models import Estoque, Produto, ProdutoLog, Validade
+from app.roteamento import SessaoRoteada
+
+
+@pytest.fixture
+def nota(nova_farmacia, entrar):
+    """Farmácia com dois produtos sem estoque: ([produto_id], [codigo_barras], cliente logado)."""
+    farmacia_id, produto_ids = nova_farmacia(2)
+    codigos = [db.session.get(Produto, produto_id).codigo_barras for produto_id in produto_ids]
+    return produto_ids, codigos, entrar(farmacia_id)
+
+
+def _dias(dias):
+    return date.today() + timedelta(days=dias)
+
+
+def _saldo(produto_id):
+    estoque = db.session.scalar(sa.select(Estoque).where(Estoque.produto_id == produto_id))
+    db.session.refresh(estoque)
+    return estoque.quantidade, estoque.validade_proxima and estoque.validade_proxima.date()
+
+
+def _lotes(produto_ids):
+    return db.session.scalar(sa.select(sa.func.count()).select_from(Validade).where(Validade.produto_id.in_(produto_ids)))
+
+
+def test_nota_inteira_numa_transacao(nota):
+    (primeiro, segundo), (codigo, _), navegador = nota
+    commits = []
+
+    def registrar(sessao):
+        commits.append(sessao)
+    sa.event.listen(SessaoRoteada, 'after_commit', registrar)
+    try:
+        resposta = navegador.post('/api/recebimento', json={'itens': [
+            {'codigo_barras': codigo, 'quantidade': 10, 'data_validade': _dias(90).isoformat()},
+            {'produto_id': segundo, 'quantidade': 6, 'data_validade': _dias(40).strftime('%d/%m/%Y')},
+            # Segundo lote do mesmo produto, na mesma nota
+            {'codigo_barras': codigo, 'quantidade': 5, 'data_validade': _dias(30).isoformat()},
+        ]})
+    finally:
+        sa.event.remove(SessaoRoteada, 'after_commit', registrar)
+
+    assert resposta.status_code == 200
+    dados = resposta.get_json()
+    assert dados['aplicada']
+    assert [(resultado['linha'], resultado['status'], resultado['produto_id']) for resultado in dados['resultados']] == [
+        (1, 'recebido', primeiro), (2, 'recebido', segundo), (3, 'recebido', primeiro)
+    ]
+    assert _saldo(primeiro) == (15, _dias(30))
+    assert _saldo(segundo) == (6, _dias(40))
+    assert db.session.scalars(
+        sa.select(ProdutoLog.quantidade).where(ProdutoLog.produto_id.in_([primeiro, segundo])).order_by(ProdutoLog.id)
+    ).all() == [10, 6, 5]
+    # Os lotes, os saldos e os logs da nota entram num só commit
+    assert len(commits) == 1
+
+
+def test_linha_invalida_recusa_a_nota_inteira(nota, nova_farmacia):
+    (primeiro, segundo), (codigo, _), navegador = nota
+    _, (de_outra_farmacia,) = nova_farmacia()
+    minima = _dias(app.config['VALIDADE_MINIMA_DIAS'])
+    resposta = navegador.post('/api/recebimento', json={'itens': [
+        {'codigo_barras': codigo, 'quantidade': 10, 'data_validade': minima.isoformat()},
+        {'produto_id': segundo, 'quantidade': 3, 'data_validade': (minima - timedelta(days=1)).isoformat()},
+        {'produto_id': de_outra_farmacia, 'quantidade': 3, 'data_validade': _dias(60).isoformat()},
+        {'codigo_barras': '0000000000000', 'quantidade': 3, 'data_validade': _dias(60).isoformat()},
+        {'produto_id': primeiro, 'quantidade': 0, 'data_validade': _dias(60).isoformat()},
+        {'produto_id': primeiro, 'quantidade': 2, 'data_validade': '31-12-2030'},
+    ]})
+
+    assert resposta.status_code == 422
+    dados = resposta.get_json()
+    assert not dados['aplicada']
+    assert [resultado['status'] for resultado in dados['resultados']] == ['valido'] + ['invalido'] * 5
+    erros = [resultado.get('erro', '') for resultado in dados['resultados']]
+    assert 'abaixo do mínimo' in erros[1]
+    assert 'não pertence ao estoque da farmácia' in erros[2]
+    assert 'produto não encontrado' in erros[3]
+    assert 'quantidade' in erros[4]
+    assert 'data_validade inválida' in erros[5]
+    # Nem a linha válida foi gravada
+    assert _lotes([primeiro, segundo]) == 0
+    assert _saldo(primeiro) == (0, None)
+
+
+def test_nota_digitada_na_tela(nota):
+    (primeiro, segundo), (codigo, _), navegador = nota
+    texto = f'{codigo};4;{_dias(50):%d/%m/%Y}\n\n{segundo}\t7\t{_dias(70).isoformat()}\n'
+    resposta = navegador.post('/recebimento', data={'itens': texto})
+    assert resposta.status_code == 302
+    assert _saldo(primeiro) == (4, _dias(50))
+    assert _saldo(segundo) == (7, _dias(70))
+
+    # Com erro, a tela mostra o resultado de cada linha e nada é gravado
+    texto = f'{codigo};4;{_dias(50):%d/%m/%Y}\n{codigo};x;{_dias(50):%d/%m/%Y}\n'
+    pagina = navegador.post('/recebimento', data={'itens': texto}).get_data(as_text=True)
+    assert 'Nenhum lote foi gravado' in pagina
+    assert _saldo(primeiro) == (4, _dias(50))
+
+
+def test_limite_de_itens(nota, monkeypatch):
+    _, (codigo, _), navegador = nota
+    monkeypatch.setitem(app.config, 'RECEBIMENTO_ITENS_MAXIMO', 2)
+    item = {'codigo_barras': codigo, 'quantidade': 1, 'data_validade': _dias(60).isoformat()}
+    assert navegador.post('/api/recebimento', json={'itens': [item] * 3}).status_code == 400
+    assert navegador.post('/api/recebimento', json={'itens': []}).status_code == 400
+    assert navegador.post('/api/recebimento', json={'itens': [item] * 2}).status_code == 200
@@ -0,0 +1,83 @@
+"""Relatório consolidado da rede (app.rede): uma tarefa por farmácia, totais por loja e da rede."""
+from datetime import datetime
+import pytest
+from app import db
+from app.cache_relatorios import registrar_alteracao_dados
+from app.demanda import calcular_demandas
+from app.rede import CAMPOS_SOMADOS, linhas_rede, relatorio_rede, versao_rede
+from app.resumo import registrar_logs
+
+INICIO = datetime(2026, 2, 1)
+FIM = datetime(2026, 2, 28, 23, 59, 59)
+AGORA = datetime(2026, 2, 28, 12)
+
+
+@pytest.fixture
+def duas_lojas(nova_farmacia, lotes):
+    """Duas farmácias com vendas em fevereiro/2026 em quantidades diferentes."""
+    lojas = []
+    for fator in (1, 3):
+        farmacia_id, produto_ids = nova_farmacia(2)
+        for produto_id in produto_ids:
+            lotes(produto_id, [(4 * fator, 60)])
+            registrar_logs(farmacia_id, [
+                {'produto_id': produto_id, 'operacao': 'removido', 'quantidade': fator * dia, 'timestamp': datetime(2026, 2, dia, 15)}
+                for dia in (2, 5, 9)
+            ])
+        db.session.commit()
+        lojas.append(farmacia_id)
+    return lojas
+
+
+def _lojas(relatorio, farmacia_ids):
+    return {loja['farmacia_id']: loja for loja in relatorio['lojas'] if loja['farmacia_id'] in farmacia_ids}
+
+
+def test_cada_loja_igual_ao_relatorio_dela_e_totais_somados(duas_lojas):
+    relatorio = relatorio_rede(INICIO, FIM, AGORA, processos=1)
+    lojas = _lojas(relatorio, duas_lojas)
+    assert set(lojas) == set(duas_lojas)
+    for farmacia_id, loja in lojas.items():
+        esperado = calcular_demandas(farmacia_id, INICIO, FIM, AGORA)
+        assert [item['produto_id'] for item in loja['itens']] == [item['produto_id'] for item in esperado]
+        assert [item['demanda_media_diaria'] for item in loja['itens']] == [item['demanda_media_diaria'] for item in esperado]
+        for item in loja['itens']:
+            assert item['valor_a_pedir'] == round(item['quantidade_a_pedir'] * item['preco_venda'], 2)
+        assert loja['totais']['produtos'] == 2
+        assert loja['totais']['estoque_atual'] == sum(item['estoque_atual'] for item in loja['itens'])
+    # A segunda loja vende o triplo por dia
+    primeira, segunda = (lojas[farmacia_id]['totais'] for farmacia_id in duas_lojas)
+    assert segunda['demanda_media_diaria'] == pytest.approx(3 * primeira['demanda_media_diaria'])
+    # Totais da rede = soma das lojas (todas as farmácias do banco)
+    for campo in CAMPOS_SOMADOS:
+        assert relatorio['totais'][campo] == pytest.approx(sum(loja['totais'][campo] for loja in relatorio['lojas']))
+
+
+def test_pool_de_processos_da_o_mesmo_resultado(duas_lojas):
+    sequencial = relatorio_rede(INICIO, FIM, AGORA, processos=1)
+    paralelo = relatorio_rede(INICIO, FIM, AGORA, processos=2)
+    assert paralelo == sequencial
+
+
+def test_tabela_consolidada(duas_lojas):
+    relatorio = relatorio_rede(INICIO, FIM, AGORA, processos=1)
+    linhas = list(linhas_rede(relatorio))
+    por_loja = sum(len(loja['itens']) + 1 for loja in relatorio['lojas'])
+    assert len(linhas) == por_loja + 1
+    assert linhas[-1][:2] == ('Rede', 'Total da rede')
+    assert linhas[-1][6] == relatorio['totais']['quantidade_a_pedir']
+    subtotais = [linha for linha in linhas if linha[1] == 'Total da loja']
+    assert [linha[0] for linha in subtotais] == [loja['nome'] for loja in relatorio['lojas']]
+
+
+def test_versao_da_rede_muda_com_a_movimentacao_de_qualquer_loja(duas_lojas):
+    antes = versao_rede()
+    registrar_alteracao_dados(duas_lojas[1])
+    db.session.commit()
+    assert versao_rede() == antes + 1
+
+
+def test_relatorio_da_rede_so_para_administrador(duas_lojas, entrar):
+    navegador = entrar(duas_lojas[0])
+    assert navegador.get('/relatorio/rede').status_code == 403
+    assert navegador.get('/relatorio/rede/exportar.csv').status_code == 403
@@ -0,0 +1,94 @@
+"""Resumo diário (app.resumo) mantido a cada log, comparado com o recálculo a partir de ProdutoLog."""
+import random
+from datetime import datetime, timedelta, timezone
+import pytest
+import sqlalchemy as sa
+from app import db
+from app.checkout import finalizar_venda
+from app.models import Estoque, ProdutoLog, ResumoDiario
+from app.resumo import registrar_logs
+
+
+def _variacao(operacao, quantidade):
+    return {'adicionado': abs(quantidade), 'removido': -abs(quantidade)}.get(operacao, 0)
+
+
+def _recalculado(farmacia_id, estoque):
+    # Agrupa os logs por produto e dia GMT-3; o saldo do dia é o atual menos a variação dos dias seguintes
+    linhas = {}
+    for produto_id, operacao, quantidade, timestamp in db.session.execute(
+        sa.select(ProdutoLog.produto_id, ProdutoLog.operacao, ProdutoLog.quantidade, ProdutoLog.timestamp)
+        .where(ProdutoLog.farmacia_id == farmacia_id)
+    ):
+        linha = linhas.setdefault((produto_id, (timestamp - timedelta(hours=3)).date()), {
+            'adicionado': 0, 'removido': 0, 'saidas': 0, 'edicoes': 0, 'variacao': 0
+        })
+        if operacao == 'adicionado':
+            linha['adicionado'] += quantidade
+        elif operacao == 'removido':
+            linha['removido'] += quantidade
+            linha['saidas'] += 1
+        elif operacao == 'editado':
+            linha['edicoes'] += 1
+        linha['variacao'] += _variacao(operacao, quantidade)
+    saldos = {produto_id: estoque(produto_id)[0] for produto_id, _ in linhas}
+    for (produto_id, dia), linha in sorted(linhas.items(), reverse=True):
+        linha['saldo_final'] = saldos[produto_id]
+        saldos[produto_id] -= linha['variacao']
+    return linhas
+
+
+def _gravado(farmacia_id):
+    campos = ['adicionado', 'removido', 'saidas', 'edicoes', 'variacao', 'saldo_final']
+    return {
+        (resumo.produto_id, resumo.dia): {campo: getattr(resumo, campo) for campo in campos}
+        for resumo in db.session.scalars(sa.select(ResumoDiario).where(ResumoDiario.farmacia_id == farmacia_id))
+    }
+
+
+@pytest.mark.parametrize('semente', [1, 2, 3])
+def test_resumo_igual_ao_recalculo_com_movimentos_retroativos(nova_farmacia, estoque, semente):
+    farmacia_id, produto_ids = nova_farmacia(3)
+    sorteio = random.Random(semente)
+    saldos = dict.fromkeys(produto_ids, 0)
+    inicio = datetime(2026, 2, 1)
+    for _ in range(25):
+        # Cada escrita grava alguns logs com horários sorteados em fevereiro: vendas offline e
+        # edições retroativas caem antes de dias já resumidos; perto da meia-noite UTC o dia local é o anterior
+        logs = []
+        for _ in range(sorteio.randint(1, 4)):
+            produto_id = sorteio.choice(produto_ids)
+            operacao = sorteio.choice(['adicionado', 'adicionado', 'removido', 'removido', 'editado'])
+            # Edições gravam o saldo e não o alteram; o saldo pode ficar negativo, o resumo não confere
+            quantidade = saldos[produto_id] if operacao == 'editado' else sorteio.randint(1, 20)
+            logs.append({
+                'produto_id': produto_id, 'operacao': operacao, 'quantidade': quantidade,
+                'timestamp': inicio + timedelta(days=sorteio.randint(0, 27), hours=sorteio.choice([1, 2, 12, 15, 23]))
+            })
+        # Como em produção, o saldo do Estoque já inclui a escrita quando os logs são registrados
+        for log in logs:
+            saldos[log['produto_id']] += _variacao(log['operacao'], log['quantidade'])
+        for produto_id, saldo in saldos.items():
+            db.session.execute(sa.update(Estoque).where(Estoque.produto_id == produto_id).values(quantidade=saldo))
+        registrar_logs(farmacia_id, logs)
+        db.session.commit()
+
+    recalculado = _recalculado(farmacia_id, estoque)
+    assert recalculado
+    assert _gravado(farmacia_id) == recalculado
+
+
+def test_venda_no_caixa_entra_no_resumo_do_dia(nova_farmacia, lotes, estoque):
+    farmacia_id, (vendido, parado) = nova_farmacia(2)
+    lotes(vendido, [(5, 10), (7, 30)])
+    lotes(parado, [(4, 10)])
+
+    finalizar_venda(farmacia_id, {vendido: 6})
+    finalizar_venda(farmacia_id, {vendido: 2})
+
+    # Uma linha só, a do produto vendido no dia de hoje (GMT-3); o parado não tem movimento
+    hoje = (datetime.now(timezone.utc) - timedelta(hours=3)).date()
+    assert _gravado(farmacia_id) == {(vendido, hoje): {
+        'adicionado': 0, 'removido': 8, 'saidas': 2, 'edicoes': 0, 'variacao': -8, 'saldo_final': 4
+    }}
+    assert _gravado(farmacia_id) == _recalculado(farmacia_id, estoque)
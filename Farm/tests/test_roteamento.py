@@ -0,0 +1,62 @@
+"""Roteamento das leituras (app.roteamento): as telas de consulta leem do engine de leitura e
+as escritas curtas delas (troca dos alertas, tarefa de relatório) ficam no primário."""
+from contextlib import contextmanager
+from types import SimpleNamespace
+import pytest
+import sqlalchemy as sa
+from app import app, db
+from app.alertas import invalidar_alertas
+from app.models import TarefaRelatorio
+from app.roteamento import BIND_LEITURA
+
+
+@contextmanager
+def comandos():
+    """Lista de (engine, comando SQL) executados dentro do bloco: 'primario' ou 'leitura'."""
+    executados = []
+    ouvintes = []
+    for nome, engine in ((BIND_LEITURA, db.engines[BIND_LEITURA]), ('primario', db.engine)):
+        def registrar(conexao, cursor, comando, parametros, contexto, executemany, nome=nome):
+            executados.append((nome, comando.lstrip().split()[0].upper()))
+        sa.event.listen(engine, 'before_cursor_execute', registrar)
+        ouvintes.append((engine, registrar))
+    try:
+        yield executados
+    finally:
+        for engine, registrar in ouvintes:
+            sa.event.remove(engine, 'before_cursor_execute', registrar)
+
+
+def test_index_calcula_na_leitura_e_troca_os_alertas_no_primario(nova_farmacia, entrar):
+    farmacia_id, _ = nova_farmacia(produtos=2)
+    invalidar_alertas(farmacia_id)
+    db.session.commit()
+    navegador = entrar(farmacia_id)
+
+    with comandos() as executados:
+        resposta = navegador.get('/index')
+
+    assert resposta.status_code == 200
+    # Os dois produtos estão com estoque zerado
+    assert resposta.get_data(as_text=True).count('está com estoque zerado') == 2
+    assert ('leitura', 'SELECT') in executados
+    escritas = [(engine, comando) for engine, comando in executados if comando in ('UPDATE', 'DELETE', 'INSERT')]
+    assert {comando for _, comando in escritas} == {'UPDATE', 'DELETE', 'INSERT'}
+    assert {engine for engine, _ in escritas} == {'primario'}
+
+
+def test_relatorio_longo_enfileira_a_tarefa_no_primario(nova_farmacia, entrar, monkeypatch):
+    monkeypatch.setitem(app.config, 'TAREFAS_WORKERS', 1)
+    monkeypatch.setattr('app.tarefas._executor', lambda: SimpleNamespace(submit=lambda *args: None))
+    farmacia_id, _ = nova_farmacia()
+    navegador = entrar(farmacia_id)
+
+    with comandos() as executados:
+        resposta = navegador.get('/relatorio?periodo=ano')
+
+    assert resposta.status_code == 200
+    assert ('leitura', 'SELECT') in executados
+    assert ('primario', 'INSERT') in executados
+    assert not [comando for engine, comando in executados if engine == 'leitura' and comando != 'SELECT']
+    tarefa = db.session.scalar(sa.select(TarefaRelatorio).where(TarefaRelatorio.farmacia_id == farmacia_id))
+    assert (tarefa.tipo, tarefa.status) == ('demanda', 'pendente')
@@ -0,0 +1,51 @@
+"""Saldo e validade próxima mantidos em Estoque (app.saldos) a cada escrita de lote."""
+from datetime import date, datetime, timedelta
+import sqlalchemy as sa
+from app import app, db
+from app.models import Estoque, Validade
+
+
+def _estoque(produto_id):
+    estoque = db.session.scalar(sa.select(Estoque).where(Estoque.produto_id == produto_id))
+    db.session.refresh(estoque)
+    return estoque.quantidade, estoque.validade_proxima
+
+
+def test_views_de_lote_gravam_saldo_e_validade_proxima(nova_farmacia, entrar):
+    farmacia_id, (produto_id,) = nova_farmacia()
+    navegador = entrar(farmacia_id)
+    perto, longe = date.today() + timedelta(days=30), date.today() + timedelta(days=90)
+
+    for quantidade, validade in ((5, longe), (3, perto)):
+        navegador.post(f'/add_quantidade/{produto_id}', data={'quantidade': quantidade, 'data_validade': validade.isoformat()})
+    assert _estoque(produto_id) == (8, datetime.combine(perto, datetime.min.time()))
+
+    # O lote mais próximo passa a vencer depois do outro: a validade próxima acompanha
+    lote = db.session.scalar(sa.select(Validade.id).where(Validade.produto_id == produto_id, Validade.quantidade == 3))
+    mais_longe = longe + timedelta(days=30)
+    navegador.post(f'/edit_validade/{lote}', data={'quantidade': 1, 'data_validade': mais_longe.isoformat()})
+    assert _estoque(produto_id) == (6, datetime.combine(longe, datetime.min.time()))
+
+    # Validade abaixo do mínimo é recusada e não mexe no saldo
+    navegador.post(f'/add_quantidade/{produto_id}', data={'quantidade': 50, 'data_validade': date.today().isoformat()})
+    assert _estoque(produto_id)[0] == 6
+
+
+def test_reconciliar_acha_e_corrige_divergencias(nova_farmacia, lotes):
+    farmacia_id, (produto_id,) = nova_farmacia()
+    lotes(produto_id, [(4, 60), (6, 20)])
+    estoque_id = db.session.scalar(sa.select(Estoque.id).where(Estoque.produto_id == produto_id))
+    db.session.execute(sa.update(Estoque).where(Estoque.id == estoque_id).values(quantidade=99, validade_proxima=None))
+    db.session.commit()
+    executor = app.test_cli_runner()
+
+    saida = executor.invoke(args=['saldos', 'reconciliar']).output
+    assert f'Estoque {estoque_id} (produto {produto_id}): quantidade 99 / lotes 10' in saida
+    assert 'Use --corrigir' in saida
+    assert _estoque(produto_id)[0] == 99
+
+    assert 'corrigido(s)' in executor.invoke(args=['saldos', 'reconciliar', '--corrigir']).output
+    quantidade, validade_proxima = _estoque(produto_id)
+    assert quantidade == 10
+    assert validade_proxima.date() == date.today() + timedelta(days=20)
+    assert executor.invoke(args=['saldos', 'reconciliar']).output.strip() == 'Nenhuma divergência encontrada.'
@@ -0,0 +1,82 @@
+"""Listagem do estoque (/stock): ordenação e paginação por cursor avaliadas no SQL."""
+import html
+import re
+import pytest
+import sqlalchemy as sa
+from app import db
+from app.models import Estoque, Produto
+
+QUANTIDADES = [[(3, 40)], [], [(1, 10), (2, 90)], [(7, 25)], [(1, 10)], [], [(5, 60)]]
+PRECOS = [2.0, 5.0, 2.0, 9.5, 1.0, 5.0, 3.0]
+
+
+@pytest.fixture
+def catalogo(nova_farmacia, entrar, lotes):
+    """Farmácia com 7 produtos, com empates de quantidade, preço e validade e produtos sem lote."""
+    farmacia_id, produto_ids = nova_farmacia(len(QUANTIDADES))
+    for produto_id, produto_lotes, preco in zip(produto_ids, QUANTIDADES, PRECOS):
+        db.session.execute(sa.update(Produto).where(Produto.id == produto_id).values(preco_venda=preco))
+        if produto_lotes:
+            lotes(produto_id, produto_lotes)
+    db.session.commit()
+    return farmacia_id, entrar(farmacia_id)
+
+
+def _ordem_esperada(farmacia_id, ordem, decrescente):
+    estoques = db.session.scalars(sa.select(Estoque).where(Estoque.farmacia_id == farmacia_id)).all()
+    for estoque in estoques:
+        db.session.refresh(estoque)
+    chaves = {
+        'nome': lambda estoque: estoque.produto.nome,
+        'quantidade': lambda estoque: estoque.quantidade,
+        'preco_venda': lambda estoque: estoque.produto.preco_venda,
+        # Produtos sem lote vão para o fim da ordem crescente
+        'validade_proxima': lambda estoque: (estoque.validade_proxima is None, estoque.validade_proxima or 0),
+    }
+    estoques.sort(key=lambda estoque: (chaves[ordem](estoque), estoque.id), reverse=decrescente)
+    return [estoque.produto.codigo_barras for estoque in estoques]
+
+
+def _pagina(navegador, url):
+    texto = navegador.get(url).get_data(as_text=True)
+    codigos = re.findall(r'<td>(\d{13})</td>', texto)
+    links = {
+        rotulo: html.unescape(href)
+        for href, rotulo in re.findall(r'<a class="page-link" href="([^"]*)">(Anterior|Próximo)</a>', texto)
+        if href != '#'
+    }
+    return codigos, links
+
+
+@pytest.mark.parametrize('ordem', ['nome', 'quantidade', 'preco_venda', 'validade_proxima'])
+@pytest.mark.parametrize('direcao', ['asc', 'desc'])
+def test_paginas_seguem_a_ordem_nos_dois_sentidos(catalogo, ordem, direcao):
+    farmacia_id, navegador = catalogo
+    esperado = _ordem_esperada(farmacia_id, ordem, direcao == 'desc')
+
+    paginas = []
+    codigos, links = _pagina(navegador, f'/stock?ordem={ordem}&direcao={direcao}&por_pagina=3')
+    paginas.append(codigos)
+    while 'Próximo' in links:
+        codigos, links = _pagina(navegador, links['Próximo'])
+        paginas.append(codigos)
+    assert [len(pagina) for pagina in paginas] == [3, 3, 1]
+    assert sum(paginas, []) == esperado
+
+    # Voltando pelos links "Anterior" as mesmas páginas aparecem, na mesma ordem
+    volta = []
+    while 'Anterior' in links:
+        codigos, links = _pagina(navegador, links['Anterior'])
+        volta.insert(0, codigos)
+    assert volta == paginas[:-1]
+
+
+def test_por_pagina_limitado_e_cursor_invalido(catalogo, monkeypatch):
+    farmacia_id, navegador = catalogo
+    esperado = _ordem_esperada(farmacia_id, 'nome', False)
+    # Cursor adulterado volta para a primeira página
+    assert _pagina(navegador, '/stock?por_pagina=2&cursor=nao-e-um-cursor')[0] == esperado[:2]
+    # por_pagina fora do intervalo é limitado a [1, ESTOQUE_POR_PAGINA_MAXIMO]
+    assert _pagina(navegador, '/stock?por_pagina=0')[0] == esperado[:1]
+    monkeypatch.setitem(navegador.application.config, 'ESTOQUE_POR_PAGINA_MAXIMO', 4)
+    assert _pagina(navegador, '/stock?por_pagina=500')[0] == esperado[:4]
@@ -0,0 +1,138 @@
+"""Tarefas de relatório em segundo plano (app.tarefas): execução, reaproveitamento, erro e abandono."""
+import json
+import uuid
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+import pytest
+import sqlalchemy as sa
+from app import app, db
+from app import tarefas
+from app.cache_relatorios import registrar_alteracao_dados
+from app.demanda import calcular_demandas
+from app.models import Farmacia, TarefaRelatorio
+from app.resumo import registrar_logs
+from app.tarefas import _atualizar, chave_tarefa, enfileirar
+
+IDENTIFICACAO = {'periodo': 'ano'}
+
+
+@pytest.fixture
+def executando(nova_farmacia, monkeypatch):
+    """Farmácia com uma tarefa 'executando' criada há uma hora, com o último batimento `ha` atrás."""
+    monkeypatch.setitem(app.config, 'TAREFAS_LIMITE_SEGUNDOS', 60)
+    # Nada é executado de verdade: só interessa se a tarefa é reagendada
+    monkeypatch.setattr('app.tarefas._executor', lambda: SimpleNamespace(submit=lambda *args: None))
+
+    def criar(ha):
+        farmacia_id, _ = nova_farmacia()
+        farmacia = db.session.get(Farmacia, farmacia_id)
+        agora = datetime.now(timezone.utc).replace(tzinfo=None)
+        tarefa = TarefaRelatorio(
+            id=uuid.uuid4().hex, farmacia_id=farmacia_id, tipo='demanda', chave=chave_tarefa(farmacia, 'demanda', IDENTIFICACAO),
+            parametros='{}', status='executando', progresso=20, criada_em=agora - timedelta(hours=1), atualizada_em=agora - ha
+        )
+        db.session.add(tarefa)
+        db.session.commit()
+        return farmacia, tarefa.id
+    return criar
+
+
+def test_tarefa_longa_com_batimento_nao_e_duplicada(executando):
+    farmacia, tarefa_id = executando(timedelta(hours=1))
+    _atualizar(tarefa_id, progresso=60)
+
+    tarefa = enfileirar(farmacia, 'demanda', {}, IDENTIFICACAO)
+    assert tarefa.id == tarefa_id
+    assert tarefa.status == 'executando'
+    assert tarefa.progresso == 60
+
+
+def test_tarefa_sem_batimento_e_reagendada(executando):
+    farmacia, tarefa_id = executando(timedelta(minutes=2))
+
+    tarefa = enfileirar(farmacia, 'demanda', {}, IDENTIFICACAO)
+    assert (tarefa.id, tarefa.status) == (tarefa_id, 'pendente')
+    assert db.session.scalar(
+        sa.select(sa.func.count()).select_from(TarefaRelatorio).where(TarefaRelatorio.farmacia_id == farmacia.id)
+    ) == 1
+
+
+@pytest.fixture
+def sincrono(nova_farmacia, entrar, lotes, monkeypatch):
+    """Relatórios longos em tarefa, executada na hora; farmácia com vendas no último mês e o cliente dela."""
+    monkeypatch.setitem(app.config, 'TAREFAS_WORKERS', 1)
+    monkeypatch.setitem(app.config, 'RELATORIO_DIAS_SEGUNDO_PLANO', 30)
+    executadas = []
+
+    def submeter(funcao, tarefa_id):
+        executadas.append(tarefa_id)
+        funcao(tarefa_id)
+    monkeypatch.setattr('app.tarefas._executor', lambda: SimpleNamespace(submit=submeter))
+    farmacia_id, (produto_id,) = nova_farmacia()
+    lotes(produto_id, [(20, 60)])
+    ontem = datetime.now() - timedelta(days=1)
+    registrar_logs(farmacia_id, [{'produto_id': produto_id, 'operacao': 'removido', 'quantidade': 6, 'timestamp': ontem}])
+    db.session.commit()
+    return farmacia_id, entrar(farmacia_id), executadas
+
+
+def _tarefas(farmacia_id):
+    # O teste divide a sessão com as requisições: a linha é relida, gravada pela execução em outra sessão
+    return db.session.scalars(
+        sa.select(TarefaRelatorio).where(TarefaRelatorio.farmacia_id == farmacia_id).order_by(TarefaRelatorio.criada_em)
+        .execution_options(populate_existing=True)
+    ).all()
+
+
+def test_relatorio_longo_sai_da_tarefa_e_ela_e_reaproveitada(sincrono):
+    farmacia_id, navegador, executadas = sincrono
+    pagina = navegador.get('/relatorio?periodo=ano').get_data(as_text=True)
+
+    (tarefa,) = _tarefas(farmacia_id)
+    assert (tarefa.tipo, tarefa.status, tarefa.progresso, executadas) == ('demanda', 'concluida', 100, [tarefa.id])
+    parametros = json.loads(tarefa.parametros)
+    esperado = calcular_demandas(farmacia_id, *(datetime.fromisoformat(parametros[campo]) for campo in ('data_inicio', 'data_fim', 'now')))
+    assert json.loads(tarefa.resultado) == json.loads(json.dumps(esperado))
+    assert 'Isolado 0' in pagina
+    situacao = navegador.get(f'/relatorio/tarefas/{tarefa.id}').get_json()
+    assert (situacao['status'], situacao['progresso']) == ('concluida', 100)
+
+    # Mesma tela de novo (e a exportação): a tarefa concluída é reaproveitada
+    navegador.get('/relatorio?periodo=ano')
+    assert navegador.get('/relatorio/exportar/demanda.csv?periodo=ano').status_code == 200
+    assert executadas == [tarefa.id]
+
+    # Movimentação nova muda a chave: outra tarefa
+    registrar_alteracao_dados(farmacia_id)
+    db.session.commit()
+    navegador.get('/relatorio?periodo=ano')
+    assert len(executadas) == 2 and len(_tarefas(farmacia_id)) == 2
+
+
+def test_tarefa_com_erro_registra_e_e_reagendada(sincrono, monkeypatch):
+    farmacia_id, navegador, executadas = sincrono
+
+    def falhar(farmacia_id, parametros, progresso):
+        progresso(40)
+        raise ValueError('falha no cálculo')
+    with monkeypatch.context() as falhando:
+        falhando.setitem(tarefas.TIPOS, 'demanda', falhar)
+        assert navegador.get('/relatorio?periodo=ano').status_code == 200
+    (tarefa,) = _tarefas(farmacia_id)
+    assert (tarefa.status, tarefa.progresso, tarefa.erro) == ('erro', 40, 'falha no cálculo')
+    assert tarefa.concluida_em is not None
+
+    # A próxima visita reaproveita a linha e agenda de novo
+    navegador.get('/relatorio?periodo=ano')
+    (novamente,) = _tarefas(farmacia_id)
+    assert (novamente.id, novamente.status, novamente.erro) == (tarefa.id, 'concluida', None)
+    assert executadas == [tarefa.id, tarefa.id]
+
+
+def test_tarefa_de_outra_farmacia_nao_e_visivel(sincrono, nova_farmacia, entrar):
+    farmacia_id, navegador, _ = sincrono
+    navegador.get('/relatorio?periodo=ano')
+    (tarefa,) = _tarefas(farmacia_id)
+    outra, _ = nova_farmacia(0)
+    assert entrar(outra).get(f'/relatorio/tarefas/{tarefa.id}').status_code == 404
+    assert entrar(outra).get(f'/relatorio/tarefas/{tarefa.id}/resultado').status_code == 404